@@ -1,63 +1,144 @@
-import yfinance as yf
+import copy
+
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 from sklearn.metrics import classification_report, f1_score
 import matplotlib.pyplot as plt
 
-from sklearn.impute import SimpleImputer
+from detectors import IsolationForestDetector, make_detector
+from features import DEFAULT_CONFIG, compute_features, feature_names
+from fingerprint import default_seed, derive_seed
+from instrumentation import timed
+from store import load_ohlcv
 
+@timed('clean_data')
 def clean_data(data):
-    # Fill forward for missing values
-    data.ffill(inplace=True)
-    
-    # Impute any remaining missing values after fill forward
-    imputer = SimpleImputer(strategy='mean')
-    data_imputed = imputer.fit_transform(data)
-    data = pd.DataFrame(data_imputed, columns=data.columns, index=data.index)
-    
-    # Drop rows that still have NaN values (if any)
-    data.dropna(inplace=True)
-    return data
+    # Fill forward for missing values, then impute what is left (leading gaps) with the column mean
+    data = data.ffill()
+    if data.isnull().values.any():
+        data = data.fillna(data.mean())
 
+    # Drop rows that still have NaN values (columns with no data at all)
+    data = data.dropna()
+    return data
 
-def engineer_features(data):
-    data['MA_5'] = data['Close'].rolling(window=5).mean()
-    data['MA_10'] = data['Close'].rolling(window=10).mean()
-    data['Pct_change'] = data['Close'].pct_change()
-    
-    # Fill NaN values created by rolling functions
-    data['MA_5'].fillna(value=data['Close'].mean(), inplace=True)
-    data['MA_10'].fillna(value=data['Close'].mean(), inplace=True)
-    data['Pct_change'].fillna(value=data['Pct_change'].mean(), inplace=True)
 
-    scaler = StandardScaler()
-    data['Volume_scaled'] = scaler.fit_transform(data[['Volume']])
-    
-    return data
+@timed('engineer_features')
+def engineer_features(data, config=DEFAULT_CONFIG):
+    """
+    Adds the configured features (by default MA_5, MA_10, Pct_change and Volume_scaled).
+    All features are computed in one NumPy pass, see features.compute_features.
+    :param data: Cleaned OHLCV DataFrame.
+    :param config: FeatureConfig selecting extra windows, volatility, RSI and volume z-scores.
+    :return: New DataFrame with the original columns followed by the features.
+    """
+    matrix = compute_features(data.to_numpy(dtype=float), data.columns.get_loc('Close'),
+                              data.columns.get_loc('Volume'), config)
+    return pd.DataFrame(matrix, index=data.index, columns=list(data.columns) + feature_names(config))
 
 
-def detect_anomalies(data):
+def check_for_nan(data):
     # Check for NaN values and print columns with NaN
+    if isinstance(data, np.ndarray):
+        # Feature matrices of the compact pipeline (compact.py)
+        if np.isnan(data).any():
+            raise ValueError("NaN values found in data before model fitting.")
+        return
     if data.isnull().any().any():
         print("NaN values found in the following columns before model fitting:")
         print(data.columns[data.isnull().any()])
         raise ValueError("NaN values found in data before model fitting.")
 
-    model = IsolationForest(n_estimators=100, contamination=0.01)
-    model.fit(data)
+
+def _seeded(model, random_state, n_jobs=None):
+    # Only randomized backends have a random_state; explicit settings in the detector config win
+    if getattr(model, 'random_state', False) is None:
+        model.random_state = random_state
+    if n_jobs is not None and getattr(model, 'n_jobs', False) is None:
+        model.n_jobs = n_jobs
+    return model
+
+
+@timed('fit_model')
+def fit_model(data, n_estimators=100, contamination=0.01, detector=None, random_state=None, n_jobs=None):
+    """
+    Fits a detector on the feature rows.
+    :param detector: Backend name or config dict (see detectors.make_detector). If None, an
+        IsolationForest with n_estimators and contamination is used.
+    :param random_state: Seed for randomized backends. When None, a seed derived from the model
+        params is used (see fingerprint.default_seed), so refitting the same data gives the same model.
+    :param n_jobs: Parallel tree building for the IsolationForest. The trees' seeds are drawn from
+        random_state up front, so results do not depend on n_jobs.
+    :return: Fitted detector with score_samples, predict and offset_.
+    """
+    check_for_nan(data)
+    random_state = default_seed(random_state, n_estimators, contamination, detector)
+    if detector is None:
+        model = IsolationForestDetector(n_estimators=n_estimators, contamination=contamination,
+                                        random_state=random_state, n_jobs=n_jobs)
+    else:
+        model = _seeded(make_detector(detector), random_state, n_jobs)
+    return model.fit(data)
+
+
+@timed('detect_anomalies')
+def detect_anomalies(data, model=None, n_estimators=100, contamination=0.01, detector=None, random_state=None,
+                     ticker=None, registry=None):
+    """
+    Labels each row of data in a new 'anomaly' column (-1 anomaly, 1 normal).
+    :param data: Feature DataFrame.
+    :param model: Already fitted model to use. If None, a new one is fitted on data.
+    :param detector: Backend for the new model, see fit_model. Defaults to an IsolationForest.
+    :param random_state: Seed for the new model, see fit_model.
+    :param ticker: Ticker of data, to look up in registry.
+    :param registry: Optional registry.ModelRegistry. The ticker's current model is used instead
+        of fitting one; a new model is only fitted when it has none for these columns.
+    :return: The anomalous rows.
+    """
+    check_for_nan(data)
+    if model is None and registry is not None:
+        model = registry.current_model(ticker, data)
+    if model is None:
+        model = fit_model(data, n_estimators, contamination, detector, random_state)
     data['anomaly'] = model.predict(data)
     anomalies = data[data['anomaly'] == -1]
     return anomalies
 
 
+@timed('score_anomalies')
+def score_anomalies(data, model=None, n_estimators=100, contamination=0.01, detector=None, random_state=None,
+                    ticker=None, registry=None):
+    """
+    Like detect_anomalies, but keeps every row and the raw model score.
+    :param data: Feature DataFrame.
+    :param model: Already fitted model to use. If None, a new one is fitted on data.
+    :param detector: Backend for the new model, see fit_model. Defaults to an IsolationForest.
+    :param random_state: Seed for the new model, see fit_model.
+    :param ticker: Ticker of data, to look up in registry.
+    :param registry: Optional registry.ModelRegistry to load the ticker's current model from, see detect_anomalies.
+    :return: Copy of data with 'score' (score_samples, lower is more anomalous) and 'anomaly' columns.
+    """
+    check_for_nan(data)
+    if model is None and registry is not None:
+        model = registry.current_model(ticker, data)
+    if model is None:
+        model = fit_model(data, n_estimators, contamination, detector, random_state)
+    scores = model.score_samples(data)
+    scored = data.copy()
+    scored['score'] = scores
+    # Same rule as model.predict: anomalous when the score falls below the fitted offset
+    scored['anomaly'] = np.where(scores < model.offset_, -1, 1)
+    return scored
+
+
 def evaluate_model(true_labels, predicted_labels):
     print(classification_report(true_labels, predicted_labels))
     f1 = f1_score(true_labels, predicted_labels, pos_label=-1)
     print(f'F1 Score: {f1}')
     return f1
 
-def plot_data_with_anomalies(data, ticker):
+def plot_data_with_anomalies(data, ticker, save_path=None):
     plt.figure(figsize=(12, 6))
     plt.plot(data.index, data['Close'], label='Close Price', color='blue')
     anomalies = data[data['anomaly'] == -1]
@@ -66,27 +147,112 @@ def plot_data_with_anomalies(data, ticker):
     plt.xlabel('Date')
     plt.ylabel('Price')
     plt.legend()
-    plt.show()
+    if save_path:
+        # Headless runs write the chart to disk instead of opening a window
+        plt.savefig(save_path)
+        plt.close()
+    else:
+        plt.show()
+
+def inject_anomalies(features, fraction=0.02, magnitude=6.0, random_state=None):
+    """
+    Builds a validation set by pushing a random subset of rows far out on some of their features.
+    :param features: Feature DataFrame the model is trained on.
+    :param fraction: Share of rows to turn into anomalies.
+    :param magnitude: Shift applied to each perturbed value, in standard deviations of its column.
+    :return: validation DataFrame and labels (-1 for injected rows, 1 otherwise)
+    """
+    rng = np.random.default_rng(random_state)
+    values = features.to_numpy(dtype=float, copy=True)
+    n_rows, n_cols = values.shape
+    n_injected = max(1, int(round(n_rows * fraction)))
+    rows = rng.choice(n_rows, size=n_injected, replace=False)
+
+    std = values.std(axis=0)
+    std[std == 0] = 1.0
+    # Perturb roughly half of the columns of each injected row, always at least one
+    mask = rng.random((n_injected, n_cols)) < 0.5
+    mask[np.arange(n_injected), rng.integers(0, n_cols, n_injected)] = True
+    signs = rng.choice([-1.0, 1.0], size=(n_injected, n_cols))
+    values[rows] += mask * signs * magnitude * std
+
+    labels = np.ones(n_rows, dtype=int)
+    labels[rows] = -1
+    return pd.DataFrame(values, columns=features.columns, index=features.index), labels
+
+
+@timed('tune_model')
+def tune_model(data, true_labels=None, n_estimators_grid=(50, 100, 200), contamination_grid=(0.01, 0.02, 0.05),
+               n_jobs=-1, random_state=None, detector=None):
+    """
+    Picks n_estimators and contamination by F1 on a labelled validation set.
+
+    Without true_labels, synthetic anomalies are injected into a copy of the features
+    (see inject_anomalies). A single forest is grown with warm_start, so the trees for
+    50 estimators are reused for 100 and 200, and every contamination value is
+    evaluated by thresholding one score_samples pass instead of refitting.
+    :param data: Feature DataFrame, optionally with an 'anomaly' column.
+    :param true_labels: Optional labels (-1 anomaly, 1 normal) for the rows of data.
+    :param random_state: Seed for the injected anomalies and the models. When None, one is
+        derived from the grids (see fingerprint.default_seed), so tuning is repeatable.
+    :param detector: Optional other backend (see detectors.make_detector). It is fitted
+        once and only the contamination is tuned; n_estimators_grid is ignored.
+    :return: best_model, best_f1
+    """
+    features = data.drop(['anomaly'], axis=1, errors='ignore')  # Drop 'anomaly' column if it exists
+    random_state = default_seed(random_state, 'tune', n_estimators_grid, contamination_grid, detector)
+    if true_labels is None:
+        validation, labels = inject_anomalies(features, random_state=random_state)
+    else:
+        validation, labels = features, np.asarray(true_labels)
+
+    if detector is not None:
+        return _tune_contamination(_seeded(make_detector(detector), random_state).fit(features), features,
+                                   validation, labels, contamination_grid)
 
-def tune_model(data):
     best_f1 = 0
     best_model = None
-    features = data.drop(['anomaly'], axis=1, errors='ignore')  # Drop 'anomaly' column if it exists
+    model = IsolationForest(warm_start=True, n_jobs=n_jobs, random_state=random_state)
+    n_train = len(features)
 
-    for n_estimators in [50, 100, 200]:
-        for contamination in [0.01, 0.02, 0.05]:
-            model = IsolationForest(n_estimators=n_estimators, contamination=contamination)
-            model.fit(features)
-            predicted_labels = model.predict(features)
-            # Create a temporary 'anomaly' column for F1 score calculation
-            data['temp_anomaly'] = predicted_labels
-            f1 = f1_score(data['temp_anomaly'], predicted_labels, pos_label=-1)
+    for n_estimators in sorted(n_estimators_grid):
+        # warm_start only fits the trees added since the previous size
+        model.set_params(n_estimators=n_estimators)
+        model.fit(features)
+        scores = model.score_samples(pd.concat([features, validation]))
+        train_scores, val_scores = scores[:n_train], scores[n_train:]
+
+        for contamination in contamination_grid:
+            # Same threshold IsolationForest sets as offset_ when fitted with this contamination
+            offset = np.percentile(train_scores, 100.0 * contamination)
+            predicted_labels = np.where(val_scores < offset, -1, 1)
+            f1 = f1_score(labels, predicted_labels, pos_label=-1)
             if f1 > best_f1:
                 best_f1 = f1
-                best_model = model
+                best_model = copy.deepcopy(model)
+                best_model.set_params(contamination=contamination, warm_start=False)
+                best_model.offset_ = offset
+
+        if best_f1 == 1.0:
+            break
 
-    # Clean up: remove the temporary column
-    data.drop(['temp_anomaly'], axis=1, inplace=True)
+    return best_model, best_f1
+
+def _tune_contamination(model, features, validation, labels, contamination_grid):
+    """Picks the contamination of an already fitted detector by F1, thresholding one scoring pass."""
+    scores = model.score_samples(pd.concat([features, validation]))
+    train_scores, val_scores = scores[:len(features)], scores[len(features):]
+
+    best_f1 = 0
+    best_model = None
+    for contamination in contamination_grid:
+        offset = np.percentile(train_scores, 100.0 * contamination)
+        f1 = f1_score(labels, np.where(val_scores < offset, -1, 1), pos_label=-1)
+        if f1 > best_f1:
+            best_f1 = f1
+            best_model = copy.deepcopy(model)
+            best_model.contamination = contamination
+            best_model.offset_ = offset
     return best_model, best_f1
 
 def split_data_for_calendar_analysis(data, start_date, end_date, effect_period):
@@ -119,7 +285,7 @@ def main():
     end_date = '2020-12-31'
 
     for ticker in ticker_list:
-        data = yf.download(ticker, start=start_date, end=end_date)
+        data = load_ohlcv(ticker, start_date, end_date)
         cleaned_data = clean_data(data)
         featured_data = engineer_features(cleaned_data)
 
@@ -132,7 +298,8 @@ def main():
         print(f'Best model for {ticker} with F1 score: {best_f1}')
 
 
-        anomalies = detect_anomalies(featured_data)
+        anomalies = detect_anomalies(featured_data,
+                                     random_state=derive_seed(ticker, pd.Timestamp(start_date), pd.Timestamp(end_date)))
 
         # compare the detected anomalies with the true labels
         # placeholder since we don't have true labels
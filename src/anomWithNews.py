@@ -1,4 +1,3 @@
-import yfinance as yf
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
@@ -7,6 +6,9 @@ import matplotlib.pyplot as plt
 
 from sklearn.impute import SimpleImputer
 
+from store import load_ohlcv
+from fingerprint import default_seed
+
 def clean_data(data):
     # Fill forward for missing values
     data.ffill(inplace=True)
@@ -49,7 +51,8 @@ def detect_anomalies(data, ticker):
         print(data.columns[data.isnull().any()])
         raise ValueError("NaN values found in data before model fitting.")
 
-    model = IsolationForest(n_estimators=100, contamination=0.01)
+    model = IsolationForest(n_estimators=100, contamination=0.01,
+                            random_state=default_seed(None, ticker, data.index[0], data.index[-1]))
     model.fit(data)
     data['anomaly'] = model.predict(data)
     anomalies = data[data['anomaly'] == -1]
@@ -81,7 +84,8 @@ def tune_model(data):
 
     for n_estimators in [50, 100, 200]:
         for contamination in [0.01, 0.02, 0.05]:
-            model = IsolationForest(n_estimators=n_estimators, contamination=contamination)
+            model = IsolationForest(n_estimators=n_estimators, contamination=contamination,
+                                    random_state=default_seed(None, n_estimators, contamination))
             model.fit(features)
             predicted_labels = model.predict(features)
             # Create a temporary 'anomaly' column for F1 score calculation
@@ -125,7 +129,7 @@ def main():
     end_date = '2020-12-31'
 
     for ticker in ticker_list:
-        data = yf.download(ticker, start=start_date, end=end_date)
+        data = load_ohlcv(ticker, start_date, end_date)
         cleaned_data = clean_data(data)
         featured_data = engineer_features(cleaned_data)
 
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from anom import clean_data, engineer_features, score_anomalies
+from fingerprint import default_seed
+from store import load_ohlcv
+
+DEFAULT_INDEX_DIR = os.environ.get(
+    'ANOM_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'anomaly_index')
+)
+KEY_COLUMNS = ['ticker', 'date', 'score', 'anomaly', 'Close']
+# Written last by build_index; readers reload when it changes. pyarrow datasets skip names starting with '_'
+MANIFEST = '_manifest.json'
+
+
+def index_ticker(ticker, start_date, end_date, index_dir, params=None):
+    """
+    Scores every bar of one ticker and writes it to <index_dir>/<ticker>.parquet. A ticker
+    without data or whose scoring fails has its file removed, so no stale rows stay indexed.
+    :return: (ticker, status, number of rows written, error)
+    """
+    path = os.path.join(index_dir, f'{ticker}.parquet')
+    try:
+        data = load_ohlcv(ticker, start_date, end_date)
+        if data.empty:
+            _remove(path)
+            return ticker, 'empty', 0, None
+        featured_data = engineer_features(clean_data(data))
+        params = dict(params or {})
+        params['random_state'] = default_seed(params.get('random_state'), ticker, pd.Timestamp(start_date),
+                                              pd.Timestamp(end_date), params)
+        scored = score_anomalies(featured_data, **params)
+
+        scored.index.name = 'date'
+        scored = scored.reset_index()
+        scored.insert(0, 'ticker', ticker)
+        # Write then rename; the dataset ignores names starting with '.'
+        scored.to_parquet(os.path.join(index_dir, f'.{ticker}.parquet'), index=False)
+        os.replace(os.path.join(index_dir, f'.{ticker}.parquet'), path)
+        return ticker, 'ok', len(scored), None
+    except Exception as e:
+        _remove(path)
+        return ticker, 'error', 0, f'{type(e).__name__}: {e}'
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def build_index(tickers, start_date, end_date, index_dir=DEFAULT_INDEX_DIR, workers=None, params=None):
+    """
+    Scores the whole ticker universe in a process pool and writes the anomaly index.
+    Every bar is stored with its score and feature vector, not only the anomalies,
+    so queries can use any score threshold later. Files of tickers outside the universe
+    are removed, and the manifest is rewritten last so readers pick up the new index.
+    :return: List of (ticker, status, rows, error)
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(index_ticker, ticker, start_date, end_date, index_dir, params)
+                   for ticker in tickers]
+        statuses = [future.result() for future in futures]
+
+    universe = {f'{ticker}.parquet' for ticker in tickers}
+    for name in os.listdir(index_dir):
+        if name.endswith('.parquet') and not name.startswith(('.', '_')) and name not in universe:
+            _remove(os.path.join(index_dir, name))
+
+    manifest = {'built': time.time(), 'start': str(start_date), 'end': str(end_date),
+                'tickers': [ticker for ticker, status, _, _ in statuses if status == 'ok']}
+    path = os.path.join(index_dir, MANIFEST)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(f'{path}.tmp', path)
+    return statuses
+
+
+class AnomalyIndex:
+    """
+    Read side of the anomaly index.
+
+    The ticker, date, score, anomaly and Close columns of every file are loaded once and
+    kept sorted by date, so a query is a binary search on the date range plus a
+    mask on the score. Feature vectors stay on disk and are read only when asked for.
+    The keys are loaded again whenever build_index has rewritten the manifest since.
+    :param index_dir: Folder written by build_index.
+    """
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._keys = None
+        self._dates = None
+        self._version = None
+
+    def _manifest_version(self):
+        try:
+            return os.stat(os.path.join(self.index_dir, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _dataset(self):
+        return ds.dataset(self.index_dir, format='parquet')
+
+    def _load(self):
+        version = self._manifest_version()
+        with self._lock:
+            if self._keys is None or version != self._version:
+                self._version = version
+                keys = self._dataset().to_table(columns=KEY_COLUMNS).to_pandas()
+                keys = keys.sort_values('date', kind='stable').reset_index(drop=True)
+                self._dates = keys['date'].to_numpy()
+                self._keys = keys
+        return self._keys
+
+    def keys(self):
+        """The ticker, date, score, anomaly and Close columns of every indexed bar, sorted by date. Do not modify."""
+        return self._load()
+
+    def prices(self, start_date, end_date, tickers):
+        """Close prices of tickers between two dates (inclusive), one column per ticker."""
+        keys = self._load()
+        lo = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+        hi = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(end_date)), side='right')
+        window = keys.iloc[lo:hi]
+        window = window[window['ticker'].isin(tickers)]
+        return window.pivot_table(index='date', columns='ticker', values='Close', aggfunc='last')
+
+    def reload(self):
+        """Drops the in-memory copy, e.g. after build_index ran again."""
+        with self._lock:
+            self._keys = None
+            self._dates = None
+
+    def query(self, start_date, end_date, max_score=None, tickers=None, anomalies_only=True, with_features=False):
+        """
+        All indexed bars between two dates (inclusive) across all tickers.
+        :param max_score: Only return rows scoring below this (lower is more anomalous).
+        :param tickers: Optional list of tickers to restrict to.
+        :param anomalies_only: Only rows the model labelled as anomalies.
+        :param with_features: Also read the stored feature vectors for the returned rows.
+        :return: DataFrame sorted by score, most anomalous first.
+        """
+        keys = self._load()
+        lo = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+        hi = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(end_date)), side='right')
+        window = keys.iloc[lo:hi]
+
+        mask = np.ones(len(window), dtype=bool)
+        if max_score is not None:
+            mask &= window['score'].to_numpy() < max_score
+        if anomalies_only:
+            mask &= window['anomaly'].to_numpy() == -1
+        if tickers:
+            mask &= window['ticker'].isin(tickers).to_numpy()
+        result = window[mask].sort_values('score')
+
+        if with_features and len(result):
+            dataset = self._dataset()
+            expression = (ds.field('ticker').isin(result['ticker'].unique().tolist()) &
+                          (ds.field('date') >= pd.Timestamp(start_date)) &
+                          (ds.field('date') <= pd.Timestamp(end_date)))
+            features = dataset.to_table(filter=expression).to_pandas()
+            result = result[['ticker', 'date']].merge(features, on=['ticker', 'date'], how='left')
+            result = result.sort_values('score')
+        return result.reset_index(drop=True)
+
+
+_default_index = None
+
+
+def get_anomaly_index():
+    global _default_index
+    if _default_index is None:
+        _default_index = AnomalyIndex()
+    return _default_index
+
+
+def main():
+    # Not at module level: cli pulls in the batch pipeline, which the dashboards do not need
+    from cli import read_tickers
+
+    parser = argparse.ArgumentParser(description='Build the anomaly index for a ticker universe.')
+    parser.add_argument('tickers', nargs='*')
+    parser.add_argument('--tickers-file', help='File with one ticker per line (# starts a comment).')
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    tickers = read_tickers(args.tickers, args.tickers_file)
+
+    start = time.perf_counter()
+    statuses = build_index(tickers, args.start, args.end, args.index_dir, args.workers)
+    indexed = sum(status == 'ok' for _, status, _, _ in statuses)
+    rows = sum(count for _, _, count, _ in statuses)
+    print(f'Indexed {rows} bars for {indexed} of {len(tickers)} tickers in {time.perf_counter() - start:.1f}s')
+    for ticker, status, _, error in statuses:
+        if status != 'ok':
+            print(f'  {ticker}: {error or status}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,40 @@
+import os
+from concurrent.futures import CancelledError, TimeoutError
+
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash import Patch, ctx, dash_table, dcc, html, no_update
+from dash.dependencies import Input, Output, State
 import plotly.express as px
-import yfinance as yf
-import pandas as pd
 from datetime import date
 import dash_bootstrap_components as dbc
 
-from anom import clean_data, engineer_features, detect_anomalies, split_data_for_calendar_analysis
+from model_cache import get_model_cache
+from calendar_effects import EFFECTS, analyze_calendar_effects, effect_masks
+from downsample import downsample_for_view, relayout_range
+from figures import figure, get_figure_cache, line_trace, marker_trace
+from instrumentation import REGISTRY, register_metrics_endpoint, span, timed
+from warmup import get_view_cache, start_warmer
+from jobs import JobCancelled, get_job_manager
+from resample import NoIntradayData, RESOLUTIONS
+from anomaly_index import get_anomaly_index
+from events import detect_events, event_correlation, get_score_matrix
+
+# Rows shown in the universe anomaly table
+INDEX_RESULT_LIMIT = 500
+# Events whose member correlation is computed for the events table, strongest first
+EVENT_CORRELATION_LIMIT = 20
+# Seconds a graph request waits for its job before handing over to polling; warm views finish well within it
+JOB_WAIT_SECONDS = 0.5
 
 app = dash.Dash(__name__)
 
+# Prometheus-style metrics at /metrics, including model cache counters
+register_metrics_endpoint(app.server)
+REGISTRY.add_collector('model_cache', lambda: {f'anom_model_cache_{name}': value for name, value in get_model_cache().stats().items()})
+REGISTRY.add_collector('view_cache', lambda: {f'anom_view_cache_{name}': value for name, value in get_view_cache().stats().items()})
+REGISTRY.add_collector('figure_cache', lambda: {f'anom_figure_cache_{name}': value for name, value in get_figure_cache().stats().items()})
+REGISTRY.add_collector('jobs', lambda: {f'anom_jobs_{name}': value for name, value in get_job_manager().stats().items()})
+
 app.layout = html.Div([
     html.H1('Stock Data Anomaly Detection'),
     dcc.Dropdown(
@@ -26,6 +50,13 @@ app.layout = html.Div([
         start_date_placeholder_text='Start Date',
         end_date_placeholder_text='End Date'
     ),
+    # Intraday bars are resampled from 1-minute data, which Yahoo only keeps for recent weeks
+    dcc.Dropdown(
+        id='resolution',
+        options=[{'label': resolution, 'value': resolution} for resolution in RESOLUTIONS],
+        value='1d',
+        clearable=False
+    ),
     dcc.RadioItems(
         id='analysis-type',
         options=[
@@ -59,14 +90,37 @@ app.layout = html.Div([
     dcc.Dropdown(
         id='effect-type',
         options=[
-            {'label': 'January Effect', 'value': 'january'},
-            {'label': 'Weekend Effect', 'value': 'weekend'}
-            # Add as needed
+            {'label': label, 'value': effect} for effect, (label, _) in EFFECTS.items()
         ],
         value='january',
         style={'display': 'none'}  # Hidden by default
     ),
     dcc.Graph(id='price-graph'),
+    html.Div(id='graph-progress'),
+    dcc.Store(id='graph-job'),
+    # Request behind the figure on screen; effect toggles over it are sent as a Patch of the markers
+    dcc.Store(id='graph-shown'),
+    dcc.Interval(id='graph-poll', interval=250, disabled=True),
+    html.H2('Universe Anomaly Index'),
+    dcc.DatePickerRange(
+        id='index-date-range',
+        start_date=date(2020, 1, 1),
+        end_date=date(2020, 12, 31),
+        display_format='MMM D, YYYY'
+    ),
+    dcc.Input(id='index-max-score', type='number', placeholder='Max score, e.g. -0.6', debounce=True),
+    html.Div(id='index-results'),
+    html.H2('Market Events'),
+    dcc.DatePickerRange(
+        id='events-date-range',
+        start_date=date(2020, 1, 1),
+        end_date=date(2020, 12, 31),
+        display_format='MMM D, YYYY'
+    ),
+    dcc.Input(id='events-window', type='number', min=1, value=1, placeholder='Window (days)', debounce=True),
+    dcc.Input(id='events-min-tickers', type='number', min=1, value=5, placeholder='Min tickers', debounce=True),
+    dcc.Graph(id='events-graph'),
+    html.Div(id='events-results'),
 ])
 
 @app.callback(
@@ -79,73 +133,209 @@ def toggle_effect_type(analysis_type):
     else:
         return {'display': 'none'}
 
+def _job_outputs(job, wait=0):
+    """(poll disabled, figure, progress, shown base) for the current state of a graph job."""
+    try:
+        fig, base = job.future.result(timeout=wait)
+    except TimeoutError:
+        progress = html.Div([html.Progress(value=str(job.progress), max='1'), html.Span(f' {job.message}')])
+        return False, no_update, progress, no_update
+    except (JobCancelled, CancelledError):
+        return True, no_update, '', no_update
+    except NoIntradayData as e:
+        return True, no_update, html.P(str(e)), no_update
+    except Exception as e:
+        return True, no_update, html.P(f'Could not load {job.key}: {e}'), no_update
+    return True, fig, '', base
+
 @app.callback(
-    Output('price-graph', 'figure'),
+    [Output('graph-job', 'data'),
+     Output('graph-poll', 'disabled'),
+     Output('price-graph', 'figure'),
+     Output('graph-progress', 'children'),
+     Output('graph-shown', 'data')],
     [Input('stock-selector', 'value'),
      Input('date-picker-range', 'start_date'),
      Input('date-picker-range', 'end_date'),
      Input('analysis-type', 'value'),
-     Input('effect-type', 'value')]
+     Input('effect-type', 'value'),
+     Input('resolution', 'value'),
+     Input('price-graph', 'relayoutData')],
+    [State('graph-job', 'data'),
+     State('graph-shown', 'data')]
 )
-def update_graph(selected_ticker, start_date, end_date, analysis_type, effect_type):
+def start_graph_job(selected_ticker, start_date, end_date, analysis_type, effect_type, resolution, relayout_data,
+                    previous, shown_base):
+    # Only a zoom/pan on the graph itself re-renders at the new range; other inputs reset the view
+    view_range = relayout_range(relayout_data) if ctx.triggered_id == 'price-graph' else None
+    base = repr((selected_ticker, start_date, end_date, analysis_type, resolution, view_range))
+    # The standard chart does not depend on the effect, so toggling it there changes nothing
+    request = repr((base, effect_type if analysis_type == 'calendar' else None))
+    if previous and request == previous['request']:
+        return no_update, no_update, no_update, no_update, no_update
+
+    # Same chart on screen, other effect: only the marker traces and title are rebuilt and sent
+    patch = analysis_type == 'calendar' and shown_base == base
+    key = request + ('|patch' if patch else '')
+
+    # Identical requests from other sessions share one job; our previous job is cancelled unless someone else holds it
+    jobs = get_job_manager()
+    job = jobs.submit(key, update_graph, selected_ticker, start_date, end_date, analysis_type, effect_type, view_range,
+                      resolution, patch)
+    if previous:
+        jobs.release(previous['job'])
+    return ({'request': request, 'job': key},) + _job_outputs(job, wait=JOB_WAIT_SECONDS)
+
+@app.callback(
+    [Output('graph-poll', 'disabled', allow_duplicate=True),
+     Output('price-graph', 'figure', allow_duplicate=True),
+     Output('graph-progress', 'children', allow_duplicate=True),
+     Output('graph-shown', 'data', allow_duplicate=True)],
+    [Input('graph-poll', 'n_intervals')],
+    [State('graph-job', 'data')],
+    prevent_initial_call=True
+)
+def poll_graph_job(n_intervals, current):
+    job = get_job_manager().get(current['job']) if current else None
+    if job is None:
+        return True, no_update, '', no_update
+    return _job_outputs(job)
+
+@timed('callback.update_graph', profile=True)
+def update_graph(job, selected_ticker, start_date, end_date, analysis_type, effect_type, view_range=None,
+                 resolution='1d', patch=False):
+    """
+    Builds the price figure in a background job (see jobs.py), reporting progress on job.
+    :param patch: Return a Patch of the calendar markers and title for the figure already on screen.
+    :return: (figure or Patch, base request of the figure)
+    """
     if analysis_type == 'standard':
-        return update_graph_standard(selected_ticker, start_date, end_date)
+        fig = update_graph_standard(selected_ticker, start_date, end_date, view_range, job.set_progress, resolution)
     elif analysis_type == 'calendar':
-        return update_graph_for_calendar_analysis(selected_ticker, start_date, end_date, effect_type)
-
-def update_graph_standard(selected_ticker, start_date, end_date):
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
-    
-    df = yf.download(selected_ticker, start=start_date, end=end_date)
-    
-    # Clean and process data using functions from anom.py
-    cleaned_data = clean_data(df)
-    featured_data = engineer_features(cleaned_data)
-    anomalies = detect_anomalies(featured_data)
-    
-    fig = px.line(df, x=df.index, y='Close', title=f'Stock Prices for {selected_ticker}')
-    
-    fig.add_scatter(x=anomalies.index, y=anomalies['Close'], mode='markers', name='Anomalies')
+        fig = update_graph_for_calendar_analysis(selected_ticker, start_date, end_date, effect_type, view_range,
+                                                 job.set_progress, resolution, patch)
+    if not patch:
+        # Keep the user's zoom while re-rendering the same series
+        fig['layout']['uirevision'] = f'{selected_ticker}|{start_date}|{end_date}|{analysis_type}|{resolution}'
+    job.set_progress(1.0, 'Done')
+    return fig, repr((selected_ticker, start_date, end_date, analysis_type, resolution, view_range))
+
+def _price_trace(view, view_range):
+    # Only send about POINT_BUDGET bars to the browser, always including the anomalies. The line
+    # does not depend on the analysis or effect, so it is built once per view (by content) and zoom
+    df, anomalies = view['data'], view['anomalies']
+    key = anomalies.attrs.get('fingerprint')
+    build = lambda: line_trace(downsample_for_view(df, keep=anomalies.index, view_range=view_range))
+    return get_figure_cache().get_or_build((key, view_range), build) if key else build()
+
+def update_graph_standard(selected_ticker, start_date, end_date, view_range=None, progress=None, resolution='1d'):
+    # Warm views are read straight from the shared cache; anything else is computed on demand
+    view = get_view_cache().get_or_compute(selected_ticker, start_date, end_date, progress, resolution)
+    anomalies = view['anomalies']
+
+    with span('figure'):
+        fig = figure([_price_trace(view, view_range), marker_trace(anomalies, 'Anomalies')],
+                     title=f'Stock Prices for {selected_ticker}')
 
     return fig
 
-def update_graph_for_calendar_analysis(selected_ticker, start_date, end_date, effect_type):
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
+def update_graph_for_calendar_analysis(selected_ticker, start_date, end_date, effect_type, view_range=None,
+                                       progress=None, resolution='1d', patch=False):
+    # Score the whole range once; each calendar effect is only a mask over the same index
+    view = get_view_cache().get_or_compute(selected_ticker, start_date, end_date, progress, resolution)
+    featured_data, anomalies = view['features'], view['anomalies']
 
-    df = yf.download(selected_ticker, start=start_date, end=end_date)
+    effect_type = effect_type if effect_type in EFFECTS else 'january'
+    in_effect = effect_masks(anomalies.index, [effect_type])[0][0]
+    anomalies_outside = anomalies[~in_effect]
+    anomalies_during = anomalies[in_effect]
+    summary = analyze_calendar_effects(featured_data, [effect_type]).iloc[0]
 
-    # Determine the effect period based on the selected effect type
-    effect_periods = {
-        'january': (1, 1),  # January Effect
-        'weekend': (6, 7)   # Weekend Effect (Saturday and Sunday)
-        # Add as needed
-    }
-    effect_period = effect_periods.get(effect_type, (1, 1))
+    # Create figure to plot data
+    title = (f"{summary['label']} Analysis for {selected_ticker}: anomaly rate "
+             f"{summary['anomaly_rate_in']:.1%} during vs {summary['anomaly_rate_out']:.1%} outside")
+    with span('figure'):
+        # Scatter traces for anomalies outside and during the effect
+        markers = [marker_trace(anomalies_outside, 'Anomalies Outside Effect', 'orange'),
+                   marker_trace(anomalies_during, 'Anomalies During Effect', 'red')]
+        if patch:
+            # The price line (trace 0) is already in the browser
+            fig = Patch()
+            fig['data'][1] = markers[0]
+            fig['data'][2] = markers[1]
+            fig['layout']['title']['text'] = title
+        else:
+            fig = figure([_price_trace(view, view_range)] + markers, title=title)
 
-    # Split data for calendar analysis
-    train_data, test_data = split_data_for_calendar_analysis(df, start_date, end_date, effect_period)
+    return fig
 
-    # Clean & process both datasets
-    cleaned_train_data = clean_data(train_data)
-    featured_train_data = engineer_features(cleaned_train_data)
-    cleaned_test_data = clean_data(test_data)
-    featured_test_data = engineer_features(cleaned_test_data)
+@app.callback(
+    Output('index-results', 'children'),
+    [Input('index-date-range', 'start_date'),
+     Input('index-date-range', 'end_date'),
+     Input('index-max-score', 'value')]
+)
+@timed('callback.query_anomaly_index')
+def query_anomaly_index(start_date, end_date, max_score):
+    # Answered from the precomputed index (see anomaly_index.py), no scoring happens here
+    index = get_anomaly_index()
+    if not os.path.isdir(index.index_dir) or not os.listdir(index.index_dir):
+        return html.P('No anomaly index yet. Build one with: python anomaly_index.py <tickers>')
 
-    # Detect anomalies in both datasets
-    anomalies_train = detect_anomalies(featured_train_data)
-    anomalies_test = detect_anomalies(featured_test_data)
+    results = index.query(start_date, end_date, max_score=max_score).head(INDEX_RESULT_LIMIT).copy()
+    results['date'] = results['date'].dt.strftime('%Y-%m-%d')
+    results['score'] = results['score'].round(4)
+    return dash_table.DataTable(
+        data=results[['ticker', 'date', 'score', 'Close']].to_dict('records'),
+        columns=[{'name': column, 'id': column} for column in ['ticker', 'date', 'score', 'Close']],
+        page_size=20,
+        sort_action='native'
+    )
 
-    # Create figure to plot data
-    fig = px.line(df, x=df.index, y='Close', title=f'{effect_type.capitalize()} Effect Analysis for {selected_ticker}')
+@app.callback(
+    [Output('events-graph', 'figure'),
+     Output('events-results', 'children')],
+    [Input('events-date-range', 'start_date'),
+     Input('events-date-range', 'end_date'),
+     Input('events-window', 'value'),
+     Input('events-min-tickers', 'value')]
+)
+@timed('callback.detect_market_events')
+def detect_market_events(start_date, end_date, window, min_tickers):
+    # Co-occurring anomalies across the indexed universe (see events.py); the sparse matrix is built once per index load
+    index = get_anomaly_index()
+    if not os.path.isdir(index.index_dir) or not os.listdir(index.index_dir):
+        return no_update, html.P('No anomaly index yet. Build one with: python anomaly_index.py <tickers>')
 
-    # Add scatter plots for anomalies in both datasets
-    fig.add_scatter(x=anomalies_train.index, y=anomalies_train['Close'], mode='markers', name='Train Anomalies', marker_color='orange')
-    fig.add_scatter(x=anomalies_test.index, y=anomalies_test['Close'], mode='markers', name='Test Anomalies', marker_color='red')
+    timeline, events = detect_events(get_score_matrix(index), start_date, end_date, window or 1, min_tickers or 5)
+    if timeline.empty:
+        return figure([], 'No indexed dates in this range'), html.P('The anomaly index has no dates in this range.')
+    fig = px.line(timeline, x=timeline.index, y=['tickers', 'expected'],
+                  title=f'Anomalous tickers per {window or 1}-day window: {len(events)} events')
+    fig.add_scatter(x=events['peak'], y=timeline.loc[events['peak'], 'tickers'], mode='markers', name='Events',
+                    marker_color='red')
 
-    return fig
+    events = events.sort_values('z', ascending=False).head(INDEX_RESULT_LIMIT).copy()
+    events['correlation'] = [event_correlation(event, index) if rank < EVENT_CORRELATION_LIMIT else None
+                             for rank, (_, event) in enumerate(events.iterrows())]
+    for column in ['start', 'end', 'peak']:
+        events[column] = events[column].dt.strftime('%Y-%m-%d')
+    events[['breadth', 'z', 'strength', 'correlation']] = events[['breadth', 'z', 'strength', 'correlation']].astype(float).round(3)
+    events['members'] = events['members'].map(lambda members: ' '.join(members[:10]))
+    columns = ['start', 'end', 'tickers', 'breadth', 'z', 'correlation', 'members']
+    table = dash_table.DataTable(
+        data=events[columns].to_dict('records'),
+        columns=[{'name': column, 'id': column} for column in columns],
+        page_size=20,
+        sort_action='native'
+    )
+    return fig, table
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    # Pre-compute the dropdown tickers in the background so first paints are cache reads. The debug
+    # reloader runs this module in a watcher and a serving child; only the child warms, so the two
+    # never write the same store files at once
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmer()
+    app.run(debug=True, threaded=True)
 
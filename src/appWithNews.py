@@ -1,34 +1,30 @@
 # Currently working on adding a news feature that provides a link to news about the marked anomaly
+import os
+
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output
 import plotly.express as px
-import yfinance as yf
-import pandas as pd
 from datetime import date
 import dash_bootstrap_components as dbc
 
-from anomWithNews import clean_data, engineer_features, detect_anomalies, split_data_for_calendar_analysis
-
-import requests
-import datetime
+from model_cache import get_model_cache
+from calendar_effects import EFFECTS, analyze_calendar_effects, effect_masks
+from instrumentation import REGISTRY, register_metrics_endpoint, span, timed
+from warmup import get_view_cache, start_warmer
+from news import get_news_service
 
-def get_news(ticker, anomaly_date):
-    api_key = "cb5b6ccedc5d41b3b15072a9ceb9afeb"
-    from_date = (anomaly_date - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-    to_date = anomaly_date.strftime("%Y-%m-%d")
-    url = (f"https://newsapi.org/v2/everything?q={ticker}&from={from_date}"
-           f"&to={to_date}&sortBy=relevancy&apiKey={api_key}")
-
-    response = requests.get(url)
-    if response.status_code == 200:
-        articles = response.json().get("articles", [])
-        return [(article["title"], article["url"]) for article in articles]
-    return []
+# Seconds to wait for news before rendering with whatever has arrived
+NEWS_TIMEOUT = 5
 
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
+# Prometheus-style metrics at /metrics, including model cache counters
+register_metrics_endpoint(app.server)
+REGISTRY.add_collector('model_cache', lambda: {f'anom_model_cache_{name}': value for name, value in get_model_cache().stats().items()})
+REGISTRY.add_collector('view_cache', lambda: {f'anom_view_cache_{name}': value for name, value in get_view_cache().stats().items()})
+
 app.layout = html.Div([
     html.H1('Stock Data Anomaly Detection', style={'textAlign': 'center'}),
     html.Div([
@@ -77,9 +73,7 @@ app.layout = html.Div([
     dcc.Dropdown(
         id='effect-type',
         options=[
-            {'label': 'January Effect', 'value': 'january'},
-            {'label': 'Weekend Effect', 'value': 'weekend'}
-            # Add as needed
+            {'label': label, 'value': effect} for effect, (label, _) in EFFECTS.items()
         ],
         value='january',
         style={'display': 'none'}  # Hidden by default
@@ -99,16 +93,20 @@ app.layout = html.Div([
      Input('analysis-type', 'value'),
      Input('effect-type', 'value')]
 )
+@timed('callback.update_content', profile=True)
 def update_content(selected_ticker, start_date, end_date, analysis_type, effect_type):
-    if analysis_type == 'standard':
-        anomalies = detect_anomalies(featured_data, selected_ticker)  # Pass ticker
-        news_items = []
-        for index, anomaly in anomalies.iterrows():
-            news = get_news(selected_ticker, anomaly['date'])
-            news_items.extend(news)
-        # Format the news for display
-        news_elements = [html.A(title, href=url, target='_blank') for title, url in news_items]
-        return fig, html.Div(news_elements)
+    if analysis_type == 'calendar':
+        fig, anomalies = update_graph_for_calendar_analysis(selected_ticker, start_date, end_date, effect_type)
+    else:
+        fig, anomalies = update_graph_standard(selected_ticker, start_date, end_date)
+
+    # Fetch news for all anomaly dates concurrently instead of one request per row
+    with span('news'):
+        news = get_news_service().get_news_for_dates(selected_ticker, anomalies.index, timeout=NEWS_TIMEOUT)
+    news_items = [item for day in sorted(news) for item in news[day]]
+    # Format the news for display
+    news_elements = [html.A(title, href=url, target='_blank') for title, url in news_items]
+    return fig, html.Div(news_elements)
 
 @app.callback(
     Output('effect-type', 'style'),
@@ -121,60 +119,47 @@ def toggle_effect_type(analysis_type):
         return {'display': 'none'}
 
 def update_graph_standard(selected_ticker, start_date, end_date):
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
+    # Warm views are read straight from the shared cache; anything else is computed on demand
+    view = get_view_cache().get_or_compute(selected_ticker, start_date, end_date)
+    df, anomalies = view['data'], view['anomalies']
     
-    # Fetch data using yfinance or existing data pipeline
-    df = yf.download(selected_ticker, start=start_date, end=end_date)
-    
-    # Clean and process data using functions from anom.py
-    cleaned_data = clean_data(df)
-    featured_data = engineer_features(cleaned_data)
-    anomalies = detect_anomalies(featured_data)
-    
-    fig = px.line(df, x=df.index, y='Close', title=f'Stock Prices for {selected_ticker}')
-    
-    fig.add_scatter(x=anomalies.index, y=anomalies['Close'], mode='markers', name='Anomalies')
+    with span('figure'):
+        fig = px.line(df, x=df.index, y='Close', title=f'Stock Prices for {selected_ticker}')
+        fig.add_scatter(x=anomalies.index, y=anomalies['Close'], mode='markers', name='Anomalies')
 
-    return fig
+    return fig, anomalies
 
 def update_graph_for_calendar_analysis(selected_ticker, start_date, end_date, effect_type):
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
-
-    df = yf.download(selected_ticker, start=start_date, end=end_date)
-
-    # Determine the effect period based on the selected effect type
-    effect_periods = {
-        'january': (1, 1),  # January Effect
-        'weekend': (6, 7)   # Weekend Effect (Saturday and Sunday)
-    }
-    effect_period = effect_periods.get(effect_type, (1, 1))
-
-    train_data, test_data = split_data_for_calendar_analysis(df, start_date, end_date, effect_period)
-
-    # Clean and process both datasets
-    cleaned_train_data = clean_data(train_data)
-    featured_train_data = engineer_features(cleaned_train_data)
-    cleaned_test_data = clean_data(test_data)
-    featured_test_data = engineer_features(cleaned_test_data)
+    # Score the whole range once; each calendar effect is only a mask over the same index
+    view = get_view_cache().get_or_compute(selected_ticker, start_date, end_date)
+    df, featured_data, anomalies = view['data'], view['features'], view['anomalies']
 
-    # Detect anomalies in both datasets
-    anomalies_train = detect_anomalies(featured_train_data)
-    anomalies_test = detect_anomalies(featured_test_data)
+    effect_type = effect_type if effect_type in EFFECTS else 'january'
+    in_effect = effect_masks(anomalies.index, [effect_type])[0][0]
+    anomalies_outside = anomalies[~in_effect]
+    anomalies_during = anomalies[in_effect]
+    summary = analyze_calendar_effects(featured_data, [effect_type]).iloc[0]
 
     # Create a figure to plot the data
-    fig = px.line(df, x=df.index, y='Close', title=f'{effect_type.capitalize()} Effect Analysis for {selected_ticker}')
+    title = (f"{summary['label']} Analysis for {selected_ticker}: anomaly rate "
+             f"{summary['anomaly_rate_in']:.1%} during vs {summary['anomaly_rate_out']:.1%} outside")
+    with span('figure'):
+        fig = px.line(df, x=df.index, y='Close', title=title)
 
-    # Add scatter plots for anomalies in both datasets
-    fig.add_scatter(x=anomalies_train.index, y=anomalies_train['Close'], mode='markers', name='Train Anomalies', marker_color='orange')
-    fig.add_scatter(x=anomalies_test.index, y=anomalies_test['Close'], mode='markers', name='Test Anomalies', marker_color='red')
+        # Add scatter plots for anomalies outside and during the effect
+        fig.add_scatter(x=anomalies_outside.index, y=anomalies_outside['Close'], mode='markers', name='Anomalies Outside Effect', marker_color='orange')
+        fig.add_scatter(x=anomalies_during.index, y=anomalies_during['Close'], mode='markers', name='Anomalies During Effect', marker_color='red')
 
-    return fig
+    return fig, anomalies
 
 app.layout.children.append(html.Div(id='news-section'))
 
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    # Pre-compute the dropdown tickers in the background so first paints are cache reads. The debug
+    # reloader runs this module in a watcher and a serving child; only the child warms, so the two
+    # never write the same store files at once
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmer()
+    app.run(debug=True)
 
@@ -0,0 +1,162 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from anom import clean_data, engineer_features, fit_model, inject_anomalies
+from store import load_ohlcv
+
+# Rows before each test block that are scored along with it (and then dropped), so the
+# rolling backends (robust_zscore, ewma_cusum) have history; they are past rows only
+CONTEXT_ROWS = 100
+
+# Features and labels of the series being backtested, set once per worker process
+_features = None
+_labels = None
+
+
+def walk_forward_folds(n_rows, train_size, test_size, step=None, expanding=False):
+    """
+    Train/test row ranges sliding over a series, every test block strictly after its training rows.
+    :param train_size: Rows in each training window (the first one when expanding).
+    :param test_size: Rows scored after each training window.
+    :param step: Rows the window moves per fold, test_size by default (non-overlapping test blocks).
+    :param expanding: Keep every row from the start in the training window instead of sliding it.
+    :return: List of (train slice, test slice).
+    """
+    step = step or test_size
+    folds = []
+    for train_end in range(train_size, n_rows - test_size + 1, step):
+        train_start = 0 if expanding else train_end - train_size
+        folds.append((slice(train_start, train_end), slice(train_end, train_end + test_size)))
+    return folds
+
+
+def _init_worker(features, labels):
+    global _features, _labels
+    _features = features
+    _labels = labels
+
+
+def _rescale_volume(train, block):
+    """Recomputes Volume_scaled of both frames from the training rows' volume only."""
+    if 'Volume_scaled' not in train.columns or 'Volume' not in train.columns:
+        return train, block
+    mean, std = train['Volume'].mean(), train['Volume'].std(ddof=0)
+    std = std if std > 0 else 1.0
+    train = train.assign(Volume_scaled=(train['Volume'] - mean) / std)
+    block = block.assign(Volume_scaled=(block['Volume'] - mean) / std)
+    return train, block
+
+
+def _run_fold(fold, train, test, detector, inject_fraction, random_state):
+    """Fits on the training rows only and scores the test block (plus its context)."""
+    start = time.perf_counter()
+    context = slice(max(test.start - CONTEXT_ROWS, train.start), test.stop)
+    train_data, block = _rescale_volume(_features.iloc[train], _features.iloc[context])
+    n_context = test.start - context.start
+
+    if _labels is None:
+        # Inject only into the test rows, so the model never sees them while fitting
+        injected, labels = inject_anomalies(block.iloc[n_context:], fraction=inject_fraction,
+                                            random_state=None if random_state is None else random_state + fold)
+        block = pd.concat([block.iloc[:n_context], injected])
+    else:
+        labels = _labels[test]
+
+    model = fit_model(train_data, detector=detector, random_state=None if random_state is None else random_state + fold)
+    predicted = model.predict(block)[n_context:]
+
+    flagged, actual = predicted == -1, labels == -1
+    return {
+        'fold': fold,
+        'train_start': _features.index[train.start],
+        'test_start': _features.index[test.start],
+        'test_end': _features.index[test.stop - 1],
+        'true_positives': int((flagged & actual).sum()),
+        'false_positives': int((flagged & ~actual).sum()),
+        'false_negatives': int((~flagged & actual).sum()),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _rates(true_positives, false_positives, false_negatives):
+    precision = true_positives / (true_positives + false_positives) if true_positives + false_positives else 0.0
+    recall = true_positives / (true_positives + false_negatives) if true_positives + false_negatives else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def backtest(features, labels=None, detector=None, train_size=500, test_size=50, step=None, expanding=False,
+             inject_fraction=0.02, workers=None, random_state=0):
+    """
+    Walk-forward evaluation of a detector: every fold fits on past rows only and scores
+    the block that follows, so no prediction uses future bars.
+
+    Features are computed once by the caller and handed to each worker process a single
+    time (not per fold); folds then run in parallel. Only Volume_scaled is refitted per
+    fold, on the training rows, since engineer_features scales it over the whole series.
+    :param features: Feature DataFrame in time order (engineer_features output).
+    :param labels: Optional labelled events (-1 anomaly, 1 normal) for the rows of features.
+        Without labels, synthetic anomalies are injected into each test block.
+    :param detector: Backend name or config, see detectors.make_detector. Defaults to an IsolationForest.
+    :param workers: Worker processes; 1 runs the folds in this process.
+    :return: folds DataFrame (one row per fold), summary dict with overall precision, recall and f1
+    """
+    features = features.drop(['anomaly'], axis=1, errors='ignore')
+    labels = None if labels is None else np.asarray(labels)
+    folds = walk_forward_folds(len(features), train_size, test_size, step, expanding)
+    tasks = [(fold, train, test, detector, inject_fraction, random_state)
+             for fold, (train, test) in enumerate(folds)]
+
+    if workers == 1:
+        _init_worker(features, labels)
+        results = [_run_fold(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(features, labels)) as executor:
+            results = list(executor.map(_run_fold, *zip(*tasks))) if tasks else []
+
+    results = pd.DataFrame(results)
+    totals = results[['true_positives', 'false_positives', 'false_negatives']].sum() if len(results) else None
+    precision, recall, f1 = _rates(*totals) if totals is not None else (0.0, 0.0, 0.0)
+    if len(results):
+        rates = [_rates(*row) for row in results[['true_positives', 'false_positives', 'false_negatives']].to_numpy()]
+        results['precision'], results['recall'], results['f1'] = zip(*rates)
+    summary = {'folds': len(results), 'precision': precision, 'recall': recall, 'f1': f1}
+    return results, summary
+
+
+def backtest_ticker(ticker, start_date, end_date, **params):
+    """Loads one ticker through the store, engineers its features once and backtests them."""
+    featured_data = engineer_features(clean_data(load_ohlcv(ticker, start_date, end_date)))
+    return backtest(featured_data, **params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of a detector on one ticker.')
+    parser.add_argument('ticker')
+    parser.add_argument('--start', default='2010-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--detector', default='isolation_forest')
+    parser.add_argument('--train-size', type=int, default=500)
+    parser.add_argument('--test-size', type=int, default=50)
+    parser.add_argument('--expanding', action='store_true')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='Write the per-fold results to this CSV.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    folds, summary = backtest_ticker(args.ticker, args.start, args.end, detector=args.detector,
+                                     train_size=args.train_size, test_size=args.test_size,
+                                     expanding=args.expanding, workers=args.workers)
+    if args.output:
+        folds.to_csv(args.output, index=False)
+    print(f"{summary['folds']} folds in {time.perf_counter() - start:.1f}s: precision {summary['precision']:.2f}, "
+          f"recall {summary['recall']:.2f}, F1 {summary['f1']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
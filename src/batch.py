@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import matplotlib
+matplotlib.use('Agg')  # Workers never open a display
+import pandas as pd
+
+from store import load_ohlcv
+from anom import clean_data, engineer_features, detect_anomalies, tune_model, plot_data_with_anomalies
+from fingerprint import default_seed, fingerprint
+from registry import ModelRegistry
+
+STAGES = ['load', 'clean', 'features', 'tune', 'detect', 'write']
+OUTPUT_FORMATS = ['csv', 'parquet', 'jsonl']
+
+
+def write_anomalies(anomalies, path, output_format='csv'):
+    """Writes anomaly rows (indexed by date) to path + the format's extension."""
+    if output_format == 'csv':
+        anomalies.to_csv(f'{path}.csv')
+    elif output_format == 'parquet':
+        anomalies.to_parquet(f'{path}.parquet')
+    elif output_format == 'jsonl':
+        anomalies.reset_index().to_json(f'{path}.jsonl', orient='records', lines=True, date_format='iso')
+    else:
+        raise ValueError(f'Unknown output format {output_format!r}, expected one of {OUTPUT_FORMATS}')
+
+
+def process_ticker(ticker, start_date, end_date, output_dir, tune=False, plot=False, detector=None,
+                   output_format='csv', registry_dir=None, n_jobs=-1):
+    """
+    Runs the full pipeline for one ticker and writes its anomalies to output_dir.
+    Failures are reported in the returned status instead of raised, so one bad
+    ticker does not stop the batch.
+    :param tune: Detect with the model tune_model picks (by F1 on injected anomalies) instead of the default one.
+    :param detector: Backend name or config for detect_anomalies, see detectors.make_detector.
+    :param output_format: One of OUTPUT_FORMATS.
+    :param registry_dir: Optional model registry (see registry.py) whose current models are used instead of fitting.
+    :param n_jobs: Threads for tune_model; run_batch gives each worker its share of the cores.
+    :return: Dict with ticker, status, row/anomaly counts, per-stage timings, error and the
+        fingerprint of the anomalies written (compare it across runs to spot changed results).
+    """
+    result = {'ticker': ticker, 'status': 'ok', 'rows': 0, 'anomalies': 0, 'timings': {}, 'error': None,
+              'fingerprint': None}
+    timings = result['timings']
+
+    try:
+        t = time.perf_counter()
+        data = load_ohlcv(ticker, start_date, end_date)
+        timings['load'] = time.perf_counter() - t
+        if data.empty:
+            result['status'] = 'empty'
+            return result
+        result['rows'] = len(data)
+
+        t = time.perf_counter()
+        cleaned_data = clean_data(data)
+        timings['clean'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        featured_data = engineer_features(cleaned_data)
+        if featured_data.isnull().values.any():
+            featured_data = clean_data(featured_data)
+        timings['features'] = time.perf_counter() - t
+
+        # Seeded per ticker and range, so reruns give identical files and fingerprints
+        random_state = default_seed(None, ticker, pd.Timestamp(start_date), pd.Timestamp(end_date), detector)
+        model = None
+        if tune:
+            t = time.perf_counter()
+            model, _ = tune_model(featured_data, n_jobs=n_jobs, random_state=random_state, detector=detector)
+            timings['tune'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        registry = ModelRegistry(registry_dir) if registry_dir else None
+        # A tuned model takes precedence over the registry's
+        anomalies = detect_anomalies(featured_data, model=model, detector=detector, random_state=random_state,
+                                     ticker=ticker, registry=registry)
+        timings['detect'] = time.perf_counter() - t
+        result['anomalies'] = len(anomalies)
+        result['fingerprint'] = fingerprint(anomalies)
+
+        t = time.perf_counter()
+        write_anomalies(anomalies, os.path.join(output_dir, ticker), output_format)
+        if plot:
+            plot_data_with_anomalies(featured_data, ticker, save_path=os.path.join(output_dir, f'{ticker}.png'))
+        timings['write'] = time.perf_counter() - t
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    return result
+
+
+def _process_chunk(tickers, start_date, end_date, output_dir, tune, plot, detector, output_format, registry_dir,
+                   n_jobs):
+    return [process_ticker(ticker, start_date, end_date, output_dir, tune, plot, detector, output_format, registry_dir,
+                           n_jobs)
+            for ticker in tickers]
+
+
+def summarize(results, wall_time):
+    stage_totals = {stage: 0.0 for stage in STAGES}
+    for result in results:
+        for stage, seconds in result['timings'].items():
+            stage_totals[stage] += seconds
+
+    statuses = {}
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+
+    return {
+        'tickers': len(results),
+        'statuses': statuses,
+        'anomalies': sum(result['anomalies'] for result in results),
+        'wall_time': wall_time,
+        'stage_time': stage_totals,
+    }
+
+
+def run_batch(tickers, start_date, end_date, output_dir, workers=None, chunk_size=10, tune=False, plot=False,
+              detector=None, output_format='csv', registry_dir=None):
+    """
+    Fans tickers out over a process pool and writes per-ticker results to output_dir.
+    :param tickers: List of ticker symbols.
+    :param workers: Number of worker processes. Defaults to the CPU count.
+    :param chunk_size: Tickers per submitted task. Larger chunks mean less scheduling overhead.
+    :param tune: Pick each ticker's model with tune_model instead of the default parameters.
+    :param plot: Also save a PNG chart for each ticker.
+    :param detector: Backend name or config, see detectors.make_detector. Defaults to an IsolationForest.
+    :param output_format: 'csv', 'parquet' or 'jsonl' for the per-ticker anomaly files.
+    :param registry_dir: Optional model registry to score with, see process_ticker.
+    :return: results, summary
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    # Split the cores between the workers instead of letting each tune_model use all of them
+    n_jobs = max(1, (os.cpu_count() or 1) // workers)
+    chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded number of chunks in flight so huge universes don't queue everything at once
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(_process_chunk, chunk, start_date, end_date, output_dir, tune, plot,
+                                        detector, output_format, registry_dir, n_jobs))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results.extend(future.result())
+        for future in pending:
+            results.extend(future.result())
+    wall_time = time.perf_counter() - start
+
+    summary = summarize(results, wall_time)
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump({'summary': summary, 'results': results}, f, indent=2)
+    return results, summary
+
+
+def print_summary(summary):
+    print(f"Processed {summary['tickers']} tickers in {summary['wall_time']:.2f}s: {summary['statuses']}")
+    print(f"Anomalies found: {summary['anomalies']}")
+    print('Time per stage (summed over workers):')
+    for stage, seconds in summary['stage_time'].items():
+        print(f'  {stage:<10}{seconds:10.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run anomaly detection for many tickers in parallel.')
+    parser.add_argument('tickers', nargs='+')
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--output-dir', default='output')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=10)
+    parser.add_argument('--tune', action='store_true')
+    parser.add_argument('--plot', action='store_true')
+    args = parser.parse_args()
+
+    _, summary = run_batch(args.tickers, args.start, args.end, args.output_dir, args.workers,
+                           args.chunk_size, args.tune, args.plot)
+    print_summary(summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from anom import clean_data, engineer_features, detect_anomalies, score_anomalies, tune_model
+from detectors import DETECTORS
+from synthetic import generate_ohlcv, generate_universe
+
+QUICK_SIZES = [250, 2_500, 25_000]
+FULL_SIZES = [250, 2_500, 25_000, 250_000, 1_000_000, 10_000_000]
+QUICK_TICKERS = [1, 10]
+FULL_TICKERS = [1, 10, 100, 1_000]
+# Rows of the detector speed vs recall comparison
+DETECTOR_ROWS = 25_000
+# tune_model fits a 200-tree forest and scores the data three times; skip it on huge series
+TUNE_MAX_ROWS = 250_000
+
+
+def _pipeline(data):
+    featured_data = engineer_features(clean_data(data))
+    return detect_anomalies(featured_data)
+
+
+def _stages(data, tune):
+    """Stage name -> zero-argument callable, each fed by the previous stage's output."""
+    cleaned_data = clean_data(data)
+    featured_data = engineer_features(cleaned_data)
+    stages = {
+        'clean': lambda: clean_data(data),
+        'features': lambda: engineer_features(cleaned_data),
+        'detect': lambda: detect_anomalies(featured_data.copy()),
+    }
+    if tune:
+        stages['tune'] = lambda: tune_model(featured_data.copy(), random_state=0)
+    stages['end_to_end'] = lambda: _pipeline(data)
+    return stages
+
+
+def measure(func, repeat):
+    """Best wall time over repeat runs, then peak traced memory of one extra run."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def bench_sizes(sizes, repeat, seed):
+    results = []
+    for rows in sizes:
+        data, _ = generate_ohlcv(rows, seed=seed, freq='min')
+        for stage, func in _stages(data, tune=rows <= TUNE_MAX_ROWS).items():
+            seconds, peak = measure(func, repeat if rows <= TUNE_MAX_ROWS else 1)
+            results.append({'scenario': 'rows', 'rows': rows, 'tickers': 1, 'stage': stage,
+                            'seconds': seconds, 'peak_bytes': peak})
+            print(f"rows={rows:>10} {stage:<12}{seconds:10.4f}s {peak / 2**20:10.1f} MiB", file=sys.stderr)
+    return results
+
+
+def bench_tickers(ticker_counts, rows, repeat, seed):
+    results = []
+    for n_tickers in ticker_counts:
+        universe = generate_universe(n_tickers, rows, seed=seed)
+
+        def run():
+            for data, _ in universe.values():
+                _pipeline(data)
+
+        seconds, peak = measure(run, repeat)
+        results.append({'scenario': 'tickers', 'rows': rows, 'tickers': n_tickers, 'stage': 'end_to_end',
+                        'seconds': seconds, 'peak_bytes': peak})
+        print(f"tickers={n_tickers:>7} end_to_end  {seconds:10.4f}s {peak / 2**20:10.1f} MiB", file=sys.stderr)
+    return results
+
+
+def bench_detectors(rows, repeat, seed):
+    """Times every detector backend on the same features and scores it against the injected spikes."""
+    data, labels = generate_ohlcv(rows, seed=seed, freq='min')
+    featured_data = engineer_features(clean_data(data))
+    spikes = labels.reindex(featured_data.index).to_numpy() == -1
+    contamination = max(spikes.mean(), 0.001)
+
+    results = []
+    for name in DETECTORS:
+        config = {'name': name, 'contamination': contamination}
+        if name == 'isolation_forest':
+            config['random_state'] = seed
+
+        def run():
+            return score_anomalies(featured_data, detector=config)
+
+        seconds, peak = measure(run, repeat)
+        flagged = run()['anomaly'].to_numpy() == -1
+        recall = (flagged & spikes).sum() / max(spikes.sum(), 1)
+        precision = (flagged & spikes).sum() / max(flagged.sum(), 1)
+        results.append({'scenario': 'detectors', 'rows': rows, 'tickers': 1, 'stage': name,
+                        'seconds': seconds, 'peak_bytes': peak, 'recall': recall, 'precision': precision})
+        print(f"detector {name:<17}{seconds:10.4f}s recall={recall:.2f} precision={precision:.2f}", file=sys.stderr)
+    return results
+
+
+def environment():
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the time ratio against a baseline run for every matching measurement.
+    :return: Number of measurements slower than threshold times the baseline.
+    """
+    key = lambda r: (r['scenario'], r['rows'], r['tickers'], r['stage'])
+    previous = {key(r): r for r in baseline['results']}
+    regressions = 0
+    for result in results:
+        old = previous.get(key(result))
+        if old is None or old['seconds'] == 0:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        flag = ' REGRESSION' if ratio > threshold else ''
+        regressions += bool(flag)
+        print(f"{result['scenario']:<8} rows={result['rows']:<9} tickers={result['tickers']:<5} "
+              f"{result['stage']:<12} {old['seconds']:.4f}s -> {result['seconds']:.4f}s ({ratio:.2f}x){flag}",
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the detection pipeline on synthetic data.')
+    parser.add_argument('--full', action='store_true', help='Run 250 to 10M rows and 1 to 1,000 tickers.')
+    parser.add_argument('--sizes', type=int, nargs='+', help='Override the row counts.')
+    parser.add_argument('--tickers', type=int, nargs='+', help='Override the ticker counts.')
+    parser.add_argument('--ticker-rows', type=int, default=250, help='Rows per ticker in the ticker scenario.')
+    parser.add_argument('--detector-rows', type=int, default=DETECTOR_ROWS,
+                        help='Rows of the detector comparison (0 to skip it).')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write results as JSON to this file (default: stdout).')
+    parser.add_argument('--compare', help='Baseline JSON from an earlier run to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Slowdown ratio reported as a regression.')
+    args = parser.parse_args()
+
+    sizes = args.sizes or (FULL_SIZES if args.full else QUICK_SIZES)
+    ticker_counts = args.tickers or (FULL_TICKERS if args.full else QUICK_TICKERS)
+
+    results = bench_sizes(sizes, args.repeat, args.seed)
+    results += bench_tickers(ticker_counts, args.ticker_rows, args.repeat, args.seed)
+    if args.detector_rows:
+        results += bench_detectors(args.detector_rows, args.repeat, args.seed)
+    report = {'environment': environment(), 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+
+from anom import clean_data, engineer_features
+from features import DEFAULT_CONFIG, compute_features
+from synthetic import generate_ohlcv
+
+
+def legacy_clean_data(data):
+    # The original clean_data: fill forward, then a SimpleImputer round trip into a new DataFrame
+    data = data.ffill()
+    imputer = SimpleImputer(strategy='mean')
+    data = pd.DataFrame(imputer.fit_transform(data), columns=data.columns, index=data.index)
+    return data.dropna()
+
+
+def legacy_engineer_features(data):
+    # The original engineer_features, column by column, with a fresh StandardScaler
+    data['MA_5'] = data['Close'].rolling(window=5).mean()
+    data['MA_10'] = data['Close'].rolling(window=10).mean()
+    data['Pct_change'] = data['Close'].pct_change()
+    data['MA_5'] = data['MA_5'].fillna(value=data['Close'].mean())
+    data['MA_10'] = data['MA_10'].fillna(value=data['Close'].mean())
+    data['Pct_change'] = data['Pct_change'].fillna(value=data['Pct_change'].mean())
+    scaler = StandardScaler()
+    data['Volume_scaled'] = scaler.fit_transform(data[['Volume']])
+    return data
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the per-row cost of the old and new feature paths.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--tickers', type=int, default=100, help='Series in the stacked 3-D run.')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy ns/row':>15} {'new ns/row':>12} {'speedup':>8}")
+    for rows in args.sizes:
+        data, _ = generate_ohlcv(rows, freq='min', gap_rate=0)
+        legacy = best_time(lambda: legacy_engineer_features(legacy_clean_data(data)), args.repeat)
+        new = best_time(lambda: engineer_features(clean_data(data)), args.repeat)
+        print(f'{rows:>10} {legacy / rows * 1e9:>15.1f} {new / rows * 1e9:>12.1f} {legacy / new:>7.1f}x')
+
+    rows = args.sizes[0]
+    stacked = np.stack([generate_ohlcv(rows, seed, freq='min', gap_rate=0)[0].to_numpy()
+                        for seed in range(args.tickers)])
+    out = np.empty(stacked.shape[:-1] + (stacked.shape[-1] + 4,))
+    seconds = best_time(lambda: compute_features(stacked, 3, 4, DEFAULT_CONFIG, out=out), args.repeat)
+    print(f'Stacked {args.tickers} x {rows} rows: {seconds / stacked[..., 0].size * 1e9:.1f} ns/row')
+
+
+if __name__ == '__main__':
+    main()
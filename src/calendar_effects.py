@@ -0,0 +1,164 @@
+import functools
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay, USMartinLutherKingJr,
+                                    USMemorialDay, USPresidentsDay, USThanksgivingDay, nearest_workday,
+                                    sunday_to_monday)
+
+
+class USMarketCalendar(AbstractHolidayCalendar):
+    """Regular NYSE holidays (unlike the federal calendar: Good Friday closed, Columbus and Veterans Day open)."""
+    rules = [
+        # A Saturday New Year's Day is not made up on the Friday before
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-06-19', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+MARKET_CALENDAR = USMarketCalendar()
+
+
+def _session_dates(index):
+    """Distinct session dates of the bars (wall-clock dates, so intraday bars share their day) and each bar's code."""
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    codes, dates = pd.factorize(index.normalize(), sort=True)
+    return pd.DatetimeIndex(dates), codes
+
+
+def _sessions(start, end):
+    """Trading days of the market calendar between start and end, inclusive."""
+    return pd.bdate_range(start, end, freq='C', holidays=MARKET_CALENDAR.holidays(start, end))
+
+
+def _position_in_period(dates, period):
+    """
+    Position of each date from the start and from the end of its calendar period, counted in
+    trading days of the whole period, so partial periods at either end of the data and gaps
+    in it do not shift which days count as the first or last of a month.
+    """
+    sessions = _sessions(dates[0].to_period(period).start_time, dates[-1].to_period(period).end_time.normalize())
+    # Bars on unscheduled dates still get a position
+    sessions = sessions.union(dates)
+    codes = pd.factorize(sessions.to_period(period))[0]
+    counts = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    from_start = np.arange(len(sessions)) - starts[codes]
+    from_end = counts[codes] - 1 - from_start
+    rows = sessions.get_indexer(dates)
+    return from_start[rows], from_end[rows]
+
+
+def by_session(mask):
+    """Evaluates a mask of session dates once per day and spreads it over every bar of that day."""
+    @functools.wraps(mask)
+    def per_bar(index, **kwargs):
+        if len(index) == 0:
+            return np.zeros(0, dtype=bool)
+        dates, codes = _session_dates(index)
+        return np.asarray(mask(dates, **kwargs))[codes]
+    return per_bar
+
+
+def january(index):
+    return index.month == 1
+
+
+def day_of_week(day):
+    def mask(index):
+        return index.dayofweek == day
+    return mask
+
+
+@by_session
+def turn_of_month(dates, days_before=1, days_after=3):
+    # Last trading day of a month plus the first three of the next one
+    from_start, from_end = _position_in_period(dates, 'M')
+    return (from_end < days_before) | (from_start < days_after)
+
+
+@by_session
+def pre_holiday(dates):
+    # Trading days directly before a market holiday
+    holidays = MARKET_CALENDAR.holidays(dates.min(), dates.max() + pd.Timedelta(days=7))
+    return (dates + pd.offsets.BDay(1)).isin(holidays)
+
+
+@by_session
+def quarter_end(dates, days=5):
+    # Last five trading days of each quarter
+    _, from_end = _position_in_period(dates, 'Q')
+    return from_end < days
+
+
+EFFECTS = {
+    'january': ('January Effect', january),
+    'weekend': ('Weekend Effect (Mondays)', day_of_week(0)),
+    'friday': ('Friday Effect', day_of_week(4)),
+    'turn_of_month': ('Turn-of-the-Month Effect', turn_of_month),
+    'pre_holiday': ('Pre-Holiday Effect', pre_holiday),
+    'quarter_end': ('Quarter-End Effect', quarter_end),
+}
+
+
+def effect_masks(index, effects=None):
+    """
+    Evaluates every effect over one DatetimeIndex.
+    :param effects: Effect names from EFFECTS. Defaults to all of them.
+    :return: Boolean array of shape (n_effects, n_rows) and the effect names in row order.
+    """
+    effects = list(effects) if effects is not None else list(EFFECTS)
+    masks = np.empty((len(effects), len(index)), dtype=bool)
+    for i, name in enumerate(effects):
+        masks[i] = EFFECTS[name][1](index)
+    return masks, effects
+
+
+def analyze_calendar_effects(data, effects=None):
+    """
+    Compares anomaly rates and returns inside and outside each calendar effect.
+
+    The data is scored once (it must already have an 'anomaly' column from
+    detect_anomalies); each effect is just a boolean mask over the same index, so all
+    effects are summarized with a few matrix products instead of a refit per effect.
+    :param data: Featured DataFrame with 'anomaly' and 'Pct_change' columns.
+    :param effects: Effect names from EFFECTS. Defaults to all of them.
+    :return: DataFrame indexed by effect name.
+    """
+    masks, effects = effect_masks(data.index, effects)
+    inside = masks.astype(float)
+    outside = 1.0 - inside
+    is_anomaly = (data['anomaly'].to_numpy() == -1).astype(float)
+    returns = data['Pct_change'].to_numpy(dtype=float)
+
+    days_in = inside.sum(axis=1)
+    days_out = outside.sum(axis=1)
+    anomalies_in = inside @ is_anomaly
+    anomalies_out = outside @ is_anomaly
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary = pd.DataFrame({
+            'label': [EFFECTS[name][0] for name in effects],
+            'days_in': days_in.astype(int),
+            'anomalies_in': anomalies_in.astype(int),
+            'anomalies_out': anomalies_out.astype(int),
+            'anomaly_rate_in': anomalies_in / days_in,
+            'anomaly_rate_out': anomalies_out / days_out,
+            'mean_return_in': (inside @ returns) / days_in,
+            'mean_return_out': (outside @ returns) / days_out,
+        }, index=pd.Index(effects, name='effect'))
+    return summary
+
+
+def analyze_universe(featured_by_ticker, effects=None):
+    """Runs analyze_calendar_effects for each ticker and stacks the results."""
+    frames = {ticker: analyze_calendar_effects(data, effects) for ticker, data in featured_by_ticker.items()}
+    return pd.concat(frames, names=['ticker'])
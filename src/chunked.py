@@ -0,0 +1,228 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from features import DEFAULT_CONFIG, compute_features, feature_names
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+def chunk_source(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Makes a re-iterable source of row blocks, since every pass reads the series again.
+    :param source: A DataFrame, or the path of a Parquet file such as the store's <ticker>.parquet.
+    :return: Zero-argument function returning an iterator of DataFrame blocks in row order.
+    """
+    if isinstance(source, pd.DataFrame):
+        return lambda: (source.iloc[start:start + chunk_size] for start in range(0, len(source), chunk_size))
+
+    def read_parquet():
+        # The pandas metadata in the file restores the Date index on every batch
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    return read_parquet
+
+
+def _warmups(config, n_rows):
+    """
+    Feature name -> (warm-up rows, fill kind) the way compute_features fills them.
+    Fill kind is 'close_mean', 'valid_mean' (mean of the feature's own valid values) or a constant
+    used when the series is shorter than the window.
+    """
+    warmups = {}
+    for w in config.ma_windows:
+        warmups[f'MA_{w}'] = (w - 1, 'close_mean')
+    if config.pct_change:
+        warmups['Pct_change'] = (1, 'valid_mean')
+    for w in config.volatility_windows:
+        warmups[f'Volatility_{w}'] = (w, 'valid_mean' if w + 1 <= n_rows else 0.0)
+    for w in config.rsi_windows:
+        warmups[f'RSI_{w}'] = (w, 'valid_mean' if w + 1 <= n_rows else 50.0)
+    for w in config.volume_zscore_windows:
+        warmups[f'Volume_z_{w}'] = (w - 1, 'valid_mean' if w <= n_rows else 0.0)
+    return warmups
+
+
+def _overlap(config):
+    # Rows of history every block needs for exact rolling windows (plus one for returns)
+    windows = (config.ma_windows + config.volatility_windows + config.rsi_windows
+               + config.volume_zscore_windows)
+    return max(windows, default=1) + 1
+
+
+def _clean_blocks(blocks, column_means):
+    """
+    Cleans blocks like anom.clean_data: forward fill carried across blocks, then the
+    column means of the whole series for the leading gaps.
+    """
+    last = None
+    for block in blocks:
+        if last is not None:
+            block = pd.concat([last, block])
+            block = block.ffill().iloc[1:]
+        else:
+            block = block.ffill()
+        if block.isnull().values.any():
+            block = block.fillna(column_means)
+        last = block.iloc[-1:]
+        yield block
+
+
+def _blocks_with_context(blocks, overlap):
+    """Yields (position of the block's first row, block with up to `overlap` preceding rows, context rows)."""
+    tail = None
+    position = 0
+    for block in blocks:
+        context = 0 if tail is None else len(tail)
+        yield position, block if tail is None else pd.concat([tail, block]), context
+        position += len(block)
+        tail = (block if tail is None else pd.concat([tail, block])).iloc[-overlap:]
+
+
+def global_stats(read_blocks, config=DEFAULT_CONFIG):
+    """
+    The whole-series statistics the in-memory path takes over the full DataFrame, in streaming passes.
+
+    Pass one counts the rows and finds the column means used by clean_data for leading
+    gaps (the mean of the forward-filled values). Pass two runs the cleaned blocks through compute_features
+    with overlapping rows and accumulates the mean Close, the mean and standard deviation
+    of Volume (the Volume_scaled scaler) and the mean of every feature's valid values,
+    which compute_features uses to fill warm-up rows.
+    :param read_blocks: Function returning an iterator of blocks, see chunk_source.
+    :return: Dict of statistics for score_chunks, or None if some column has no data at all.
+    """
+    sums, counts, last = None, None, None
+    columns = None
+    n_rows = 0
+    for block in read_blocks():
+        n_rows += len(block)
+        if last is not None:
+            block = pd.concat([last, block]).ffill().iloc[1:]
+        else:
+            block = block.ffill()
+            columns = block.columns
+        block_sums, block_counts = block.sum(), block.count()
+        sums = block_sums if sums is None else sums + block_sums
+        counts = block_counts if counts is None else counts + block_counts
+        last = block.iloc[-1:]
+    if columns is None or (counts == 0).any():
+        return None
+    column_means = sums / counts
+
+    close_col, volume_col = columns.get_loc('Close'), columns.get_loc('Volume')
+    names = feature_names(config)
+    warmups = _warmups(config, n_rows)
+    feature_sums = dict.fromkeys(names, 0.0)
+    feature_counts = dict.fromkeys(names, 0)
+    close_sum = volume_sum = volume_squares = 0.0
+
+    blocks = _clean_blocks(read_blocks(), column_means)
+    for position, block, context in _blocks_with_context(blocks, _overlap(config)):
+        values = block.to_numpy(dtype=float)
+        close_sum += values[context:, close_col].sum()
+        volume = values[context:, volume_col]
+        volume_sum += volume.sum()
+        volume_squares += (volume * volume).sum()
+
+        featured = compute_features(values, close_col, volume_col, config)[context:, len(columns):]
+        for j, name in enumerate(names):
+            if name not in warmups:
+                continue
+            # Only rows past the series' own warm-up hold valid rolling values
+            first_valid = max(warmups[name][0] - position, 0)
+            feature_sums[name] += featured[first_valid:, j].sum()
+            feature_counts[name] += max(len(featured) - first_valid, 0)
+
+    volume_mean = volume_sum / n_rows
+    volume_std = np.sqrt(max(volume_squares / n_rows - volume_mean * volume_mean, 0.0))
+    fills = {}
+    for name, (_, kind) in warmups.items():
+        if kind == 'close_mean':
+            fills[name] = close_sum / n_rows
+        elif kind == 'valid_mean':
+            fills[name] = feature_sums[name] / feature_counts[name] if feature_counts[name] else 0.0
+        else:
+            fills[name] = kind
+    return {
+        'rows': n_rows,
+        'column_means': column_means,
+        'volume_mean': volume_mean,
+        'volume_std': volume_std if volume_std != 0 else 1.0,
+        'fills': fills,
+    }
+
+
+def feature_chunks(read_blocks, stats, config=DEFAULT_CONFIG):
+    """
+    Yields engineer_features output block by block, equal to engineer_features(clean_data(series))
+    of the whole series within float tolerance.
+    """
+    names = feature_names(config)
+    warmups = _warmups(config, stats['rows'])
+    blocks = _clean_blocks(read_blocks(), stats['column_means'])
+    for position, block, context in _blocks_with_context(blocks, _overlap(config)):
+        columns = list(block.columns)
+        close_col, volume_col = block.columns.get_loc('Close'), block.columns.get_loc('Volume')
+        matrix = compute_features(block.to_numpy(dtype=float), close_col, volume_col, config)[context:]
+        featured = pd.DataFrame(matrix, index=block.index[context:], columns=columns + names)
+
+        # Whole-series scaling and warm-up fills instead of the block-local ones
+        if config.volume_scaled:
+            featured['Volume_scaled'] = (featured['Volume'] - stats['volume_mean']) / stats['volume_std']
+        for name, (rows, _) in warmups.items():
+            if position < rows:
+                featured.iloc[:rows - position, featured.columns.get_loc(name)] = stats['fills'][name]
+        yield featured
+
+
+def score_chunks(source, model, chunk_size=DEFAULT_CHUNK_SIZE, config=DEFAULT_CONFIG):
+    """
+    Scores a series larger than memory with a pre-fitted model, one block at a time.
+    :param source: DataFrame or Parquet path, see chunk_source.
+    :param model: Fitted detector (e.g. from anom.fit_model on a recent window).
+    :return: Iterator of featured blocks with 'score' and 'anomaly' columns, like anom.score_anomalies.
+    """
+    read_blocks = chunk_source(source, chunk_size)
+    stats = global_stats(read_blocks, config)
+    if stats is None:
+        return
+    for featured in feature_chunks(read_blocks, stats, config):
+        scores = model.score_samples(featured)
+        featured['score'] = scores
+        featured['anomaly'] = np.where(scores < model.offset_, -1, 1)
+        yield featured
+
+
+def detect_chunked(source, model, chunk_size=DEFAULT_CHUNK_SIZE, config=DEFAULT_CONFIG):
+    """
+    Out-of-core counterpart of anom.detect_anomalies with a pre-fitted model.
+    :return: The anomalous rows of the whole series.
+    """
+    anomalies = [scored[scored['anomaly'] == -1].drop(columns='score')
+                 for scored in score_chunks(source, model, chunk_size, config)]
+    return pd.concat(anomalies) if anomalies else pd.DataFrame()
+
+
+def main():
+    from anom import clean_data, engineer_features, fit_model
+
+    parser = argparse.ArgumentParser(description='Detect anomalies in a Parquet series block by block.')
+    parser.add_argument('path', help='Parquet file, e.g. data/ohlcv/AAPL.parquet')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--fit-rows', type=int, default=100_000, help='Rows of the first block the model is fitted on.')
+    parser.add_argument('--output', default='anomalies.csv')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    first_block = next(chunk_source(args.path, args.fit_rows)())
+    model = fit_model(engineer_features(clean_data(first_block)))
+    anomalies = detect_chunked(args.path, model, args.chunk_size)
+    anomalies.to_csv(args.output)
+    print(f'{len(anomalies)} anomalies written to {args.output} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
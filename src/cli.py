@@ -0,0 +1,102 @@
+import argparse
+import json
+import sys
+from datetime import date, timedelta
+
+from batch import OUTPUT_FORMATS, run_batch
+from detectors import DETECTORS
+
+# Exit codes for schedulers: 0 all tickers ok, 1 some ticker failed
+EXIT_OK = 0
+EXIT_FAILURES = 1
+
+
+def parse_param(text):
+    """'window=50' -> ('window', 50); values are read as JSON when possible, else kept as strings."""
+    key, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f'expected KEY=VALUE, got {text!r}')
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def read_tickers(tickers, tickers_file=None):
+    """Tickers from the command line plus one per line from a file (blank lines and # comments skipped)."""
+    tickers = list(tickers)
+    if tickers_file:
+        with open(tickers_file) as f:
+            tickers += [line.split('#')[0].strip() for line in f if line.split('#')[0].strip()]
+    # Keep the first occurrence of each ticker
+    return list(dict.fromkeys(tickers))
+
+
+def detector_config(name, params):
+    """
+    Detector config from --detector and --param, or None when neither was given, so the default
+    IsolationForest path (and tune_model's n_estimators grid) is used.
+    """
+    if name is None and not params:
+        return None
+    return {'name': name or 'isolation_forest', **dict(params)}
+
+
+def print_report(results, file=sys.stdout):
+    """One line per ticker: status, rows, anomalies, total seconds and the error if any."""
+    print(f"{'ticker':<10}{'status':<8}{'rows':>8}{'anomalies':>11}{'seconds':>10}  error", file=file)
+    for result in sorted(results, key=lambda r: r['ticker']):
+        seconds = sum(result['timings'].values())
+        print(f"{result['ticker']:<10}{result['status']:<8}{result['rows']:>8}{result['anomalies']:>11}"
+              f"{seconds:>10.2f}  {result['error'] or ''}", file=file)
+
+
+def build_parser():
+    today = date.today()
+    parser = argparse.ArgumentParser(
+        description='Detect anomalies for a ticker universe without a display, e.g. from cron.',
+        epilog='Exit status is 0 when every ticker succeeded and 1 otherwise; see summary.json in the output dir.'
+    )
+    parser.add_argument('tickers', nargs='*', help='Ticker symbols.')
+    parser.add_argument('--tickers-file', help='File with one ticker per line.')
+    parser.add_argument('--start', default=(today - timedelta(days=365)).isoformat(),
+                        help='First date (default: one year ago).')
+    parser.add_argument('--end', default=today.isoformat(), help='End date, exclusive (default: today).')
+    parser.add_argument('--detector', default=None, choices=sorted(DETECTORS),
+                        help='Detector backend (default: IsolationForest).')
+    parser.add_argument('--param', type=parse_param, action='append', default=[], metavar='KEY=VALUE',
+                        help='Detector parameter, repeatable, e.g. --param contamination=0.02.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+    parser.add_argument('--chunk-size', type=int, default=10, help='Tickers per task.')
+    parser.add_argument('--format', dest='output_format', default='parquet', choices=OUTPUT_FORMATS)
+    parser.add_argument('--output-dir', default='output')
+    parser.add_argument('--plot', action='store_true', help='Also write a PNG chart per ticker.')
+    parser.add_argument('--tune', action='store_true',
+                        help="Detect with each ticker's tune_model pick instead of the default model.")
+    parser.add_argument('--registry', help="Score with the tickers' current registered models (see registry.py).")
+    parser.add_argument('--allow-empty', action='store_true', help='Do not count tickers without data as failures.')
+    parser.add_argument('--quiet', action='store_true', help='Only print failed tickers.')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    tickers = read_tickers(args.tickers, args.tickers_file)
+    if not tickers:
+        print('No tickers given.', file=sys.stderr)
+        return EXIT_FAILURES
+
+    detector = detector_config(args.detector, args.param)
+    results, summary = run_batch(tickers, args.start, args.end, args.output_dir, args.workers, args.chunk_size,
+                                 args.tune, args.plot, detector, args.output_format, args.registry)
+
+    failed_statuses = {'error'} if args.allow_empty else {'error', 'empty'}
+    failures = [result for result in results if result['status'] in failed_statuses]
+    print_report(failures if args.quiet else results)
+    print(f"{summary['tickers']} tickers, {summary['anomalies']} anomalies, {len(failures)} failed "
+          f"in {summary['wall_time']:.1f}s; results in {args.output_dir}")
+    return EXIT_FAILURES if failures else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import argparse
+import os
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from anom import clean_data, engineer_features, detect_anomalies, fit_model
+from features import DEFAULT_CONFIG, compute_features, feature_names
+from store import load_ohlcv
+
+DEFAULT_ARRAY_DIR = os.environ.get(
+    'ANOM_ARRAY_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'arrays')
+)
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+DTYPE = np.float32
+
+
+def to_arrays(data, dtype=DTYPE):
+    """
+    Splits an OHLCV DataFrame into an int64 epoch-nanosecond index and a compact value matrix.
+    :return: index array of shape (rows,), values array of shape (rows, 5)
+    """
+    index = data.index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    return index, data[OHLCV_COLUMNS].to_numpy(dtype=dtype)
+
+
+def write_arrays(ticker, data, array_dir=DEFAULT_ARRAY_DIR, dtype=DTYPE):
+    """Writes <ticker>.index.npy and <ticker>.values.npy so later runs can memory-map them."""
+    os.makedirs(array_dir, exist_ok=True)
+    index, values = to_arrays(data, dtype)
+    np.save(os.path.join(array_dir, f'{ticker}.index.npy'), index)
+    np.save(os.path.join(array_dir, f'{ticker}.values.npy'), values)
+
+
+def load_arrays(ticker, array_dir=DEFAULT_ARRAY_DIR, mode='c'):
+    """
+    Memory-maps the arrays written by write_arrays.
+    :param mode: numpy mmap mode. The default 'c' is copy-on-write: pages are read from
+        disk lazily, and only the pages clean_values actually writes get copied into memory.
+    :return: index, values
+    """
+    index = np.load(os.path.join(array_dir, f'{ticker}.index.npy'), mmap_mode='r')
+    values = np.load(os.path.join(array_dir, f'{ticker}.values.npy'), mmap_mode=mode)
+    return index, values
+
+
+def export_ticker(ticker, start_date, end_date, array_dir=DEFAULT_ARRAY_DIR):
+    """Loads one ticker through the store and writes its compact arrays."""
+    write_arrays(ticker, load_ohlcv(ticker, start_date, end_date), array_dir)
+
+
+def clean_values(values):
+    """
+    Same rules as anom.clean_data (forward fill, then the column mean for leading gaps) but
+    in place, one column at a time, and only for the columns that have gaps at all.
+    :return: values, or an empty slice of it if some column has no data (clean_data drops every row then).
+    """
+    n_rows = len(values)
+    for j in range(values.shape[1]):
+        column = values[:, j]
+        missing = np.isnan(column)
+        if not missing.any():
+            continue
+        if missing.all():
+            return values[:0]
+        positions = np.where(missing, 0, np.arange(n_rows))
+        np.maximum.accumulate(positions, out=positions)
+        column[missing] = column[positions[missing]]
+        # Leading gaps have nothing to carry forward
+        leading = np.isnan(column)
+        column[leading] = column[~leading].mean()
+    return values
+
+
+def compact_features(values, config=DEFAULT_CONFIG, dtype=DTYPE):
+    """Raw columns plus features in a single preallocated matrix of the compact dtype."""
+    out = np.empty((len(values), len(OHLCV_COLUMNS) + len(feature_names(config))), dtype=dtype)
+    return compute_features(values, OHLCV_COLUMNS.index('Close'), OHLCV_COLUMNS.index('Volume'), config, out=out)
+
+
+def compact_pipeline(index, values, model=None, config=DEFAULT_CONFIG, detector=None):
+    """
+    clean -> features -> score without pandas frames or intermediate copies.
+
+    The only large allocation is the float32 feature matrix; cleaning writes into
+    values, scoring adds one float per row, and anomalies are returned as row positions
+    rather than sliced frames.
+    :param index: int64 epoch-nanosecond index, e.g. from load_arrays.
+    :param values: Float OHLCV matrix, e.g. a copy-on-write memory map from load_arrays.
+    :param model: Already fitted detector to use. If None, one is fitted on the features.
+    :param detector: Backend for the new model, see anom.fit_model.
+    :return: Dict with 'index', 'features', 'scores', 'anomaly' (int8, -1/1) and 'positions' of the anomalies.
+    """
+    values = clean_values(values)
+    index = index[:len(values)]
+    features = compact_features(values, config)
+    if model is None:
+        model = fit_model(features, detector=detector)
+    scores = model.score_samples(features)
+    anomaly = np.where(scores < model.offset_, -1, 1).astype(np.int8)
+    return {
+        'index': index,
+        'features': features,
+        'scores': scores,
+        'anomaly': anomaly,
+        'positions': np.flatnonzero(anomaly == -1),
+    }
+
+
+def anomalies_frame(result, config=DEFAULT_CONFIG):
+    """The anomalous rows of a compact_pipeline result as a DataFrame, like detect_anomalies returns."""
+    positions = result['positions']
+    index = pd.DatetimeIndex(result['index'][positions].astype('datetime64[ns]'), name='Date')
+    anomalies = pd.DataFrame(result['features'][positions], index=index,
+                             columns=OHLCV_COLUMNS + feature_names(config))
+    anomalies['anomaly'] = -1
+    return anomalies
+
+
+def _peak(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def memory_report(rows, array_dir, seed=0):
+    """
+    Peak traced memory of the pandas pipeline vs the compact one on the same synthetic series.
+    The memory-mapped input is not counted for the compact path, since it is paged in from disk.
+    :return: Dict of peak bytes per path.
+    """
+    from synthetic import generate_ohlcv
+
+    # No drift, so ten million minute bars stay well inside the float32 range
+    data, _ = generate_ohlcv(rows, seed=seed, freq='min', drift=0.0)
+    data = data[OHLCV_COLUMNS]
+    write_arrays('BENCH', data, array_dir)
+    del data
+
+    def pandas_path():
+        data = pd.DataFrame(dict(zip(OHLCV_COLUMNS, np.load(os.path.join(array_dir, 'BENCH.values.npy'),
+                                                           mmap_mode='r').T.astype(float))))
+        detect_anomalies(engineer_features(clean_data(data)), model=model)
+
+    def compact_path():
+        compact_pipeline(*load_arrays('BENCH', array_dir), model=model)
+
+    # Fit once up front so both paths only pay for data handling and scoring
+    model = fit_model(compact_features(clean_values(load_arrays('BENCH', array_dir)[1])))
+    return {'rows': rows, 'pandas_peak_bytes': _peak(pandas_path), 'compact_peak_bytes': _peak(compact_path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare peak memory of the pandas and compact pipelines.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--array-dir', default=DEFAULT_ARRAY_DIR)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        report = memory_report(rows, args.array_dir)
+        pandas_mib = report['pandas_peak_bytes'] / 2**20
+        compact_mib = report['compact_peak_bytes'] / 2**20
+        print(f'rows={rows:>10} pandas {pandas_mib:9.1f} MiB  compact {compact_mib:9.1f} MiB  '
+              f'({pandas_mib / compact_mib:.1f}x less)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from cli import read_tickers
+from features import DEFAULT_CONFIG, compute_features, feature_names
+from fingerprint import default_seed
+from instrumentation import timed
+from store import load_ohlcv
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def _fill_along_dates(values):
+    """Forward fills NaNs along the dates axis of a (tickers, dates, columns) array, then back fills the head."""
+    n_dates = values.shape[1]
+    missing = np.isnan(values)
+    positions = np.where(missing, 0, np.arange(n_dates)[None, :, None])
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    filled = np.take_along_axis(values, positions, axis=1)
+
+    # Leading gaps (before a ticker's first bar) take the first valid value
+    first_valid = np.argmax(~np.isnan(filled), axis=1)
+    head = np.take_along_axis(filled, first_valid[:, None, :], axis=1)
+    return np.where(np.isnan(filled), head, filled)
+
+
+def stack_universe(frames):
+    """
+    Aligns per-ticker OHLCV frames on the union of their dates.
+    :param frames: Dict of ticker -> OHLCV DataFrame.
+    :return: tickers, dates, values of shape (tickers, dates, 5), present mask of shape (tickers, dates)
+    """
+    frames = {ticker: frame for ticker, frame in frames.items() if not frame.empty}
+    tickers = list(frames)
+    dates = pd.DatetimeIndex(sorted(set().union(*(frame.index for frame in frames.values()))))
+
+    values = np.full((len(tickers), len(dates), len(OHLCV_COLUMNS)), np.nan)
+    for i, frame in enumerate(frames.values()):
+        values[i, dates.get_indexer(frame.index)] = frame[OHLCV_COLUMNS].to_numpy(dtype=float)
+    present = ~np.isnan(values[..., OHLCV_COLUMNS.index('Close')])
+    return tickers, dates, values, present
+
+
+@timed('cross_sectional_features')
+def cross_sectional_features(frames, market=None):
+    """
+    Builds one feature matrix for a whole universe, one row per (date, ticker).
+
+    All tickers are stacked into a single (tickers, dates, columns) array and run
+    through compute_features at once. Price levels are turned into scale-free
+    features (returns, distance from the moving averages, per-ticker volume z-score)
+    so the rows of different tickers are comparable.
+    :param frames: Dict of ticker -> OHLCV DataFrame.
+    :param market: Optional OHLCV DataFrame of a market index (e.g. NDX or NYA). Adds
+        Excess_return, each ticker's return minus the market's on the same date.
+    :return: DataFrame indexed by (date, ticker).
+    """
+    tickers, dates, values, present = stack_universe(frames)
+    featured = compute_features(_fill_along_dates(values), OHLCV_COLUMNS.index('Close'),
+                                OHLCV_COLUMNS.index('Volume'), DEFAULT_CONFIG)
+    column = {name: len(OHLCV_COLUMNS) + i for i, name in enumerate(feature_names(DEFAULT_CONFIG))}
+    close = featured[..., OHLCV_COLUMNS.index('Close')]
+
+    # Scale-free, so one model can compare a $10 stock with a $3,000 one
+    columns = {
+        'Pct_change': featured[..., column['Pct_change']],
+        'MA_5_gap': featured[..., column['MA_5']] / close - 1.0,
+        'MA_10_gap': featured[..., column['MA_10']] / close - 1.0,
+        'Volume_scaled': featured[..., column['Volume_scaled']],
+    }
+    if market is not None:
+        market_close = market['Close'].reindex(dates).ffill().bfill().to_numpy(dtype=float)
+        market_return = np.zeros(len(dates))
+        market_return[1:] = market_close[1:] / market_close[:-1] - 1.0
+        columns['Excess_return'] = columns['Pct_change'] - market_return[None, :]
+
+    # Keep only the (ticker, date) pairs that actually had a bar
+    ticker_idx, date_idx = np.nonzero(present)
+    index = pd.MultiIndex.from_arrays([dates[date_idx], np.asarray(tickers)[ticker_idx]], names=['date', 'ticker'])
+    data = pd.DataFrame({name: values_[ticker_idx, date_idx] for name, values_ in columns.items()}, index=index)
+    return data.sort_index()
+
+
+@timed('detect_cross_sectional')
+def detect_cross_sectional(data, sectors=None, n_estimators=100, contamination=0.01, random_state=None):
+    """
+    Fits one IsolationForest on the whole universe (or one per sector) and scores every row in one call.
+    :param data: Output of cross_sectional_features.
+    :param sectors: Optional dict of ticker -> sector; tickers without a sector share one model.
+    :return: Copy of data with 'score' and 'anomaly' columns.
+    """
+    if sectors:
+        groups = data.index.get_level_values('ticker').map(lambda ticker: sectors.get(ticker, '')).to_numpy()
+    else:
+        groups = np.zeros(len(data), dtype=int)
+
+    features = data.to_numpy(dtype=float)
+    scores = np.empty(len(data))
+    labels = np.empty(len(data), dtype=int)
+    for group in pd.unique(groups):
+        rows = groups == group
+        # Each sector gets its own seed, derived from the sector and params unless one was given
+        seed = default_seed(random_state, str(group), n_estimators, contamination)
+        model = IsolationForest(n_estimators=n_estimators, contamination=contamination, random_state=seed)
+        model.fit(features[rows])
+        scores[rows] = model.score_samples(features[rows])
+        labels[rows] = np.where(scores[rows] < model.offset_, -1, 1)
+
+    scored = data.copy()
+    scored['score'] = scores
+    scored['anomaly'] = labels
+    return scored
+
+
+def run_cross_section(tickers, start_date, end_date, market_ticker=None, sectors=None, **params):
+    """
+    Loads a universe through the store and scores it cross-sectionally.
+    :param market_ticker: Optional index ticker for market-relative returns, e.g. 'NDX' or 'NYA'.
+    :return: Scored DataFrame indexed by (date, ticker).
+    """
+    frames = {ticker: load_ohlcv(ticker, start_date, end_date) for ticker in tickers}
+    market = load_ohlcv(market_ticker, start_date, end_date) if market_ticker else None
+    if market is not None and market.empty:
+        market = None
+    return detect_cross_sectional(cross_sectional_features(frames, market), sectors, **params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a ticker universe with one cross-sectional model.')
+    parser.add_argument('tickers', nargs='*')
+    parser.add_argument('--tickers-file', help='File with one ticker per line (# starts a comment).')
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--market', default=None, help='Index ticker for market-relative returns, e.g. NDX or NYA.')
+    parser.add_argument('--output', default='cross_section.csv')
+    args = parser.parse_args()
+
+    tickers = read_tickers(args.tickers, args.tickers_file)
+
+    start = time.perf_counter()
+    scored = run_cross_section(tickers, args.start, args.end, market_ticker=args.market)
+    anomalies = scored[scored['anomaly'] == -1].sort_values('score')
+    anomalies.to_csv(args.output)
+    print(f'Scored {len(scored)} bars for {len(tickers)} tickers in {time.perf_counter() - start:.1f}s, '
+          f'{len(anomalies)} anomalies written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+# Scale factor that makes the MAD a consistent estimator of the standard deviation
+MAD_SCALE = 1.4826
+EPS = 1e-12
+
+
+class Detector:
+    """
+    Common interface of the anomaly detector backends.
+
+    Follows the IsolationForest conventions so every backend can be passed as `model`
+    to detect_anomalies and score_anomalies: score_samples is lower for more anomalous
+    rows, and a row is an anomaly when its score falls below offset_, which fit sets
+    from the contamination (the expected share of anomalies) unless a fixed threshold
+    is given.
+    """
+    name = None
+
+    def __init__(self, contamination=0.01, threshold=None):
+        self.contamination = contamination
+        self.threshold = threshold
+        self.offset_ = None
+
+    def _fit(self, values):
+        pass
+
+    def _score(self, values):
+        raise NotImplementedError
+
+    def fit(self, data):
+        values = np.asarray(data, dtype=float)
+        self._fit(values)
+        if self.threshold is not None:
+            self.offset_ = -float(self.threshold)
+        else:
+            self.offset_ = float(np.percentile(self._score(values), 100.0 * self.contamination))
+        return self
+
+    def score_samples(self, data):
+        return self._score(np.asarray(data, dtype=float))
+
+    def predict(self, data):
+        return np.where(self.score_samples(data) < self.offset_, -1, 1)
+
+    def fit_predict(self, data):
+        return self.fit(data).predict(data)
+
+    def __repr__(self):
+        params = ', '.join(f'{key}={value!r}' for key, value in vars(self).items() if not key.endswith('_'))
+        return f'{type(self).__name__}({params})'
+
+
+class IsolationForestDetector(Detector):
+    """The original detector: an sklearn IsolationForest fitted on the feature rows."""
+    name = 'isolation_forest'
+
+    def __init__(self, n_estimators=100, contamination=0.01, random_state=None, n_jobs=None):
+        super().__init__(contamination)
+        self.n_estimators = n_estimators
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.model_ = None
+
+    def fit(self, data):
+        self.model_ = IsolationForest(n_estimators=self.n_estimators, contamination=self.contamination,
+                                      random_state=self.random_state, n_jobs=self.n_jobs)
+        # No float64 copy: sklearn's trees work in float32 and convert on their own
+        self.model_.fit(np.asarray(data))
+        self.offset_ = self.model_.offset_
+        return self
+
+    def score_samples(self, data):
+        return self.model_.score_samples(np.asarray(data))
+
+
+class RobustZScoreDetector(Detector):
+    """
+    Rolling robust z-score: how many (MAD-scaled) deviations each value sits from the
+    median of the preceding `window` rows, per column. The row score is minus the
+    largest absolute z-score. Nothing is learned; fit only places the threshold.
+
+    The MAD is taken as the rolling median of each row's deviation from its own rolling
+    median, which keeps the whole computation to two vectorized rolling medians.
+    :param window: Number of preceding rows the median and MAD are taken over.
+    :param threshold: Optional fixed z-score cut-off (e.g. 3.5) instead of the contamination.
+    """
+    name = 'robust_zscore'
+
+    def __init__(self, window=20, contamination=0.01, threshold=None):
+        super().__init__(contamination, threshold)
+        self.window = window
+
+    def _score(self, values):
+        frame = pd.DataFrame(values)
+        # Shifted by one so a spike does not inflate its own baseline
+        median = frame.rolling(self.window, min_periods=2).median().shift(1)
+        deviation = (frame - median).abs()
+        mad = deviation.rolling(self.window, min_periods=2).median().shift(1)
+        # A zero MAD (e.g. the first rows) leaves the z-score undefined rather than infinite
+        z = (deviation / (MAD_SCALE * mad.where(mad > EPS))).to_numpy()
+        return -np.nan_to_num(z, nan=0.0).max(axis=1)
+
+
+class EWMACusumDetector(Detector):
+    """
+    EWMA/CUSUM change detector. Each column is standardized against its exponentially
+    weighted mean and variance up to the previous row, and two-sided CUSUM statistics
+    accumulate the standardized residuals beyond the slack `drift`. The row score is
+    minus the largest CUSUM statistic, so both isolated spikes and sustained shifts
+    in level score low.
+
+    The CUSUM recursion S_t = max(0, S_{t-1} + x_t) is evaluated without a Python
+    loop as C_t - min(0, min_{s<=t} C_s), with C the cumulative sum of x.
+    :param alpha: EWMA smoothing factor.
+    :param drift: CUSUM slack in standard deviations; residuals smaller than this drain the statistic.
+    """
+    name = 'ewma_cusum'
+
+    def __init__(self, alpha=0.1, drift=2.0, contamination=0.01, threshold=None):
+        super().__init__(contamination, threshold)
+        self.alpha = alpha
+        self.drift = drift
+
+    @staticmethod
+    def _cusum(increments):
+        total = np.cumsum(increments, axis=0)
+        return total - np.minimum(np.minimum.accumulate(total, axis=0), 0.0)
+
+    def _score(self, values):
+        frame = pd.DataFrame(values)
+        ewm = frame.ewm(alpha=self.alpha, adjust=False)
+        mean = ewm.mean().shift(1)
+        std = np.sqrt(ewm.var(bias=True).shift(1))
+        residual = ((frame - mean) / std.where(std > EPS)).to_numpy()
+        residual = np.nan_to_num(residual, nan=0.0)
+
+        upper = self._cusum(residual - self.drift)
+        lower = self._cusum(-residual - self.drift)
+        return -np.maximum(upper, lower).max(axis=1)
+
+
+class HBOSDetector(Detector):
+    """
+    Histogram-based outlier score: one histogram per column, learned on the training
+    rows, and a row scores the sum of the log densities of its values (low when any
+    value falls in a sparse or empty bin). Values outside the training range get the
+    density of an empty bin.
+    :param n_bins: Bins per column histogram.
+    """
+    name = 'hbos'
+
+    def __init__(self, n_bins=20, contamination=0.01, threshold=None):
+        super().__init__(contamination, threshold)
+        self.n_bins = n_bins
+        self.edges_ = None
+        self.log_density_ = None
+
+    def _fit(self, values):
+        self.edges_ = []
+        self.log_density_ = []
+        for column in values.T:
+            counts, edges = np.histogram(column, bins=self.n_bins)
+            # One pseudo-count keeps empty bins (and out-of-range values) finite
+            density = (counts + 1.0) / (len(column) + self.n_bins + 1.0)
+            self.edges_.append(edges)
+            self.log_density_.append(np.log(np.append(density, 1.0 / (len(column) + self.n_bins + 1.0))))
+
+    def _score(self, values):
+        scores = np.zeros(len(values))
+        for j, (edges, log_density) in enumerate(zip(self.edges_, self.log_density_)):
+            bins = np.searchsorted(edges, values[:, j], side='right') - 1
+            # The right edge belongs to the last bin; anything outside the edges to the empty slot
+            bins[values[:, j] == edges[-1]] = self.n_bins - 1
+            bins[(bins < 0) | (bins >= self.n_bins)] = self.n_bins
+            scores += log_density[bins]
+        return scores
+
+
+DETECTORS = {
+    detector.name: detector
+    for detector in [IsolationForestDetector, RobustZScoreDetector, EWMACusumDetector, HBOSDetector]
+}
+
+
+def make_detector(config='isolation_forest', **params):
+    """
+    Builds an unfitted detector from a name or config.
+    :param config: Backend name from DETECTORS, or a dict like {'name': 'robust_zscore', 'window': 50}.
+    :param params: Extra parameters for the backend; they override the config dict.
+    """
+    if isinstance(config, Detector):
+        return config
+    if isinstance(config, dict):
+        config = dict(config)
+        name = config.pop('name', 'isolation_forest')
+        params = {**config, **params}
+    else:
+        name = config
+    if name not in DETECTORS:
+        raise ValueError(f'Unknown detector {name!r}, expected one of {sorted(DETECTORS)}')
+    return DETECTORS[name](**params)
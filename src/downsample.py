@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+# Points sent to the browser per chart; roughly two per horizontal pixel
+POINT_BUDGET = 2000
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: picks n_out points that keep the visual shape of the line.
+    :param x: Increasing numeric x values.
+    :param y: Values to plot.
+    :return: Sorted integer positions of the kept points, always including the first and last.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Bucket edges for the n - 2 inner points, split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    kept = np.empty(n_out, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_start = end if i + 2 < len(edges) else n - 1
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Twice the triangle area between the previous kept point, each candidate and the next bucket's mean
+        areas = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[i + 1] = previous
+    return kept
+
+
+def minmax_indices(y, n_out):
+    """
+    Keeps the minimum and maximum of each of n_out / 2 equal buckets, fully vectorized.
+    :return: Sorted integer positions of the kept points.
+    """
+    n = len(y)
+    n_buckets = max(n_out // 2, 1)
+    if n_out >= n:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    size = -(-n // n_buckets)
+    padded = np.full(size * n_buckets, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    # Skip buckets that hold only padding
+    valid = ~np.all(np.isnan(buckets), axis=1)
+    mins = offsets[valid] + np.nanargmin(buckets[valid], axis=1)
+    maxs = offsets[valid] + np.nanargmax(buckets[valid], axis=1)
+    return np.unique(np.concatenate(([0, n - 1], mins, maxs)))
+
+
+def downsample(data, n_points=POINT_BUDGET, keep=None, method='lttb', column='Close'):
+    """
+    Reduces data to about n_points rows for plotting.
+    :param data: DataFrame with a DatetimeIndex.
+    :param keep: Index labels that must survive, e.g. anomaly dates.
+    :param method: 'lttb' or 'minmax'.
+    :return: Subset of data in index order.
+    """
+    if len(data) <= n_points:
+        return data
+
+    y = data[column].to_numpy(dtype=float)
+    if method == 'minmax':
+        positions = minmax_indices(y, n_points)
+    else:
+        positions = lttb_indices(data.index.asi8, y, n_points)
+
+    if keep is not None and len(keep):
+        extra = data.index.get_indexer(pd.Index(keep))
+        positions = np.union1d(positions, extra[extra >= 0])
+    return data.iloc[positions]
+
+
+def relayout_range(relayout_data):
+    """
+    Visible x range from a dcc.Graph relayoutData event.
+    :return: (start, end) Timestamps, or None for the full range.
+    """
+    if not relayout_data or relayout_data.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout_data:
+        return pd.Timestamp(relayout_data['xaxis.range[0]']), pd.Timestamp(relayout_data['xaxis.range[1]'])
+    if 'xaxis.range' in relayout_data:
+        start, end = relayout_data['xaxis.range']
+        return pd.Timestamp(start), pd.Timestamp(end)
+    return None
+
+
+def _wall_clock(stamp, tz):
+    return stamp.tz_localize(tz) if stamp.tz is None else stamp.tz_convert(tz)
+
+
+def downsample_for_view(data, keep=None, view_range=None, n_points=POINT_BUDGET, method='lttb'):
+    """
+    Downsamples a price series for a chart, spending most of the budget on the visible range.
+
+    Rows inside view_range get the full n_points budget, so zooming in reveals full
+    resolution once the window holds fewer bars than the budget. Rows outside keep a
+    coarse quarter budget so the user can still pan and zoom out.
+    """
+    if view_range is None:
+        return downsample(data, n_points, keep, method)
+
+    start, end = view_range
+    if data.index.tz is not None:
+        # Charts show wall-clock times (see figures.date_array), so the range is in the index's zone
+        start, end = _wall_clock(start, data.index.tz), _wall_clock(end, data.index.tz)
+    inside = (data.index >= start) & (data.index <= end)
+    parts = [
+        downsample(data[inside], n_points, keep, method),
+        downsample(data[~inside], n_points // 4, keep, method),
+    ]
+    return pd.concat(parts).sort_index()
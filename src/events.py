@@ -0,0 +1,290 @@
+import argparse
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from anomaly_index import DEFAULT_INDEX_DIR, AnomalyIndex, get_anomaly_index
+from instrumentation import timed
+
+# Smallest stored strength; zeros would vanish from the sparse matrix
+MIN_STRENGTH = 1e-9
+# Bars of returns before an event used for its members' correlation
+CORRELATION_LOOKBACK = 60
+
+
+class ScoreMatrix:
+    """
+    Sparse date × ticker matrix of anomaly strengths for the whole universe.
+
+    Only bars labelled as anomalies are stored, with strength -score (so larger is more
+    anomalous), which keeps 3,000 tickers × 20 years at a few hundred thousand entries.
+    `active` counts the tickers that have a bar on each date, and `base_rate` is the share
+    of all bars that are anomalies, i.e. what a date looks like when nothing is going on.
+    """
+
+    def __init__(self, dates, tickers, matrix, active):
+        self.dates = dates
+        self.tickers = tickers
+        self.matrix = matrix.tocsr()
+        self.active = active
+        self.base_rate = self.matrix.nnz / max(int(active.sum()), 1)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+
+@timed('build_score_matrix')
+def build_score_matrix(keys):
+    """
+    Builds the ScoreMatrix from anomaly index keys (see AnomalyIndex.keys).
+    :param keys: DataFrame with ticker, date, score and anomaly columns, sorted by date.
+    :return: ScoreMatrix
+    """
+    stamps = keys['date'].to_numpy(dtype='datetime64[ns]')
+    # Keys are sorted by date, so date codes are a running count of date changes
+    new_date = np.r_[True, stamps[1:] != stamps[:-1]] if len(stamps) else np.zeros(0, dtype=bool)
+    date_codes = np.cumsum(new_date) - 1
+    dates = pd.DatetimeIndex(stamps[new_date], name='date')
+    ticker_codes, tickers = pd.factorize(keys['ticker'], sort=True)
+
+    anomalous = keys['anomaly'].to_numpy() == -1
+    strength = np.maximum(-keys['score'].to_numpy(dtype=float)[anomalous], MIN_STRENGTH)
+    matrix = sparse.csr_matrix((strength, (date_codes[anomalous], ticker_codes[anomalous])),
+                               shape=(len(dates), len(tickers)))
+    active = np.bincount(date_codes, minlength=len(dates))
+    return ScoreMatrix(dates, pd.Index(tickers, name='ticker'), matrix, active)
+
+
+def _window_counts(rows, cols, n_rows, window):
+    """
+    Number of distinct tickers with an anomaly in the `window` rows ending at each row.
+
+    Each anomaly covers its own row and the next window - 1 rows, cut short where the same
+    ticker's next anomaly starts, so overlapping coverage is never counted twice. The
+    covered intervals are then summed with one difference array.
+    """
+    order = np.lexsort((rows, cols))
+    rows, cols = rows[order], cols[order]
+    ends = rows + window
+    same_ticker_next = np.r_[cols[1:] == cols[:-1], False]
+    ends = np.where(same_ticker_next, np.minimum(ends, np.r_[rows[1:], 0]), ends)
+
+    diff = np.zeros(n_rows + window + 1, dtype=np.int64)
+    np.add.at(diff, rows, 1)
+    np.add.at(diff, ends, -1)
+    return np.cumsum(diff)[:n_rows]
+
+
+def _rolling(values, window, reduce):
+    if window == 1 or len(values) == 0:
+        return values
+    padded = np.r_[np.full(window - 1, values[0] if len(values) else 0), values]
+    return reduce(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1)
+
+
+@timed('detect_events')
+def detect_events(scores, start_date=None, end_date=None, window=1, min_tickers=5, min_z=5.0):
+    """
+    Finds dates on which unusually many tickers are anomalous together.
+
+    For every date, the number of distinct tickers with an anomaly in the last `window`
+    dates is compared with what the universe's base anomaly rate predicts for the active
+    tickers (a binomial z-score). Consecutive flagged dates are merged into one event.
+    :param scores: ScoreMatrix from build_score_matrix or get_score_matrix.
+    :param start_date: First date to report (inclusive), the whole history when None.
+    :param end_date: Last date to report (inclusive).
+    :param window: Dates over which anomalies of different tickers count as co-occurring.
+    :param min_tickers: Smallest number of tickers that makes an event.
+    :param min_z: Smallest excess over the expected count, in standard deviations.
+    :return: (timeline, events). timeline has one row per date with 'tickers', 'active',
+        'expected', 'z', 'strength' and 'event' (event number or -1); events has one row per
+        event with its 'start', 'end', 'peak' date, 'tickers', 'breadth' (share of active
+        tickers), 'z', 'strength' and 'members' (tickers, most anomalous first).
+    """
+    dates = scores.dates
+    lo = 0 if start_date is None else np.searchsorted(dates, pd.Timestamp(start_date), side='left')
+    hi = len(dates) if end_date is None else np.searchsorted(dates, pd.Timestamp(end_date), side='right')
+    # Include the window before the range so its first dates see their full lookback
+    first = max(lo - window + 1, 0)
+    block = scores.matrix[first:hi].tocoo()
+    n_rows = hi - first
+
+    counts = _window_counts(block.row, block.col, n_rows, window)
+    row_strength = np.asarray(scores.matrix[first:hi].sum(axis=1)).ravel()
+    cumulative = np.r_[0.0, np.cumsum(row_strength)]
+    strength = cumulative[1:] - cumulative[np.maximum(np.arange(n_rows) + 1 - window, 0)]
+    active = _rolling(scores.active[first:hi], window, np.max).astype(float)
+
+    rate = 1 - (1 - scores.base_rate) ** window
+    expected = active * rate
+    spread = np.sqrt(np.maximum(expected * (1 - rate), MIN_STRENGTH))
+    z = (counts - expected) / spread
+
+    flagged = (counts >= min_tickers) & (z >= min_z)
+    flagged[:lo - first] = False
+    timeline = pd.DataFrame({'tickers': counts, 'active': active.astype(int), 'expected': expected, 'z': z,
+                             'strength': strength}, index=dates[first:hi])
+
+    # Runs of consecutive flagged dates become events
+    edges = np.diff(np.r_[0, flagged.astype(np.int8), 0])
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1) - 1
+    event_ids = np.full(n_rows, -1)
+    records = []
+    for number, (run_start, run_end) in enumerate(zip(run_starts, run_ends)):
+        event_ids[run_start:run_end + 1] = number
+        peak = run_start + np.argmax(z[run_start:run_end + 1])
+        members = scores.matrix[max(first + run_start - window + 1, 0):first + run_end + 1].tocsc()
+        member_strength = np.asarray(members.sum(axis=0)).ravel()
+        member_codes = np.flatnonzero(member_strength)
+        member_codes = member_codes[np.argsort(-member_strength[member_codes], kind='stable')]
+        records.append({
+            'start': dates[first + run_start],
+            'end': dates[first + run_end],
+            'peak': dates[first + peak],
+            'tickers': len(member_codes),
+            'breadth': len(member_codes) / max(active[peak], 1),
+            'z': z[peak],
+            'strength': member_strength.sum(),
+            'members': scores.tickers[member_codes].tolist(),
+        })
+    timeline['event'] = event_ids
+    timeline = timeline.iloc[lo - first:]
+    events = pd.DataFrame(records, columns=['start', 'end', 'peak', 'tickers', 'breadth', 'z', 'strength', 'members'])
+    # Keep the date columns typed when there are no events
+    events[['start', 'end', 'peak']] = events[['start', 'end', 'peak']].astype('datetime64[ns]')
+    return timeline, events
+
+
+class RollingCorrelation:
+    """
+    Correlation matrix of the last `window` return rows, updated incrementally.
+
+    Each update adds the new row's sums and outer product and subtracts the ones of the row
+    leaving the window, which costs O(tickers²) instead of recomputing over the whole window.
+    The sums are rebuilt from the kept rows every `window` updates so rounding errors do
+    not accumulate. Missing returns count as zero.
+    :param n_tickers: Columns of each row.
+    :param window: Rows in the window.
+    """
+
+    def __init__(self, n_tickers, window=CORRELATION_LOOKBACK):
+        self.window = window
+        self._rows = deque()
+        self._sum = np.zeros(n_tickers)
+        self._cross = np.zeros((n_tickers, n_tickers))
+        self._updates = 0
+
+    def update(self, row):
+        row = np.nan_to_num(np.asarray(row, dtype=float))
+        self._rows.append(row)
+        self._sum += row
+        self._cross += np.outer(row, row)
+        if len(self._rows) > self.window:
+            old = self._rows.popleft()
+            self._sum -= old
+            self._cross -= np.outer(old, old)
+        self._updates += 1
+        if self._updates % self.window == 0:
+            rows = np.array(self._rows)
+            self._sum = rows.sum(axis=0)
+            self._cross = rows.T @ rows
+
+    def correlation(self):
+        """Current correlation matrix; NaN for tickers without variance in the window."""
+        n = max(len(self._rows), 1)
+        mean = self._sum / n
+        covariance = self._cross / n - np.outer(mean, mean)
+        std = np.sqrt(np.clip(np.diag(covariance), 0, None))
+        std = np.where(std > MIN_STRENGTH, std, np.nan)
+        return covariance / np.outer(std, std)
+
+
+def mean_correlation(returns, window=CORRELATION_LOOKBACK):
+    """
+    Average pairwise correlation of the columns of returns over a rolling window, per date.
+    High values mean the tickers move together, as in a market-wide event.
+    :param returns: DataFrame of returns, one column per ticker.
+    :return: Series indexed like returns.
+    """
+    rolling = RollingCorrelation(returns.shape[1], window)
+    off_diagonal = ~np.eye(returns.shape[1], dtype=bool)
+    values = []
+    for row in returns.to_numpy(dtype=float):
+        rolling.update(row)
+        corr = rolling.correlation()[off_diagonal]
+        values.append(np.nanmean(corr) if np.isfinite(corr).any() else np.nan)
+    return pd.Series(values, index=returns.index, name='mean_correlation')
+
+
+def window_correlation(rows):
+    """
+    Average pairwise correlation of the columns of one window of returns, the last value of
+    mean_correlation over the same rows, in one np.corrcoef call.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.corrcoef(np.nan_to_num(rows), rowvar=False)
+    off_diagonal = corr[~np.eye(rows.shape[1], dtype=bool)]
+    return np.nanmean(off_diagonal) if np.isfinite(off_diagonal).any() else np.nan
+
+
+def event_correlation(event, index=None, lookback=CORRELATION_LOOKBACK):
+    """
+    Average pairwise correlation of an event's members over the `lookback` bars up to its peak.
+    :param event: Row of the events frame from detect_events.
+    :param index: AnomalyIndex the event was found in.
+    """
+    index = index if index is not None else get_anomaly_index()
+    # Calendar days generous enough to cover lookback trading days
+    start = event['peak'] - pd.Timedelta(days=lookback * 2)
+    returns = index.prices(start, event['peak'], event['members']).pct_change().iloc[-lookback:]
+    if returns.shape[1] < 2:
+        return np.nan
+    return window_correlation(returns.to_numpy(dtype=float))
+
+
+_matrix_lock = threading.Lock()
+_matrix_cache = (None, None)
+
+
+def get_score_matrix(index=None):
+    """The ScoreMatrix of an anomaly index, built once per loaded copy of its keys."""
+    global _matrix_cache
+    index = index if index is not None else get_anomaly_index()
+    keys = index.keys()
+    with _matrix_lock:
+        cached_keys, scores = _matrix_cache
+        if cached_keys is not keys:
+            scores = build_score_matrix(keys)
+            _matrix_cache = (keys, scores)
+        return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find dates on which many tickers of the anomaly index spike together.')
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--window', type=int, default=1, help='Dates over which anomalies count as co-occurring.')
+    parser.add_argument('--min-tickers', type=int, default=5)
+    parser.add_argument('--min-z', type=float, default=5.0)
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--correlation', action='store_true', help="Also report each event's member correlation.")
+    args = parser.parse_args()
+
+    index = AnomalyIndex(args.index_dir)
+    scores = get_score_matrix(index)
+    _, events = detect_events(scores, args.start, args.end, args.window, args.min_tickers, args.min_z)
+    if args.correlation and len(events):
+        events['correlation'] = [event_correlation(event, index) for _, event in events.iterrows()]
+    events['members'] = events['members'].map(lambda members: ' '.join(members[:10]))
+    print(f'{len(events)} events across {scores.shape[1]} tickers and {scores.shape[0]} dates')
+    if len(events):
+        print(events.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class FeatureConfig:
+    """
+    Which derived features to compute. The defaults reproduce the original
+    engineer_features columns: MA_5, MA_10, Pct_change and Volume_scaled.
+    :param ma_windows: Rolling mean windows on Close, named MA_<w>.
+    :param volatility_windows: Rolling std windows on Pct_change, named Volatility_<w>.
+    :param rsi_windows: Simple-average RSI windows on Close, named RSI_<w>.
+    :param volume_zscore_windows: Rolling z-score windows on Volume, named Volume_z_<w>.
+    """
+    ma_windows: tuple = (5, 10)
+    pct_change: bool = True
+    volume_scaled: bool = True
+    volatility_windows: tuple = ()
+    rsi_windows: tuple = ()
+    volume_zscore_windows: tuple = ()
+
+
+DEFAULT_CONFIG = FeatureConfig()
+
+
+def feature_names(config=DEFAULT_CONFIG):
+    names = [f'MA_{w}' for w in config.ma_windows]
+    if config.pct_change:
+        names.append('Pct_change')
+    if config.volume_scaled:
+        names.append('Volume_scaled')
+    names += [f'Volatility_{w}' for w in config.volatility_windows]
+    names += [f'RSI_{w}' for w in config.rsi_windows]
+    names += [f'Volume_z_{w}' for w in config.volume_zscore_windows]
+    return names
+
+
+def _rolling_sum(x, window):
+    # Sum of each full window along the last axis, via one cumulative sum
+    c = np.cumsum(x, axis=-1)
+    out = c[..., window - 1:].copy()
+    out[..., 1:] -= c[..., :-window]
+    return out
+
+
+def _fill_warmup(out, valid, window, fill):
+    """Writes valid rolling values into out and fills the first window-1 rows with fill."""
+    n = out.shape[-1]
+    if window <= n:
+        out[..., window - 1:] = valid
+        out[..., :window - 1] = fill
+    else:
+        out[...] = fill
+
+
+def _valid_mean(valid):
+    if valid.shape[-1] == 0:
+        return np.zeros(valid.shape[:-1] + (1,))
+    return valid.mean(axis=-1, keepdims=True)
+
+
+def compute_features(values, close_col, volume_col, config=DEFAULT_CONFIG, out=None):
+    """
+    Computes the raw columns plus the configured features in one pass over NumPy arrays.
+
+    Works on a single series of shape (rows, columns) or on a stack of series of
+    shape (tickers, rows, columns); every statistic is taken per series along the
+    rows axis. Rolling windows are computed from cumulative sums. Warm-up rows are
+    filled the way engineer_features always did: moving averages take the mean
+    Close, every other feature takes the mean of its own valid values.
+    :param values: Float array of raw OHLCV columns (float32 or float64).
+    :param close_col: Column position of Close.
+    :param volume_col: Column position of Volume.
+    :param out: Optional preallocated array of shape values.shape[:-1] + (n_raw + n_features,),
+        e.g. float32 to halve the size of the feature matrix.
+    :return: Array with the raw columns first, then the features in feature_names(config) order.
+    """
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(float)
+    n_raw = values.shape[-1]
+    shape = values.shape[:-1] + (n_raw + len(feature_names(config)),)
+    if out is None:
+        out = np.empty(shape)
+    elif out.shape != shape:
+        raise ValueError(f"out has shape {out.shape}, expected {shape}.")
+
+    out[..., :n_raw] = values
+    # Float32 input (see compact.py) is only upcast column by column; cumulative sums need float64
+    close = values[..., close_col].astype(float, copy=False)
+    volume = values[..., volume_col].astype(float, copy=False)
+    # Work on (..., rows) views of out, one feature at a time
+    columns = np.moveaxis(out[..., n_raw:], -1, 0)
+    j = 0
+
+    n_rows = close.shape[-1]
+    close_mean = close.mean(axis=-1, keepdims=True)
+    for w in config.ma_windows:
+        valid = _rolling_sum(close, w) / w if w <= n_rows else None
+        _fill_warmup(columns[j], valid, w, close_mean)
+        j += 1
+
+    returns = close[..., 1:] / close[..., :-1] - 1.0
+    if config.pct_change:
+        columns[j][..., 1:] = returns
+        columns[j][..., :1] = _valid_mean(returns)
+        j += 1
+
+    if config.volume_scaled:
+        std = volume.std(axis=-1, keepdims=True)
+        std[std == 0] = 1.0  # StandardScaler leaves constant columns unscaled
+        np.subtract(volume, volume.mean(axis=-1, keepdims=True), out=columns[j])
+        columns[j] /= std
+        j += 1
+
+    for w in config.volatility_windows:
+        # Rolling sample std of returns; row 0 has no return, so windows start at row w
+        valid = None
+        if w + 1 <= n_rows:
+            s1 = _rolling_sum(returns, w)
+            s2 = _rolling_sum(returns * returns, w)
+            valid = np.sqrt(np.maximum(s2 - s1 * s1 / w, 0.0) / max(w - 1, 1))
+        _fill_warmup(columns[j], valid, w + 1, _valid_mean(valid) if valid is not None else 0.0)
+        j += 1
+
+    if config.rsi_windows:
+        diff = np.diff(close, axis=-1)
+        gains = np.maximum(diff, 0.0)
+        losses = np.maximum(-diff, 0.0)
+    for w in config.rsi_windows:
+        valid = None
+        if w + 1 <= n_rows:
+            gain_sum = _rolling_sum(gains, w)
+            loss_sum = _rolling_sum(losses, w)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                valid = 100.0 - 100.0 / (1.0 + gain_sum / loss_sum)
+            valid[loss_sum == 0] = 100.0
+            valid[(loss_sum == 0) & (gain_sum == 0)] = 50.0
+        _fill_warmup(columns[j], valid, w + 1, _valid_mean(valid) if valid is not None else 50.0)
+        j += 1
+
+    for w in config.volume_zscore_windows:
+        valid = None
+        if w <= n_rows:
+            s1 = _rolling_sum(volume, w)
+            s2 = _rolling_sum(volume * volume, w)
+            mean = s1 / w
+            std = np.sqrt(np.maximum(s2 / w - mean * mean, 0.0))
+            std[std == 0] = 1.0
+            valid = (volume[..., w - 1:] - mean) / std
+        _fill_warmup(columns[j], valid, w, _valid_mean(valid) if valid is not None else 0.0)
+        j += 1
+
+    return out
@@ -0,0 +1,96 @@
+import base64
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.io as pio
+
+# Base price traces kept in memory, one per ticker, range, resolution and zoom
+FIGURE_CACHE_ENTRIES = 64
+# Layout defaults of plotly.express, so dict figures look like the px.line ones they replace
+TEMPLATE = pio.templates[pio.templates.default].to_plotly_json()
+PRICE_COLOR = '#636efa'
+
+
+def typed_array(values, dtype='f8'):
+    """
+    Plotly.js typed-array spec: the values as one base64 buffer instead of a JSON list, which
+    is smaller on the wire and decoded without parsing a number per point. Needs plotly.js
+    2.28 or later, i.e. Dash 2.15 or later.
+    """
+    values = np.ascontiguousarray(values, dtype=f'<{dtype}')
+    return {'dtype': dtype, 'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+
+
+def date_array(index):
+    """Dates as epoch milliseconds, which date axes accept; tz-aware indexes keep their wall-clock time."""
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return typed_array(index.to_numpy(dtype='datetime64[ms]').astype(np.int64))
+
+
+def line_trace(data, column='Close'):
+    return {'type': 'scatter', 'mode': 'lines', 'name': '', 'showlegend': False,
+            'x': date_array(data.index), 'y': typed_array(data[column].to_numpy(dtype=float)),
+            'line': {'color': PRICE_COLOR}, 'hovertemplate': f'%{{x}}<br>{column}=%{{y}}<extra></extra>'}
+
+
+def marker_trace(rows, name, color=None, column='Close'):
+    trace = {'type': 'scatter', 'mode': 'markers', 'name': name,
+             'x': date_array(rows.index), 'y': typed_array(rows[column].to_numpy(dtype=float))}
+    if color:
+        trace['marker'] = {'color': color}
+    return trace
+
+
+def figure(traces, title, xaxis_title='Date', yaxis_title='Close'):
+    """Figure dict that dcc.Graph renders as is, without building and validating plotly objects."""
+    return {'data': traces,
+            'layout': {'template': TEMPLATE, 'title': {'text': title},
+                       'xaxis': {'type': 'date', 'title': {'text': xaxis_title}},
+                       'yaxis': {'title': {'text': yaxis_title}}}}
+
+
+class FigureCache:
+    """
+    LRU cache of base price traces for the dashboard.
+
+    Only the markers and title of a chart change with the analysis or calendar effect, so
+    the (downsampled, encoded) price line is built once per ticker, range, resolution and
+    zoom and shared by every figure drawn over it.
+    """
+
+    def __init__(self, max_entries=FIGURE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+_default_cache = None
+
+
+def get_figure_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FigureCache()
+    return _default_cache
@@ -0,0 +1,62 @@
+import hashlib
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Seed every model from its request (ticker, range, params) so the same request always gives the
+# same anomalies; set ANOM_REPRODUCIBLE=0 to fall back to unseeded, run-to-run random models
+REPRODUCIBLE = os.environ.get('ANOM_REPRODUCIBLE', '1') != '0'
+
+
+def fingerprint_frame(data):
+    """Content hash of a DataFrame's index, columns and values (or of an array's shape and values)."""
+    digest = hashlib.sha1()
+    if isinstance(data, np.ndarray):
+        digest.update(repr((data.shape, str(data.dtype))).encode())
+        digest.update(np.ascontiguousarray(data).tobytes())
+        return digest.hexdigest()
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    digest.update(repr(list(data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _canonical(part):
+    # Same value, same text: dicts are sorted, frames hashed by content and dates written one way
+    if isinstance(part, (pd.DataFrame, pd.Series, np.ndarray)):
+        return fingerprint_frame(part)
+    if isinstance(part, dict):
+        return sorted((str(key), _canonical(value)) for key, value in part.items())
+    if isinstance(part, (list, tuple)):
+        return [_canonical(value) for value in part]
+    if isinstance(part, (date, np.datetime64)):
+        return pd.Timestamp(part).isoformat()
+    if isinstance(part, np.generic):
+        return part.item()
+    return part
+
+
+def fingerprint(*parts):
+    """
+    Content hash of any mix of frames, arrays, configs and plain values, e.g. the inputs and
+    config of a request. Equal inputs give equal fingerprints across processes and runs.
+    """
+    return hashlib.sha1(repr(_canonical(parts)).encode()).hexdigest()
+
+
+def derive_seed(*parts):
+    """
+    32-bit random_state derived from the parts of a request, e.g. derive_seed(ticker, start, end, params).
+    Pass dates as date or Timestamp objects so '2020-01-01' and date(2020, 1, 1) give the same seed.
+    """
+    return int(fingerprint(*parts)[:8], 16)
+
+
+def default_seed(random_state, *parts):
+    """random_state if given, else derive_seed(*parts), or None when reproducible mode is off."""
+    if random_state is not None or not REPRODUCIBLE:
+        return random_state
+    return derive_seed(*parts)
@@ -0,0 +1,168 @@
+import bisect
+import cProfile
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Metrics are on unless ANOM_METRICS=0; profiling is off unless ANOM_PROFILE_DIR is set
+ENABLED = os.environ.get('ANOM_METRICS', '1') != '0'
+PROFILE_DIR = os.environ.get('ANOM_PROFILE_DIR')
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class MetricsRegistry:
+    """Thread-safe stage timings (as histograms) and rows/bytes counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._rows = {}
+        self._bytes = {}
+        self._errors = {}
+        self._collectors = {}
+
+    def observe(self, stage, seconds, rows=None, nbytes=None, error=False):
+        with self._lock:
+            timing = self._timings.get(stage)
+            if timing is None:
+                timing = self._timings[stage] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            position = bisect.bisect_left(BUCKETS, seconds)
+            if position < len(BUCKETS):
+                timing['buckets'][position] += 1
+            timing['sum'] += seconds
+            timing['count'] += 1
+            if rows is not None:
+                self._rows[stage] = self._rows.get(stage, 0) + rows
+            if nbytes is not None:
+                self._bytes[stage] = self._bytes.get(stage, 0) + nbytes
+            if error:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+
+    def add_collector(self, name, collector):
+        """Registers (or replaces) a function returning {metric_name: value} gauges, e.g. cache stats."""
+        self._collectors[name] = collector
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: dict(timing, buckets=list(timing['buckets'])) for stage, timing in self._timings.items()}
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._rows.clear()
+            self._bytes.clear()
+            self._errors.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            timings = {stage: dict(timing) for stage, timing in self._timings.items()}
+            rows, nbytes, errors = dict(self._rows), dict(self._bytes), dict(self._errors)
+
+        lines = [
+            '# HELP anom_stage_seconds Time spent in each pipeline stage or dashboard callback.',
+            '# TYPE anom_stage_seconds histogram',
+        ]
+        for stage, timing in sorted(timings.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, timing['buckets']):
+                cumulative += count
+                lines.append(f'anom_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'anom_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {timing["count"]}')
+            lines.append(f'anom_stage_seconds_sum{{stage="{stage}"}} {timing["sum"]}')
+            lines.append(f'anom_stage_seconds_count{{stage="{stage}"}} {timing["count"]}')
+
+        for name, help_text, values in [
+            ('anom_rows_processed_total', 'Rows passed into each stage.', rows),
+            ('anom_bytes_processed_total', 'Bytes of input data passed into each stage.', nbytes),
+            ('anom_stage_errors_total', 'Calls of each stage that raised.', errors),
+        ]:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            lines += [f'{name}{{stage="{stage}"}} {value}' for stage, value in sorted(values.items())]
+
+        for collector in list(self._collectors.values()):
+            for name, value in collector().items():
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _data_size(data):
+    if hasattr(data, 'dtypes') and hasattr(data, 'columns'):
+        # Shallow size from the column dtypes; memory_usage() costs far more than the stages it measures
+        # Extension dtypes (e.g. strings) have no fixed item size; count them as one pointer per row
+        return len(data), len(data) * sum(getattr(dtype, 'itemsize', 8) for dtype in data.dtypes)
+    if hasattr(data, 'nbytes'):
+        return len(data), int(data.nbytes)
+    return None, None
+
+
+# Only one profiler can be active per process (Python 3.12 refuses a second one)
+_profile_lock = threading.Lock()
+
+
+def _dump_profile(profiler, stage):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'{stage}-{time.strftime("%Y%m%d-%H%M%S")}-{time.perf_counter_ns()}.prof')
+    profiler.dump_stats(path)
+
+
+@contextmanager
+def span(stage, data=None):
+    """
+    Times the enclosed block as `stage`.
+    :param data: Optional DataFrame or array whose rows and bytes are counted for the stage.
+    """
+    if not ENABLED:
+        yield
+        return
+    rows, nbytes = _data_size(data) if data is not None else (None, None)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        REGISTRY.observe(stage, time.perf_counter() - start, rows, nbytes, error)
+
+
+def timed(stage, profile=False):
+    """
+    Decorator that times every call as `stage` and counts the rows/bytes of the first argument.
+    With profile=True and ANOM_PROFILE_DIR set, each call is also run under cProfile and
+    dumped to a .prof file there (one per call, e.g. one per dashboard request). Calls that
+    start while another one is being profiled run unprofiled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            data = args[0] if args and hasattr(args[0], '__len__') and not isinstance(args[0], str) else None
+            with span(stage, data):
+                if profile and PROFILE_DIR and _profile_lock.acquire(blocking=False):
+                    profiler = cProfile.Profile()
+                    try:
+                        return profiler.runcall(func, *args, **kwargs)
+                    finally:
+                        _profile_lock.release()
+                        _dump_profile(profiler, stage)
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_metrics_endpoint(server, path='/metrics'):
+    """Serves REGISTRY.render() from a Flask server, e.g. app.server of a Dash app."""
+    def metrics():
+        return REGISTRY.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+    server.add_url_rule(path, 'metrics', metrics)
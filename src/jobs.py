@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker threads for dashboard jobs; NumPy and scikit-learn release the GIL for most of the pipeline
+JOB_WORKERS = int(os.environ.get('ANOM_JOB_WORKERS', 4))
+# Seconds a finished job stays around for polling clients, and a successful one for identical requests
+KEEP_SECONDS = 300
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's function from set_progress once the job has been cancelled."""
+
+
+class Job:
+    """
+    One background computation, shared by every client that asked for the same key.
+    The job's function receives it as its first argument to report progress.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.refs = 1
+        self.future = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+
+    def set_progress(self, fraction, message=''):
+        """Records progress, and stops the job here (by raising JobCancelled) if it was cancelled."""
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.key)
+        self.progress = fraction
+        self.message = message
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()  # Only succeeds while still queued
+
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+
+class JobManager:
+    """
+    Runs long dashboard computations off the request threads.
+
+    Identical requests are coalesced: submitting a key that is queued, running or
+    recently finished successfully returns the existing job instead of starting another
+    one. A job that fails or is cancelled leaves the coalescing map at once, so the next
+    identical request runs again; failed jobs stay readable through get() for polling
+    clients until keep_seconds have passed. Each client releases its previous job when
+    its inputs change, and a job nobody holds any more is cancelled at its next
+    set_progress call.
+    :param max_workers: Worker threads.
+    :param keep_seconds: How long finished jobs stay available.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, keep_seconds=KEEP_SECONDS):
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='anom-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._failed = {}
+        self.submitted = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def _prune(self):
+        now = time.monotonic()
+        for jobs in (self._jobs, self._failed):
+            for key, job in list(jobs.items()):
+                if job.finished_at is not None and now - job.finished_at > self.keep_seconds:
+                    del jobs[key]
+
+    def _run(self, job, func, args, kwargs):
+        try:
+            return func(job, *args, **kwargs)
+        except BaseException:
+            # Only successful results are shared; errors are not cached for identical requests
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                if not job.cancelled():
+                    self._failed[job.key] = job
+            raise
+        finally:
+            job.finished_at = time.monotonic()
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Starts func(job, *args, **kwargs) in the background, or joins the job already running for key.
+        :return: Job
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(key)
+            if job is not None and not job.cancelled():
+                job.refs += 1
+                self.coalesced += 1
+                return job
+            self._failed.pop(key, None)
+            job = self._jobs[key] = Job(key)
+            job.future = self._executor.submit(self._run, job, func, args, kwargs)
+            self.submitted += 1
+            return job
+
+    def get(self, key):
+        with self._lock:
+            job = self._jobs.get(key)
+            return job if job is not None else self._failed.get(key)
+
+    def release(self, key):
+        """Drops one client's interest in a job; cancels it when no client is left and it is still running."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return
+            job.refs -= 1
+            if job.refs <= 0 and not job.done():
+                job.cancel()
+                del self._jobs[key]
+                self.cancelled += 1
+
+    def stats(self):
+        with self._lock:
+            running = sum(not job.done() for job in self._jobs.values())
+            return {'running': running, 'submitted': self.submitted, 'coalesced': self.coalesced,
+                    'cancelled': self.cancelled}
+
+
+_default_manager = None
+
+
+def get_job_manager():
+    global _default_manager
+    if _default_manager is None:
+        _default_manager = JobManager()
+    return _default_manager
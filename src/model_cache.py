@@ -0,0 +1,141 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import joblib
+
+from anom import detect_anomalies, fit_model
+from features import DEFAULT_CONFIG
+from fingerprint import default_seed, fingerprint_frame
+
+
+def make_key(ticker, data, feature_config=DEFAULT_CONFIG, params=None):
+    """
+    Cache key for a fitted detector: ticker, data fingerprint, feature config and model params.
+    """
+    params = sorted((params or {}).items())
+    raw = repr((ticker, fingerprint_frame(data), feature_config, params))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class ModelCache:
+    """
+    In-memory LRU cache of fitted models and their results, with optional joblib files on disk.
+
+    Entries are evicted least-recently-used first once either max_entries or
+    max_bytes (the pickled size of the entries) is exceeded. With disk_dir set,
+    every entry is also written there, so a restarted process can load it back
+    instead of refitting.
+    :param max_entries: Maximum number of entries kept in memory.
+    :param max_bytes: Maximum total pickled size of the entries kept in memory.
+    :param disk_dir: Optional folder for persisted entries.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=256 * 1024 * 1024, disk_dir=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.joblib')
+
+    def _store(self, key, value, size):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._sizes[key] = size
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 sum(self._sizes.values()) > self.max_bytes):
+            evicted, _ = self._entries.popitem(last=False)
+            del self._sizes[evicted]
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            value = joblib.load(self._disk_path(key))
+            with self._lock:
+                self._store(key, value, os.path.getsize(self._disk_path(key)))
+                self.disk_hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._store(key, value, size)
+        if self.disk_dir:
+            joblib.dump(value, self._disk_path(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': sum(self._sizes.values()),
+            }
+
+
+_default_cache = None
+
+
+def get_model_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ModelCache(disk_dir=os.environ.get('ANOM_MODEL_CACHE_DIR'))
+    return _default_cache
+
+
+def cached_detect_anomalies(data, ticker, params=None, feature_config=DEFAULT_CONFIG, cache=None):
+    """
+    Same as detect_anomalies, but reuses the fitted model and labels of an earlier
+    call with the same ticker, data, feature config and params.
+
+    The model is seeded from the ticker, date range and params (unless params has a
+    random_state), so a refit after eviction or in another process gives the same labels.
+    :return: The anomalous rows; data gets an 'anomaly' column as with detect_anomalies.
+        Their attrs['fingerprint'] is the cache key, a content hash of the inputs and config
+        that is equal for identical requests across runs.
+    """
+    cache = cache if cache is not None else get_model_cache()
+    params = params or {}
+    key = make_key(ticker, data, feature_config, params)
+
+    entry = cache.get(key)
+    if entry is None:
+        seed_range = (data.index[0], data.index[-1]) if len(data) else ()
+        random_state = default_seed(params.get('random_state'), ticker, *seed_range, params)
+        model = fit_model(data, **{**params, 'random_state': random_state})
+        anomalies = detect_anomalies(data, model=model)
+        cache.put(key, {'model': model, 'labels': data['anomaly'].to_numpy()})
+    else:
+        data['anomaly'] = entry['labels']
+        anomalies = data[data['anomaly'] == -1]
+    anomalies.attrs['fingerprint'] = key
+    return anomalies
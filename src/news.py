@@ -0,0 +1,182 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+NEWS_API_URL = os.environ.get('NEWS_API_URL', 'https://newsapi.org/v2/everything')
+# Longest merged request window in days; one page of relevancy-sorted results cannot cover more
+MAX_WINDOW_DAYS = 7
+NEWS_CACHE_DIR = os.environ.get(
+    'NEWS_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'news')
+)
+
+
+class RateLimiter:
+    """Allows at most `rate` calls per second across threads by spacing them out."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+def merge_windows(dates, lookback_days=1, max_days=MAX_WINDOW_DAYS):
+    """
+    Turns anomaly dates into few date windows that cover [date - lookback_days, date] for
+    every date. Windows that share days are merged into one request, as long as the merged
+    window spans at most max_days; a single page of results would drop most dates' articles otherwise.
+    :return: List of (from_date, to_date, dates_in_window)
+    """
+    windows = []
+    for day in sorted(set(dates)):
+        start = day - datetime.timedelta(days=lookback_days)
+        if windows and start <= windows[-1][1] and (day - windows[-1][0]).days < max_days:
+            windows[-1][1] = day
+            windows[-1][2].append(day)
+        else:
+            windows.append([start, day, [day]])
+    return [tuple(window) for window in windows]
+
+
+class NewsService:
+    """
+    Fetches news for anomaly dates concurrently over one pooled HTTP session.
+
+    Responses are cached on disk for `ttl` seconds, requests are spaced to respect
+    `rate_limit` requests per second, and get_news_for_dates returns whatever has
+    arrived when its timeout expires.
+    :param api_key: News API key. Defaults to the NEWS_API_KEY environment variable.
+    :param base_url: Endpoint to query, e.g. a local stub server in tests.
+    :param cache_dir: Folder for cached responses. None disables the disk cache.
+    """
+
+    def __init__(self, api_key=None, base_url=NEWS_API_URL, cache_dir=NEWS_CACHE_DIR, ttl=6 * 3600,
+                 max_workers=8, rate_limit=5, request_timeout=10):
+        self.api_key = api_key if api_key is not None else os.environ.get('NEWS_API_KEY')
+        self.base_url = base_url
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.request_timeout = request_timeout
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, ticker, from_date, to_date):
+        key = hashlib.sha1(f'{self.base_url}|{ticker}|{from_date}|{to_date}'.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _read_cache(self, path):
+        if not self.cache_dir or not os.path.exists(path):
+            return None
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Unreadable or half-written entries count as misses
+            return None
+
+    def fetch_window(self, ticker, from_date, to_date):
+        """
+        Returns the articles for ticker between from_date and to_date, from cache when fresh.
+        :return: List of dicts with title, url and publishedAt.
+        """
+        from_date = from_date.strftime("%Y-%m-%d")
+        to_date = to_date.strftime("%Y-%m-%d")
+        path = self._cache_path(ticker, from_date, to_date)
+        cached = self._read_cache(path)
+        if cached is not None:
+            return cached
+
+        self.rate_limiter.acquire()
+        params = {'q': ticker, 'from': from_date, 'to': to_date, 'sortBy': 'relevancy', 'apiKey': self.api_key}
+        try:
+            response = self.session.get(self.base_url, params=params, timeout=self.request_timeout)
+        except requests.RequestException:
+            return []
+        if response.status_code != 200:
+            # Errors and rate-limit responses are not cached, so they are retried next time
+            return []
+
+        try:
+            articles = [
+                {'title': article.get('title'), 'url': article.get('url'), 'publishedAt': article.get('publishedAt')}
+                for article in response.json().get('articles', [])
+            ]
+        except (ValueError, AttributeError):
+            # Not JSON, or not the expected shape (e.g. an HTML error page from a proxy)
+            return []
+        if self.cache_dir:
+            try:
+                with open(path, 'w') as f:
+                    json.dump(articles, f)
+            except OSError:
+                pass
+        return articles
+
+    def get_news_for_dates(self, ticker, dates, lookback_days=1, timeout=None):
+        """
+        Fetches news for every anomaly date at once.
+        :param dates: Anomaly dates (datetime.date or Timestamp).
+        :param timeout: Seconds to wait before returning partial results. None waits for all.
+        :return: Dict mapping each date to a list of (title, url); dates whose request did not
+            finish in time map to an empty list.
+        """
+        dates = [day.date() if hasattr(day, 'date') else day for day in dates]
+        news = {day: [] for day in dates}
+        futures = {}
+        for from_date, to_date, window_dates in merge_windows(dates, lookback_days):
+            future = self.executor.submit(self.fetch_window, ticker, from_date, to_date)
+            futures[future] = window_dates
+
+        done, _ = wait(futures, timeout=timeout)
+        for future in done:
+            if future.exception() is not None:
+                continue
+            for article in future.result():
+                published = (article.get('publishedAt') or '')[:10]
+                for day in futures[future]:
+                    start = (day - datetime.timedelta(days=lookback_days)).isoformat()
+                    # Merged windows span several dates; give each date only its own articles
+                    if not published or start <= published <= day.isoformat():
+                        news[day].append((article['title'], article['url']))
+        return news
+
+
+_default_service = None
+
+
+def get_news_service():
+    global _default_service
+    if _default_service is None:
+        _default_service = NewsService()
+    return _default_service
+
+
+def get_news(ticker, anomaly_date):
+    """News for a single anomaly date, as (title, url) pairs."""
+    day = anomaly_date.date() if hasattr(anomaly_date, 'date') else anomaly_date
+    return get_news_service().get_news_for_dates(ticker, [day])[day]
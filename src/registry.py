@@ -0,0 +1,383 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+
+from anom import clean_data, engineer_features, fit_model
+from fingerprint import default_seed, fingerprint_frame
+from store import load_ohlcv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_DIR = os.environ.get(
+    'ANOM_REGISTRY_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'registry')
+)
+# Calendar days of history a model is trained on
+LOOKBACK_DAYS = 365
+# Bins of the PSI histograms (deciles of the training data) and points of the stored CDF sketch for KS
+PSI_BINS = 10
+SKETCH_POINTS = 201
+# A feature drifts when its PSI exceeds this (above 0.25 is the usual "major shift") and KS rejects at KS_ALPHA
+PSI_THRESHOLD = 0.25
+KS_ALPHA = 0.01
+# New bars needed since the training end before drift is judged at all
+MIN_NEW_ROWS = 20
+# Smallest bin share, so empty bins do not make the PSI infinite
+MIN_SHARE = 1e-4
+# Scale-free inputs checked for drift by default. Price levels (Close, MA_*) drift whenever a
+# trending ticker leaves its training range, which would retrain every ticker on every pass
+DRIFT_COLUMNS = ['Pct_change', 'Range', 'Volume_scaled']
+
+
+def volume_scaler(features):
+    """Mean and standard deviation of Volume, as engineer_features scales it for Volume_scaled."""
+    volume = features['Volume'].to_numpy(dtype=float)
+    return float(volume.mean()), float(volume.std() or 1.0)
+
+
+def drift_features(features, scaler=None):
+    """
+    Scale-free views of feature rows for drift checks: the bar's high-low range relative to its
+    close as 'Range', and Volume_scaled recomputed with the training scaler (mean, std) when
+    given, since engineer_features scales each window by its own volume.
+    """
+    features = features.copy()
+    if {'High', 'Low', 'Close'} <= set(features.columns):
+        features['Range'] = (features['High'] - features['Low']) / features['Close']
+    if scaler is not None and 'Volume_scaled' in features.columns:
+        features['Volume_scaled'] = (features['Volume'] - scaler[0]) / scaler[1]
+    return features
+
+
+class TrainingScaled:
+    """
+    A registered model that scales Volume with its training scaler before scoring, so rows from
+    another window are scaled like the ones it was fitted on. Other attributes (e.g. offset_)
+    are the model's own.
+    """
+
+    def __init__(self, model, scaler):
+        self.model = model
+        self.scaler = scaler
+
+    def _rescale(self, data):
+        return drift_features(data, self.scaler)[list(data.columns)]
+
+    def predict(self, data):
+        return self.model.predict(self._rescale(data))
+
+    def score_samples(self, data):
+        return self.model.score_samples(self._rescale(data))
+
+    def __getattr__(self, name):
+        if name == 'model':
+            # Not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+def feature_profile(features):
+    """
+    Compact description of each column's distribution, stored with a model to check drift later:
+    the inner decile edges with the share of rows per bin (for PSI) and a quantile sketch (for KS).
+    """
+    probabilities = np.linspace(0, 1, PSI_BINS + 1)[1:-1]
+    profile = {}
+    for column in features.columns:
+        values = features[column].to_numpy(dtype=float)
+        edges = np.unique(np.quantile(values, probabilities))
+        shares = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1) / len(values)
+        profile[column] = {
+            'edges': edges.tolist(),
+            'shares': shares.tolist(),
+            'sketch': np.quantile(values, np.linspace(0, 1, SKETCH_POINTS)).tolist(),
+        }
+    return profile
+
+
+def psi(expected, actual):
+    """Population stability index between two sets of bin shares."""
+    expected = np.maximum(np.asarray(expected, dtype=float), MIN_SHARE)
+    actual = np.maximum(np.asarray(actual, dtype=float), MIN_SHARE)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def drift_report(profile, features):
+    """
+    Compares new feature rows with the profile of the training data, column by column.
+    :return: DataFrame indexed by column with 'psi', 'ks', 'ks_pvalue' and 'drifted'.
+    """
+    rows = []
+    for column, reference in profile.items():
+        values = features[column].to_numpy(dtype=float)
+        edges = np.asarray(reference['edges'])
+        shares = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1) / len(values)
+        ks = ks_2samp(reference['sketch'], values)
+        rows.append({'column': column, 'psi': psi(reference['shares'], shares), 'ks': float(ks.statistic),
+                     'ks_pvalue': float(ks.pvalue)})
+    report = pd.DataFrame(rows, columns=['column', 'psi', 'ks', 'ks_pvalue']).set_index('column')
+    report['drifted'] = (report['psi'] > PSI_THRESHOLD) & (report['ks_pvalue'] < KS_ALPHA)
+    return report
+
+
+class ModelRegistry:
+    """
+    Versioned models per ticker on local disk.
+
+    Each ticker has a folder with one joblib file per version and a manifest.json listing
+    every version's metadata (training range, rows, columns, detector, seed, data
+    fingerprint, feature profile and why it was trained) plus the current version.
+    Versions are never overwritten, so promote() can roll back to any of them.
+    :param registry_dir: Root folder of the registry.
+    """
+
+    def __init__(self, registry_dir=DEFAULT_REGISTRY_DIR):
+        self.registry_dir = registry_dir
+        self._models = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.registry_dir, exist_ok=True)
+
+    def _ticker_dir(self, ticker):
+        return os.path.join(self.registry_dir, ticker)
+
+    def _manifest_path(self, ticker):
+        return os.path.join(self._ticker_dir(ticker), 'manifest.json')
+
+    def _model_path(self, ticker, version):
+        return os.path.join(self._ticker_dir(ticker), f'v{version}.joblib')
+
+    def manifest(self, ticker):
+        path = self._manifest_path(ticker)
+        if not os.path.exists(path):
+            return {'current': None, 'versions': []}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, ticker, manifest):
+        # Write then rename, so readers never see a half-written manifest
+        path = self._manifest_path(ticker)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(f'{path}.tmp', path)
+
+    def tickers(self):
+        return sorted(name for name in os.listdir(self.registry_dir) if os.path.exists(self._manifest_path(name)))
+
+    def versions(self, ticker):
+        """Metadata of every version of ticker, oldest first."""
+        return self.manifest(ticker)['versions']
+
+    def current_version(self, ticker):
+        return self.manifest(ticker)['current']
+
+    def metadata(self, ticker, version=None):
+        manifest = self.manifest(ticker)
+        version = manifest['current'] if version is None else version
+        for entry in manifest['versions']:
+            if entry['version'] == version:
+                return entry
+        return None
+
+    def register(self, ticker, model, features, **metadata):
+        """
+        Stores a fitted model as the ticker's new current version.
+        :param features: The feature rows it was fitted on, for the profile, range and fingerprint.
+        :param metadata: Extra metadata to keep, e.g. reason, detector or random_state.
+        :return: The new version number.
+        """
+        os.makedirs(self._ticker_dir(ticker), exist_ok=True)
+        manifest = self.manifest(ticker)
+        version = max((entry['version'] for entry in manifest['versions']), default=0) + 1
+        joblib.dump(model, self._model_path(ticker, version))
+        scaler = volume_scaler(features) if 'Volume' in features.columns else None
+
+        manifest['versions'].append({
+            'version': version,
+            'created': datetime.now(timezone.utc).isoformat(),
+            'train_start': features.index[0].isoformat(),
+            'train_end': features.index[-1].isoformat(),
+            'rows': len(features),
+            'columns': list(features.columns),
+            'fingerprint': fingerprint_frame(features),
+            'volume_scaler': scaler,
+            # Model inputs plus the scale-free views checked for drift
+            'profile': feature_profile(drift_features(features, scaler)),
+            **metadata,
+        })
+        manifest['current'] = version
+        self._write_manifest(ticker, manifest)
+        return version
+
+    def promote(self, ticker, version):
+        """Makes an existing version current again, e.g. to roll back a bad retrain."""
+        manifest = self.manifest(ticker)
+        if not any(entry['version'] == version for entry in manifest['versions']):
+            raise ValueError(f'{ticker} has no version {version}')
+        manifest['current'] = version
+        self._write_manifest(ticker, manifest)
+
+    def load(self, ticker, version=None):
+        """The fitted model of a version (the current one by default), or None if there is none."""
+        version = self.current_version(ticker) if version is None else version
+        if version is None:
+            return None
+        # Versions never change once written, so loaded models can be kept for good
+        with self._lock:
+            if (ticker, version) not in self._models:
+                self._models[ticker, version] = joblib.load(self._model_path(ticker, version))
+            return self._models[ticker, version]
+
+    def current_model(self, ticker, data):
+        """
+        The current model of ticker if it was trained on the same columns as data, else None.
+        Used by anom.detect_anomalies and score_anomalies when given a registry. Volume_scaled
+        is rescaled with the training window's scaler, see TrainingScaled.
+        """
+        metadata = self.metadata(ticker)
+        if metadata is None:
+            return None
+        if metadata['columns'] != list(data.columns):
+            logger.warning('Registered model v%s of %s expects columns %s, got %s; fitting a new one',
+                           metadata['version'], ticker, metadata['columns'], list(data.columns))
+            return None
+        model = self.load(ticker, metadata['version'])
+        if metadata.get('volume_scaler') and 'Volume_scaled' in metadata['columns']:
+            return TrainingScaled(model, metadata['volume_scaler'])
+        return model
+
+    def check_drift(self, ticker, features, columns=None):
+        """
+        Drift of the feature rows after the current model's training range.
+        :param columns: Columns to monitor, the scale-free DRIFT_COLUMNS by default. Any model input
+            can be named, e.g. 'Close' to also retrain when prices leave the training range.
+        :return: (status, report) with status 'new' (no model yet), 'pending' (fewer than
+            MIN_NEW_ROWS new rows), 'drift' or 'stable'; report is from drift_report or None.
+        """
+        metadata = self.metadata(ticker)
+        if metadata is None:
+            return 'new', None
+        new_rows = features[features.index > pd.Timestamp(metadata['train_end'])]
+        if len(new_rows) < MIN_NEW_ROWS:
+            return 'pending', None
+        scaler = metadata.get('volume_scaler')
+        if columns is None:
+            # Versions registered without a scaler can only compare Volume_scaled across differently scaled windows
+            columns = [column for column in DRIFT_COLUMNS if column in metadata['profile']
+                       and (scaler or column != 'Volume_scaled')]
+        profile = {column: metadata['profile'][column] for column in columns}
+        report = drift_report(profile, drift_features(new_rows, scaler))
+        return ('drift' if report['drifted'].any() else 'stable'), report
+
+
+def refresh_ticker(ticker, start_date, end_date, registry_dir=DEFAULT_REGISTRY_DIR, detector=None, force=False,
+                   columns=None):
+    """
+    Checks one ticker's features for drift and retrains it only when needed.
+
+    Loading and feature engineering are cheap; the fit is the expensive part and only
+    runs for tickers without a model, with drifted inputs, or when forced.
+    :param columns: Columns to monitor for drift, see ModelRegistry.check_drift.
+    :return: Dict with ticker, status ('new', 'drift', 'forced', 'stable', 'pending', 'empty'
+        or 'error'), the new version if one was trained, the drifted columns and the error.
+    """
+    result = {'ticker': ticker, 'status': None, 'version': None, 'drifted': [], 'error': None}
+    try:
+        data = load_ohlcv(ticker, start_date, end_date)
+        if data.empty:
+            result['status'] = 'empty'
+            return result
+        features = engineer_features(clean_data(data))
+        if features.isnull().values.any():
+            features = clean_data(features)
+
+        registry = ModelRegistry(registry_dir)
+        status, report = registry.check_drift(ticker, features, columns)
+        if report is not None:
+            result['drifted'] = report.index[report['drifted']].tolist()
+        if force and status in ('stable', 'pending'):
+            status = 'forced'
+        result['status'] = status
+        if status not in ('new', 'drift', 'forced'):
+            return result
+
+        random_state = default_seed(None, ticker, features.index[0], features.index[-1], detector)
+        model = fit_model(features, detector=detector, random_state=random_state)
+        drift = report.loc[report['drifted'], ['psi', 'ks']].round(4).to_dict('index') if report is not None else {}
+        result['version'] = registry.register(ticker, model, features, reason=status, drift=drift,
+                                              detector=repr(model), random_state=random_state)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+def run_retraining(tickers, start_date=None, end_date=None, registry_dir=DEFAULT_REGISTRY_DIR, detector=None,
+                   workers=None, force=False, columns=None):
+    """
+    One pass of the retraining service over a ticker universe, in a process pool.
+    :param start_date: First date of the training window, LOOKBACK_DAYS before end_date by default.
+    :param end_date: End of the window (exclusive), today by default.
+    :return: List of refresh_ticker results.
+    """
+    end_date = pd.Timestamp(end_date or date.today())
+    start_date = pd.Timestamp(start_date or end_date - timedelta(days=LOOKBACK_DAYS))
+    os.makedirs(registry_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(refresh_ticker, ticker, start_date, end_date, registry_dir, detector, force, columns)
+                   for ticker in tickers]
+        return [future.result() for future in futures]
+
+
+def main():
+    # cli imports batch, which imports this module
+    from cli import detector_config, parse_param, read_tickers
+    from detectors import DETECTORS
+
+    parser = argparse.ArgumentParser(description='Retrain the registered models whose input features drifted.')
+    parser.add_argument('tickers', nargs='*')
+    parser.add_argument('--tickers-file', help='File with one ticker per line (# starts a comment).')
+    parser.add_argument('--start', default=None, help=f'Training window start (default: {LOOKBACK_DAYS} days before end).')
+    parser.add_argument('--end', default=None, help='Training window end, exclusive (default: today).')
+    parser.add_argument('--registry-dir', default=DEFAULT_REGISTRY_DIR)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='Retrain every ticker, drifted or not.')
+    parser.add_argument('--detector', default=None, choices=sorted(DETECTORS),
+                        help='Backend of retrained models (default: IsolationForest).')
+    parser.add_argument('--param', type=parse_param, action='append', default=[], metavar='KEY=VALUE',
+                        help='Detector parameter, repeatable, e.g. --param contamination=0.02.')
+    parser.add_argument('--columns', nargs='+', default=None,
+                        help=f"Feature columns to monitor (default: {' '.join(DRIFT_COLUMNS)}).")
+    parser.add_argument('--every', type=float, default=None, help='Repeat every this many hours instead of once.')
+    args = parser.parse_args()
+
+    tickers = read_tickers(args.tickers, args.tickers_file)
+    detector = detector_config(args.detector, args.param)
+
+    while True:
+        start = time.perf_counter()
+        results = run_retraining(tickers, args.start, args.end, args.registry_dir, detector=detector,
+                                 workers=args.workers, force=args.force, columns=args.columns)
+        retrained = [result for result in results if result['version'] is not None]
+        print(f'Checked {len(results)} tickers, retrained {len(retrained)} in {time.perf_counter() - start:.1f}s')
+        for result in results:
+            if result['status'] != 'stable':
+                detail = result['error'] or ', '.join(result['drifted'])
+                version = f" -> v{result['version']}" if result['version'] else ''
+                print(f"  {result['ticker']}: {result['status']}{version} {detail}")
+        if args.every is None:
+            break
+        time.sleep(args.every * 3600)
+
+
+if __name__ == '__main__':
+    main()
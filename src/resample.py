@@ -0,0 +1,167 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from features import DEFAULT_CONFIG, FeatureConfig
+from instrumentation import timed
+from store import load_ohlcv
+
+# Bar sizes the dashboard offers, in nanoseconds
+RESOLUTIONS = {
+    '1m': 60 * 10**9,
+    '5m': 5 * 60 * 10**9,
+    '15m': 15 * 60 * 10**9,
+    '1h': 60 * 60 * 10**9,
+    '1d': 24 * 60 * 60 * 10**9,
+}
+# Regular US session; feature windows are given in trading days and scaled by this
+SESSION_MINUTES = 390
+# Resampled frames kept in memory
+CACHE_ENTRIES = 64
+
+
+@timed('resample_ohlcv')
+def resample_ohlcv(data, resolution):
+    """
+    Aggregates bars into coarser ones: first Open, max High, min Low, last Close, summed Volume.
+
+    Bars are bucketed by flooring their epoch timestamp to the resolution (so buckets are
+    labelled by their start, like DataFrame.resample), and every column is reduced with
+    one np.*.reduceat call instead of a groupby. Missing values inside a bucket are
+    skipped; empty buckets produce no bar.
+    :param data: OHLCV DataFrame with a sorted DatetimeIndex, e.g. 1-minute bars.
+    :param resolution: Key of RESOLUTIONS.
+    :return: Resampled DataFrame with the same columns; other columns (e.g. Adj Close) take the last value.
+    """
+    if data.empty:
+        return data.copy()
+    step = RESOLUTIONS[resolution]
+    stamps = data.index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    buckets = stamps // step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+
+    positions = np.arange(len(buckets))
+
+    def first_valid(values):
+        first = np.minimum.reduceat(np.where(np.isnan(values), len(values), positions), starts)
+        return np.where(first <= ends, values[np.minimum(first, len(values) - 1)], np.nan)
+
+    def last_valid(values):
+        last = np.maximum.reduceat(np.where(np.isnan(values), -1, positions), starts)
+        return np.where(last >= starts, values[np.maximum(last, 0)], np.nan)
+
+    columns = {}
+    for column in data.columns:
+        values = data[column].to_numpy(dtype=float)
+        if column == 'Open':
+            columns[column] = first_valid(values)
+        elif column == 'High':
+            columns[column] = np.fmax.reduceat(values, starts)
+        elif column == 'Low':
+            columns[column] = np.fmin.reduceat(values, starts)
+        elif column == 'Volume':
+            columns[column] = np.add.reduceat(np.nan_to_num(values), starts)
+        else:
+            columns[column] = last_valid(values)
+    index = pd.DatetimeIndex((buckets[starts] * step).astype('datetime64[ns]'), name=data.index.name)
+    if data.index.tz is not None:
+        # Buckets are floored in UTC, which keeps US sessions within one day and whole hours
+        index = index.tz_localize('UTC').tz_convert(data.index.tz)
+    return pd.DataFrame(columns, index=index)
+
+
+def time_aware_config(config=DEFAULT_CONFIG, resolution='1d', session_minutes=SESSION_MINUTES):
+    """
+    Converts feature windows from trading days to bars at a resolution, so MA_5 still spans
+    five trading days on 5-minute bars (where it becomes MA_390).
+    The windows of config are read as trading days, which is what they mean on daily bars.
+    """
+    if resolution == '1d':
+        return config
+    bars_per_day = max(1, session_minutes * 60 * 10**9 // RESOLUTIONS[resolution])
+
+    def scale(windows):
+        return tuple(w * bars_per_day for w in windows)
+
+    return FeatureConfig(
+        ma_windows=scale(config.ma_windows),
+        pct_change=config.pct_change,
+        volume_scaled=config.volume_scaled,
+        volatility_windows=scale(config.volatility_windows),
+        rsi_windows=scale(config.rsi_windows),
+        volume_zscore_windows=scale(config.volume_zscore_windows),
+    )
+
+
+class NoIntradayData(ValueError):
+    """Raised when the store has no 1-minute bars for a range, e.g. one older than the source keeps them."""
+
+
+class BarCache:
+    """
+    LRU cache of resampled bars per ticker, range and resolution.
+
+    Entries remember the first and last timestamp and the length of the base bars they were
+    built from, so new minute bars arriving in the store invalidate them automatically.
+    """
+
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, base):
+        version = (len(base), base.index[0], base.index[-1]) if len(base) else (0,)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+        return None
+
+    def put(self, key, base, bars):
+        version = (len(base), base.index[0], base.index[-1]) if len(base) else (0,)
+        with self._lock:
+            self._entries[key] = (version, bars)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_default_cache = None
+
+
+def get_bar_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = BarCache()
+    return _default_cache
+
+
+def load_bars(ticker, start, end, resolution='1d', cache=None):
+    """
+    Bars for ticker in [start, end) at any resolution in RESOLUTIONS.
+
+    Daily bars come straight from the store, which has the long daily history. Intraday
+    resolutions are derived from the 1-minute bars, which are downloaded once; switching
+    between 5m, 15m and 1h only resamples them again (or hits the cache).
+    """
+    if resolution == '1d':
+        return load_ohlcv(ticker, start, end)
+    base = load_ohlcv(ticker, start, end, interval='1m')
+    if base.empty:
+        raise NoIntradayData(f'No intraday data for {ticker} in this range; 1-minute bars only go back about '
+                             f'30 days, so pick a recent range or the 1d resolution.')
+    if resolution == '1m':
+        return base
+
+    cache = cache if cache is not None else get_bar_cache()
+    key = (ticker, str(pd.Timestamp(start)), str(pd.Timestamp(end)), resolution)
+    bars = cache.get(key, base)
+    if bars is None:
+        bars = resample_ohlcv(base, resolution)
+        cache.put(key, base, bars)
+    return bars.copy()
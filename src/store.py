@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import yfinance as yf
+
+from instrumentation import span, timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_DIR = os.environ.get(
+    'ANOM_DATA_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'ohlcv')
+)
+# Hours before a range the source answered with no bars is asked for again; an empty answer may be a
+# weekend or holiday, but also an outage the source did not report
+EMPTY_RETRY_HOURS = 6
+
+
+class FetchError(Exception):
+    """Raised by a source when it could not answer; the range is not marked as covered."""
+
+
+class YahooSource:
+    """Fetches OHLCV bars from Yahoo Finance, daily unless another interval (e.g. '1m') is asked for."""
+
+    # Intervals Yahoo only serves for the last so many days, and the most days one request may span
+    history_days = {'1m': 30}
+    max_request_days = {'1m': 7}
+
+    def fetch(self, ticker, start, end, interval='1d'):
+        data = yf.download(ticker, start=start, end=end, interval=interval, progress=False)
+        # yf.download logs network errors and rate limits and returns an empty frame instead of raising
+        error = getattr(yf.shared, '_ERRORS', {}).get(ticker.upper())
+        if data.empty and error:
+            raise FetchError(f'{ticker}: {error}')
+        # Newer yfinance versions return (field, ticker) column pairs even for one ticker
+        if isinstance(data.columns, pd.MultiIndex):
+            data.columns = data.columns.get_level_values(0)
+        return data
+
+
+class CSVSource:
+    """
+    Serves OHLCV bars from local CSV files named <TICKER>.csv (daily) or <TICKER>@<interval>.csv,
+    e.g. test fixtures.
+    :param directory: Folder containing the CSV files. The first column must be the date.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, ticker, start, end, interval='1d'):
+        path = os.path.join(self.directory, f'{_file_stem(ticker, interval)}.csv')
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        data = pd.read_csv(path, index_col=0, parse_dates=True)
+        if not isinstance(data.index, pd.DatetimeIndex):
+            # Intraday files spanning a DST change mix UTC offsets, which only parse as UTC
+            data.index = pd.to_datetime(data.index, utc=True)
+        tz = data.index.tz
+        return data[(data.index >= _as_tz(start, tz)) & (data.index < _as_tz(end, tz))]
+
+
+def _as_tz(stamp, tz):
+    """stamp comparable with an index in tz; naive dates are read as wall-clock times there."""
+    stamp = pd.Timestamp(stamp)
+    if tz is None:
+        return stamp.tz_localize(None) if stamp.tz is not None else stamp
+    return stamp.tz_localize(tz) if stamp.tz is None else stamp.tz_convert(tz)
+
+
+def _file_stem(ticker, interval):
+    # Daily bars keep the original file names
+    return ticker if interval == '1d' else f'{ticker}@{interval}'
+
+
+def _merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _missing_intervals(covered, start, end):
+    gaps = []
+    cursor = start
+    for cov_start, cov_end in covered:
+        if cov_end <= cursor:
+            continue
+        if cov_start >= end:
+            break
+        if cov_start > cursor:
+            gaps.append((cursor, cov_start))
+        cursor = max(cursor, cov_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class OHLCVStore:
+    """
+    On-disk OHLCV store with one Parquet file per ticker.
+
+    Each ticker also keeps a small JSON file listing the date ranges the source has
+    already answered, so they are not fetched again. Only the missing gaps of a
+    requested range go to the source; everything else is served from disk. Gaps whose
+    fetch failed are not recorded, and gaps answered with no bars are only skipped for
+    EMPTY_RETRY_HOURS. Fetches run without holding any lock, so a slow download never
+    blocks loads of other tickers.
+    :param data_dir: Folder for the Parquet and coverage files.
+    :param source: Object with a fetch(ticker, start, end[, interval]) method. Defaults to Yahoo.
+    """
+
+    def __init__(self, data_dir=DEFAULT_DATA_DIR, source=None):
+        self.data_dir = data_dir
+        self.source = source if source is not None else YahooSource()
+        self._frames = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def _data_path(self, ticker, interval='1d'):
+        return os.path.join(self.data_dir, f'{_file_stem(ticker, interval)}.parquet')
+
+    def _coverage_path(self, ticker, interval='1d'):
+        return os.path.join(self.data_dir, f'{_file_stem(ticker, interval)}.json')
+
+    def _key_lock(self, ticker, interval):
+        # One lock per ticker and interval; the store-wide lock only guards this dict
+        with self._lock:
+            return self._locks.setdefault((ticker, interval), threading.Lock())
+
+    def _read_coverage(self, ticker, interval='1d'):
+        """{'covered': [[start, end]], 'empty': [[start, end, retry_at]]}; older files are a plain covered list."""
+        path = self._coverage_path(ticker, interval)
+        if not os.path.exists(path):
+            return {'covered': [], 'empty': []}
+        with open(path) as f:
+            raw = json.load(f)
+        if isinstance(raw, list):
+            raw = {'covered': raw, 'empty': []}
+        return {
+            'covered': [[pd.Timestamp(s), pd.Timestamp(e)] for s, e in raw['covered']],
+            'empty': [[pd.Timestamp(s), pd.Timestamp(e), retry_at] for s, e, retry_at in raw['empty']],
+        }
+
+    def _write_coverage(self, ticker, coverage, interval='1d'):
+        now = time.time()
+        raw = {
+            'covered': [[s.isoformat(), e.isoformat()] for s, e in _merge_intervals(coverage['covered'])],
+            'empty': [[s.isoformat(), e.isoformat(), retry_at] for s, e, retry_at in coverage['empty']
+                      if retry_at > now],
+        }
+        with open(self._coverage_path(ticker, interval), 'w') as f:
+            json.dump(raw, f)
+
+    def _read_frame(self, ticker, interval='1d'):
+        if (ticker, interval) not in self._frames:
+            path = self._data_path(ticker, interval)
+            self._frames[ticker, interval] = pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame()
+        return self._frames[ticker, interval]
+
+    def _request_ranges(self, gaps, interval):
+        """
+        Gaps cut to what the source can serve: ranges older than its history for the interval are
+        dropped (so they are neither fetched nor recorded as covered) and long ones split into requests.
+        """
+        history = getattr(self.source, 'history_days', {}).get(interval)
+        if history:
+            earliest = pd.Timestamp.today().normalize() - pd.Timedelta(days=history - 1)
+            gaps = [[max(gap_start, earliest), gap_end] for gap_start, gap_end in gaps if gap_end > earliest]
+        limit = getattr(self.source, 'max_request_days', {}).get(interval)
+        if not limit:
+            return gaps
+        step = pd.Timedelta(days=limit)
+        requests = []
+        for gap_start, gap_end in gaps:
+            while gap_start < gap_end:
+                requests.append([gap_start, min(gap_start + step, gap_end)])
+                gap_start += step
+        return requests
+
+    def _fetch(self, ticker, start, end, interval):
+        # Sources written before intraday support only take (ticker, start, end)
+        if interval == '1d':
+            return self.source.fetch(ticker, start, end)
+        return self.source.fetch(ticker, start, end, interval=interval)
+
+    @timed('load_ohlcv')
+    def load(self, ticker, start, end, interval='1d'):
+        """
+        Returns the bars for ticker in [start, end), fetching only what is not on disk yet.
+        :param ticker: Ticker symbol.
+        :param start: Inclusive start date.
+        :param end: Exclusive end date, as with yf.download.
+        :param interval: Bar size as understood by the source, e.g. '1d' or '1m'. Each interval
+            is stored separately; coarser bars can be derived from '1m' with resample.py.
+        :return: DataFrame indexed by date.
+        """
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        key_lock = self._key_lock(ticker, interval)
+
+        with key_lock:
+            coverage = self._read_coverage(ticker, interval)
+            now = time.time()
+            known = coverage['covered'] + [[s, e] for s, e, retry_at in coverage['empty'] if retry_at > now]
+            gaps = self._request_ranges(_missing_intervals(_merge_intervals(known), start, end), interval)
+
+        errors = []
+        if gaps:
+            answered, fetched = [], []
+            with span('source_fetch'):
+                for gap_start, gap_end in gaps:
+                    try:
+                        part = self._fetch(ticker, gap_start, gap_end, interval)
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    answered.append((gap_start, gap_end, part.empty))
+                    if not part.empty:
+                        fetched.append(part)
+
+            with key_lock:
+                frame = self._read_frame(ticker, interval)
+                if fetched:
+                    frame = pd.concat([frame] + fetched) if not frame.empty else pd.concat(fetched)
+                    frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+                    frame.to_parquet(self._data_path(ticker, interval))
+                    self._frames[ticker, interval] = frame
+
+                # Re-read: another thread may have recorded coverage while we were fetching
+                coverage = self._read_coverage(ticker, interval)
+                # Today's bar may still change, so never mark it as covered
+                today = pd.Timestamp.today().normalize()
+                retry_at = time.time() + EMPTY_RETRY_HOURS * 3600
+                for gap_start, gap_end, empty in answered:
+                    if gap_start >= today:
+                        continue
+                    if empty:
+                        coverage['empty'].append([gap_start, min(gap_end, today), retry_at])
+                    else:
+                        coverage['covered'].append([gap_start, min(gap_end, today)])
+                if answered:
+                    self._write_coverage(ticker, coverage, interval)
+
+        with key_lock:
+            frame = self._read_frame(ticker, interval)
+        if not frame.empty:
+            # Intraday bars from Yahoo carry the exchange's time zone
+            tz = frame.index.tz
+            frame = frame[(frame.index >= _as_tz(start, tz)) & (frame.index < _as_tz(end, tz))]
+        if errors:
+            if frame.empty:
+                raise errors[0]
+            logger.warning('Serving partial %s %s bars for %s..%s: %s', ticker, interval, start.date(), end.date(),
+                           errors[0])
+        return frame.copy()
+
+
+_default_store = None
+
+
+def get_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = OHLCVStore()
+    return _default_store
+
+
+def load_ohlcv(ticker, start, end, store=None, interval='1d'):
+    """Loads [start, end) bars for ticker through the shared store."""
+    store = store if store is not None else get_store()
+    return store.load(ticker, start, end, interval)
@@ -0,0 +1,188 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from anom import clean_data, engineer_features
+from fingerprint import default_seed
+
+
+class StreamingDetector:
+    """
+    Long-lived detector that scores one bar at a time.
+
+    It keeps a fitted IsolationForest plus the rolling state behind the features of
+    engineer_features (last 10 closes with running sums for MA_5/MA_10, the previous
+    close for Pct_change, volume mean/std for Volume_scaled), so scoring a new bar
+    is O(1) feature work and one small score_samples call. The model is refit in the
+    background every retrain_every bars, or earlier when the recent score level
+    drifts away from what the model saw at fit time.
+    :param history: OHLCV DataFrame with at least 10 bars, used for the first fit. Missing values
+        are cleaned like clean_data, and missing or non-finite fields of later bars are forward filled.
+    :param window: Number of most recent bars kept for retraining.
+    :param retrain_every: Bars between scheduled retrains. None disables scheduled retrains.
+    :param drift_threshold: Retrain when the EWMA of scores moves this many standard deviations
+        from the training score mean. None disables drift retrains.
+    :param executor: Optional executor shared by many detectors for background retrains.
+    """
+
+    def __init__(self, history, n_estimators=100, contamination=0.01, window=2000, retrain_every=500,
+                 drift_threshold=3.0, drift_alpha=0.05, random_state=None, executor=None):
+        # The rolling state starts from the cleaned bars, so a gap in the history cannot poison its sums
+        history = clean_data(history.copy())
+        if len(history) < 10:
+            raise ValueError("StreamingDetector needs at least 10 bars of history.")
+
+        self.n_estimators = n_estimators
+        self.contamination = contamination
+        self.retrain_every = retrain_every
+        self.drift_threshold = drift_threshold
+        self.drift_alpha = drift_alpha
+        # Retrains reuse the seed, so the same bars always give the same model
+        self.random_state = default_seed(random_state, n_estimators, contamination, window)
+        self.executor = executor
+
+        self.columns = list(history.columns)
+        self.index_name = history.index.name
+        self.bars = deque(zip(history.index, history[self.columns].to_numpy(dtype=float)), maxlen=window)
+
+        self._lock = threading.Lock()
+        self._retrain_future = None
+        self._retrain_thread = None
+        self.retrains = 0
+
+        closes = history['Close'].to_numpy(dtype=float)[-10:]
+        self._closes = deque(closes, maxlen=10)
+        self._sum5 = closes[-5:].sum()
+        self._sum10 = closes.sum()
+        self._prev_close = closes[-1]
+        self._last_values = history[self.columns].to_numpy(dtype=float)[-1]
+
+        self._install(*self._fit(history))
+
+    def _fit(self, history):
+        cleaned_data = clean_data(history.copy())
+        featured_data = engineer_features(cleaned_data)
+        if featured_data.isnull().values.any():
+            featured_data = clean_data(featured_data)
+
+        features = featured_data.to_numpy(dtype=float)
+        model = IsolationForest(n_estimators=self.n_estimators, contamination=self.contamination,
+                                random_state=self.random_state)
+        model.fit(features)
+        scores = model.score_samples(features)
+
+        volume = cleaned_data['Volume'].to_numpy(dtype=float)
+        volume_std = volume.std() or 1.0
+        return model, volume.mean(), volume_std, scores.mean(), scores.std() or 1.0
+
+    def _install(self, model, volume_mean, volume_std, score_mean, score_std):
+        with self._lock:
+            self.model = model
+            self._volume_mean = volume_mean
+            self._volume_std = volume_std
+            self._score_mean = score_mean
+            self._score_std = score_std
+            self._score_ewma = score_mean
+            self._bars_since_fit = 0
+
+    def _history_frame(self):
+        timestamps, values = zip(*self.bars)
+        return pd.DataFrame(np.array(values), columns=self.columns,
+                            index=pd.Index(timestamps, name=self.index_name))
+
+    def _retrain(self, history):
+        self._install(*self._fit(history))
+        self.retrains += 1
+
+    def retrain_in_background(self):
+        """Starts a refit on the buffered bars unless one is already running."""
+        if self.retraining:
+            return
+        # Snapshot on the calling thread; the buffer keeps changing while the refit runs
+        history = self._history_frame()
+        if self.executor is not None:
+            self._retrain_future = self.executor.submit(self._retrain, history)
+        else:
+            self._retrain_thread = threading.Thread(target=self._retrain, args=(history,), daemon=True)
+            self._retrain_thread.start()
+
+    @property
+    def retraining(self):
+        if self._retrain_future is not None:
+            return not self._retrain_future.done()
+        return self._retrain_thread is not None and self._retrain_thread.is_alive()
+
+    def update(self, timestamp, bar):
+        """
+        Scores one new bar and adds it to the rolling state.
+        :param timestamp: Bar timestamp.
+        :param bar: Mapping with the same OHLCV fields as the history frame.
+        :return: score (lower is more anomalous), is_anomaly
+        """
+        values = np.array([float(bar[column]) for column in self.columns])
+        # Forward fill missing fields, as clean_data does for batch runs
+        values = np.where(np.isfinite(values), values, self._last_values)
+        self._last_values = values
+        close = values[self.columns.index('Close')]
+        volume = values[self.columns.index('Volume')]
+
+        # Running sums keep MA_5 and MA_10 O(1) per bar
+        if len(self._closes) >= 5:
+            self._sum5 -= self._closes[-5]
+        if len(self._closes) == 10:
+            self._sum10 -= self._closes[0]
+        self._closes.append(close)
+        self._sum5 += close
+        self._sum10 += close
+        pct_change = close / self._prev_close - 1.0 if self._prev_close else 0.0
+        self._prev_close = close
+
+        with self._lock:
+            model = self.model
+            volume_scaled = (volume - self._volume_mean) / self._volume_std
+
+            row = np.empty((1, len(self.columns) + 4))
+            row[0, :len(self.columns)] = values
+            row[0, -4:] = (self._sum5 / 5, self._sum10 / 10, pct_change, volume_scaled)
+
+            score = model.score_samples(row)[0]
+            is_anomaly = score < model.offset_
+
+            self._score_ewma += self.drift_alpha * (score - self._score_ewma)
+            self._bars_since_fit += 1
+            drifted = (self.drift_threshold is not None and
+                       abs(self._score_ewma - self._score_mean) > self.drift_threshold * self._score_std)
+            scheduled = self.retrain_every is not None and self._bars_since_fit >= self.retrain_every
+
+        self.bars.append((timestamp, values))
+        if drifted or scheduled:
+            self.retrain_in_background()
+
+        return score, bool(is_anomaly)
+
+
+class StreamingMonitor:
+    """
+    Keeps one StreamingDetector per symbol and shares a small thread pool for their retrains.
+    :param retrain_workers: Maximum number of concurrent background retrains.
+    """
+
+    def __init__(self, retrain_workers=2, **detector_params):
+        self.executor = ThreadPoolExecutor(max_workers=retrain_workers)
+        self.detector_params = detector_params
+        self.detectors = {}
+
+    def add(self, ticker, history):
+        random_state = default_seed(self.detector_params.get('random_state'), ticker, self.detector_params)
+        params = {**self.detector_params, 'random_state': random_state}
+        self.detectors[ticker] = StreamingDetector(history, executor=self.executor, **params)
+
+    def update(self, ticker, timestamp, bar):
+        return self.detectors[ticker].update(timestamp, bar)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
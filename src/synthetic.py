@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+
+def generate_ohlcv(rows, seed=0, start='2000-01-03', freq='B', drift=0.0002, volatility=0.01,
+                   spike_rate=0.005, spike_size=8.0, gap_rate=0.001):
+    """
+    Deterministic synthetic OHLCV bars: geometric Brownian motion with injected spikes and gaps.
+    :param rows: Number of bars.
+    :param seed: Random seed; the same seed always gives the same data.
+    :param freq: Bar frequency for the DatetimeIndex. Use 'min' for very long series.
+    :param spike_rate: Share of bars that get a price shock of spike_size standard deviations
+        together with a volume burst. These are the labelled anomalies.
+    :param gap_rate: Share of bars whose values are set to NaN, to exercise clean_data.
+    :return: data DataFrame, labels Series (-1 for spikes, 1 otherwise)
+    """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(drift, volatility, rows)
+
+    n_spikes = int(round(rows * spike_rate))
+    spikes = rng.choice(rows, size=n_spikes, replace=False) if n_spikes else np.array([], dtype=int)
+    returns[spikes] += rng.choice([-1.0, 1.0], size=n_spikes) * spike_size * volatility
+
+    close = 100.0 * np.exp(np.cumsum(returns))
+    open_ = np.empty(rows)
+    open_[0] = 100.0
+    open_[1:] = close[:-1]
+    wick = np.abs(rng.normal(0, volatility / 2, rows))
+    high = np.maximum(open_, close) * (1 + wick)
+    low = np.minimum(open_, close) * (1 - wick)
+    volume = rng.lognormal(13, 0.3, rows)
+    volume[spikes] *= 5
+
+    data = pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume},
+                        index=pd.date_range(start, periods=rows, freq=freq, name='Date'))
+
+    n_gaps = int(round(rows * gap_rate))
+    if n_gaps:
+        gaps = rng.choice(rows, size=n_gaps, replace=False)
+        data.iloc[gaps] = np.nan
+
+    labels = pd.Series(1, index=data.index, name='label')
+    labels.iloc[spikes] = -1
+    return data, labels
+
+
+def generate_universe(n_tickers, rows, seed=0, **params):
+    """
+    One independent synthetic series per ticker, named SYN0000, SYN0001, ...
+    :return: Dict of ticker -> (data, labels)
+    """
+    return {f'SYN{i:04d}': generate_ohlcv(rows, seed=seed + i, **params) for i in range(n_tickers)}
@@ -0,0 +1,175 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import pandas as pd
+
+from anom import clean_data, engineer_features
+from instrumentation import span
+from model_cache import cached_detect_anomalies
+from resample import load_bars, time_aware_config
+
+logger = logging.getLogger(__name__)
+
+# The dashboards' dropdown tickers
+DEFAULT_TICKERS = ['AAPL', 'GOOGL', 'MSFT', 'AMZN', 'NYA', 'GME']
+# Seconds between refreshes of the warm views; today's bar keeps changing until the close
+REFRESH_SECONDS = float(os.environ.get('ANOM_WARMUP_INTERVAL', 3600))
+# Views kept besides the warmed defaults, which are never evicted
+VIEW_CACHE_ENTRIES = int(os.environ.get('ANOM_VIEW_CACHE_ENTRIES', 32))
+
+
+def default_ranges(today=None):
+    """The dashboards' default date range plus the last twelve months."""
+    today = today or date.today()
+    return [(date(2020, 1, 1), date(2020, 12, 31)), (today - timedelta(days=365), today)]
+
+
+def _key(ticker, start_date, end_date, resolution='1d'):
+    # The date pickers send either 'YYYY-MM-DD' or 'YYYY-MM-DDT00:00:00'
+    return (ticker, pd.Timestamp(start_date).date().isoformat(), pd.Timestamp(end_date).date().isoformat(),
+            resolution)
+
+
+def compute_view(ticker, start_date, end_date, progress=None, resolution='1d'):
+    """
+    Everything the dashboard callbacks need for one ticker and date range.
+    :param progress: Optional function called as progress(fraction, message) between stages.
+    :param resolution: Bar size, see resample.RESOLUTIONS. Feature windows keep their length in trading days.
+    :return: Dict with the raw 'data', the 'features' (with an 'anomaly' column) and the 'anomalies' rows.
+    """
+    progress = progress or (lambda fraction, message: None)
+    progress(0.1, 'Loading prices')
+    df = load_bars(ticker, pd.to_datetime(start_date), pd.to_datetime(end_date), resolution)
+    progress(0.4, 'Engineering features')
+    config = time_aware_config(resolution=resolution)
+    featured_data = engineer_features(clean_data(df), config)
+    progress(0.6, 'Detecting anomalies')
+    anomalies = cached_detect_anomalies(featured_data, ticker, feature_config=config)
+    return {'data': df, 'features': featured_data, 'anomalies': anomalies}
+
+
+class ViewCache:
+    """
+    Computed dashboard views shared by the warm-up thread and the callbacks.
+
+    Entries are replaced whole, never modified, so callbacks can read them without
+    copying as long as they do not mutate the frames. Views the callbacks compute are
+    evicted least-recently-used first beyond max_entries; pinned views (the warmed
+    defaults) do not count towards the bound and stay until they are unpinned.
+    :param max_entries: Maximum number of unpinned views kept in memory.
+    """
+
+    def __init__(self, max_entries=VIEW_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._views = OrderedDict()
+        self._pinned = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ticker, start_date, end_date, resolution='1d'):
+        key = _key(ticker, start_date, end_date, resolution)
+        with self._lock:
+            view = self._views.get(key)
+            if view is None:
+                self.misses += 1
+            else:
+                self._views.move_to_end(key)
+                self.hits += 1
+            return view
+
+    def put(self, ticker, start_date, end_date, view, resolution='1d', pin=False):
+        key = _key(ticker, start_date, end_date, resolution)
+        with self._lock:
+            self._views[key] = view
+            self._views.move_to_end(key)
+            if pin:
+                self._pinned.add(key)
+            self._evict()
+
+    def retain_pins(self, keys):
+        """Unpins every view whose key is not in keys, e.g. default ranges that moved on since the last refresh."""
+        with self._lock:
+            self._pinned &= set(keys)
+            self._evict()
+
+    def _evict(self):
+        unpinned = [key for key in self._views if key not in self._pinned]
+        for key in unpinned[:max(len(unpinned) - self.max_entries, 0)]:
+            del self._views[key]
+
+    def get_or_compute(self, ticker, start_date, end_date, progress=None, resolution='1d'):
+        """The cached view, or a freshly computed one on a miss (which is then cached too)."""
+        view = self.get(ticker, start_date, end_date, resolution)
+        if view is None:
+            with span('view_compute'):
+                view = compute_view(ticker, start_date, end_date, progress, resolution)
+            self.put(ticker, start_date, end_date, view, resolution)
+        return view
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._views),
+                    'pinned': len(self._pinned)}
+
+
+class Warmer(threading.Thread):
+    """
+    Daemon thread that computes the default views into a ViewCache, then refreshes them every `interval` seconds.
+    :param ranges: List of (start, end) dates, default_ranges() when None (re-evaluated on each refresh).
+    """
+
+    def __init__(self, cache, tickers=DEFAULT_TICKERS, ranges=None, interval=REFRESH_SECONDS):
+        super().__init__(name='anom-warmup', daemon=True)
+        self.cache = cache
+        self.tickers = list(tickers)
+        self.ranges = ranges
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def refresh(self):
+        ranges = self.ranges or default_ranges()
+        for start_date, end_date in ranges:
+            for ticker in self.tickers:
+                if self._stop_event.is_set():
+                    return
+                try:
+                    with span('warmup'):
+                        self.cache.put(ticker, start_date, end_date, compute_view(ticker, start_date, end_date),
+                                       pin=True)
+                except Exception:
+                    logger.exception('Warming %s %s..%s failed', ticker, start_date, end_date)
+        # Yesterday's trailing year is an ordinary view now
+        self.cache.retain_pins([_key(ticker, start_date, end_date) for start_date, end_date in ranges
+                                for ticker in self.tickers])
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_default_cache = None
+_default_warmer = None
+
+
+def get_view_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ViewCache()
+    return _default_cache
+
+
+def start_warmer(**params):
+    """Starts the shared warm-up thread once per process; set ANOM_WARMUP=0 to disable it."""
+    global _default_warmer
+    if _default_warmer is None and os.environ.get('ANOM_WARMUP', '1') != '0':
+        _default_warmer = Warmer(get_view_cache(), **params)
+        _default_warmer.start()
+    return _default_warmer
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from anom import clean_data, engineer_features
+from chunked import chunk_source, feature_chunks, global_stats
+from features import DEFAULT_CONFIG, FeatureConfig
+
+
+def make_series(rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, rows))
+    data = pd.DataFrame({
+        'Open': close + rng.normal(0, 0.5, rows),
+        'High': close + 1,
+        'Low': close - 1,
+        'Close': close,
+        'Volume': rng.integers(1_000, 10_000, rows).astype(float),
+    }, index=pd.bdate_range('2020-01-01', periods=rows, name='Date'))
+    # Leading gaps of different lengths (filled with column means) and interior gaps (forward filled)
+    data.iloc[:4] = np.nan
+    data.iloc[:7, data.columns.get_loc('Close')] = np.nan
+    data.iloc[:9, data.columns.get_loc('Volume')] = np.nan
+    data.iloc[120:135] = np.nan
+    data.iloc[301, data.columns.get_loc('Open')] = np.nan
+    return data
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 499, 500, 10_000])
+@pytest.mark.parametrize('config', [DEFAULT_CONFIG, FeatureConfig(volatility_windows=(10,), rsi_windows=(14,),
+                                                                  volume_zscore_windows=(20,))])
+def test_feature_chunks_match_in_memory(chunk_size, config):
+    data = make_series()
+    expected = engineer_features(clean_data(data), config)
+
+    read_blocks = chunk_source(data, chunk_size)
+    stats = global_stats(read_blocks, config)
+    result = pd.concat(feature_chunks(read_blocks, stats, config))
+
+    assert stats['rows'] == len(data)
+    pd.testing.assert_frame_equal(result, expected, check_freq=False, rtol=1e-9)
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from downsample import downsample_for_view, relayout_range
+
+
+def test_zoom_on_tz_aware_intraday_chart():
+    index = pd.date_range('2024-03-04 09:30', periods=5 * 390, freq='1min', tz='America/New_York', name='Datetime')
+    data = pd.DataFrame({'Close': 100 + np.sin(np.arange(len(index)) / 50)}, index=index)
+    # Plotly reports the zoomed range in the wall-clock times the chart shows
+    view_range = relayout_range({'xaxis.range[0]': '2024-03-04 10:00:00', 'xaxis.range[1]': '2024-03-04 11:00:00'})
+
+    shown = downsample_for_view(data, view_range=view_range, n_points=200)
+
+    visible = shown.loc['2024-03-04 10:00':'2024-03-04 11:00']
+    # The 61 visible bars fit in the budget, so all of them are kept at full resolution
+    assert len(visible) == 61
+    assert shown.index.is_monotonic_increasing
+    assert len(shown) < len(data)
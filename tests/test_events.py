@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from events import build_score_matrix, detect_events, mean_correlation, window_correlation
+
+
+@pytest.fixture
+def scores():
+    dates = pd.bdate_range('2020-01-01', periods=60)
+    tickers = [f'T{i:02d}' for i in range(20)]
+    keys = pd.DataFrame([(ticker, day) for day in dates for ticker in tickers], columns=['ticker', 'date'])
+    rng = np.random.default_rng(0)
+    keys['score'] = -rng.uniform(0.3, 0.5, len(keys))
+    keys['anomaly'] = np.where(rng.random(len(keys)) < 0.02, -1, 1)
+    # Every ticker spikes on one date
+    keys.loc[keys['date'] == dates[30], 'anomaly'] = -1
+    return build_score_matrix(keys)
+
+
+@pytest.mark.parametrize('window', [1, 3])
+def test_range_without_dates_gives_empty_results(scores, window):
+    timeline, events = detect_events(scores, '2018-01-01', '2018-12-31', window=window)
+    assert timeline.empty
+    assert events.empty
+
+
+def test_market_wide_spike_is_one_event(scores):
+    _, events = detect_events(scores, window=3)
+    assert len(events) >= 1
+    assert (events['tickers'] == 20).any()
+
+
+def test_window_correlation_matches_last_rolling_value():
+    rng = np.random.default_rng(1)
+    common = rng.normal(size=(60, 1))
+    returns = pd.DataFrame(common + rng.normal(scale=0.5, size=(60, 5)))
+    returns.iloc[3, 2] = np.nan
+    returns[5] = 0.0
+
+    assert window_correlation(returns.to_numpy()) == pytest.approx(mean_correlation(returns, 60).iloc[-1])
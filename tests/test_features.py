@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from anom import engineer_features
+
+
+def legacy_engineer_features(data):
+    """The original pandas implementation of engineer_features, kept as the reference."""
+    data = data.copy()
+    data['MA_5'] = data['Close'].rolling(window=5).mean()
+    data['MA_10'] = data['Close'].rolling(window=10).mean()
+    data['Pct_change'] = data['Close'].pct_change()
+
+    data['MA_5'] = data['MA_5'].fillna(value=data['Close'].mean())
+    data['MA_10'] = data['MA_10'].fillna(value=data['Close'].mean())
+    data['Pct_change'] = data['Pct_change'].fillna(value=data['Pct_change'].mean())
+
+    data['Volume_scaled'] = StandardScaler().fit_transform(data[['Volume']])
+    return data
+
+
+def make_series(rows, level, seed):
+    rng = np.random.default_rng(seed)
+    # Random walk far from zero, where running sums lose the most precision
+    close = level * np.exp(np.cumsum(rng.normal(0, 0.02, rows)))
+    return pd.DataFrame({
+        'Open': close * (1 + rng.normal(0, 0.005, rows)),
+        'High': close * 1.01,
+        'Low': close * 0.99,
+        'Close': close,
+        'Volume': rng.integers(10_000, 5_000_000, rows).astype(float),
+    }, index=pd.bdate_range('1990-01-01', periods=rows, name='Date'))
+
+
+@pytest.mark.parametrize('rows, level', [(12, 1.0), (500, 150.0), (20_000, 5_000.0)])
+def test_engineer_features_matches_legacy_pandas_implementation(rows, level):
+    data = make_series(rows, level, seed=rows)
+    # Running sums carry rounding error that grows with the series (about 1e-10 relative at 20,000 bars)
+    pd.testing.assert_frame_equal(engineer_features(data), legacy_engineer_features(data),
+                                  check_exact=False, rtol=1e-9, atol=1e-9)
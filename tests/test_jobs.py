@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from jobs import JobManager
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=2)
+    yield manager
+    manager._executor.shutdown(wait=True)
+
+
+def test_identical_requests_share_a_successful_job(manager):
+    calls = []
+    first = manager.submit('key', lambda job: calls.append(1) or 'result')
+    assert first.future.result() == 'result'
+
+    assert manager.submit('key', lambda job: calls.append(1)) is first
+    assert calls == [1]
+
+
+def test_failed_job_is_retried_but_stays_visible_to_pollers(manager):
+    def fail(job):
+        raise RuntimeError('provider down')
+
+    failed = manager.submit('key', fail)
+    with pytest.raises(RuntimeError):
+        failed.future.result()
+    # Polling clients still see the error
+    assert manager.get('key') is failed
+
+    retried = manager.submit('key', lambda job: 'result')
+    assert retried is not failed
+    assert retried.future.result() == 'result'
+    assert manager.get('key') is retried
+
+
+def test_cancelled_job_is_not_reused(manager):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(job):
+        started.set()
+        release.wait(5)
+        job.set_progress(0.5)
+        return 'stale'
+
+    job = manager.submit('key', slow)
+    started.wait(5)
+    manager.release('key')
+    release.set()
+    assert manager.get('key') is None
+
+    again = manager.submit('key', lambda job: 'fresh')
+    assert again is not job
+    assert again.future.result() == 'fresh'
@@ -0,0 +1,120 @@
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from news import NewsService, merge_windows
+
+SLOW_FROM = '2024-03-09'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """News API stub: one article per day of the window, a slow window and a broken ticker."""
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)
+        if params['from'] == SLOW_FROM:
+            time.sleep(1.5)
+        if params['q'] == 'BROKEN':
+            body = b'<html>Bad gateway</html>'
+        else:
+            day = datetime.date.fromisoformat(params['from'])
+            articles = []
+            while day.isoformat() <= params['to']:
+                articles.append({'title': f"{params['q']} {day}", 'url': f'https://news.test/{day}',
+                                 'publishedAt': f'{day}T12:00:00Z'})
+                day += datetime.timedelta(days=1)
+            body = json.dumps({'articles': articles}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def service(server, tmp_path):
+    service = NewsService(api_key='test', base_url=f'http://127.0.0.1:{server.server_port}/',
+                          cache_dir=str(tmp_path / 'news'), rate_limit=None)
+    yield service
+    service.executor.shutdown(wait=False)
+
+
+def spans(windows):
+    return [(start.isoformat(), end.isoformat(), len(dates)) for start, end, dates in windows]
+
+
+def test_merge_windows_dedups_and_merges_only_overlapping_dates():
+    day = datetime.date(2024, 3, 4)
+    windows = merge_windows([day, day, day + datetime.timedelta(days=1), day + datetime.timedelta(days=3)])
+    # Windows that only touch stay separate requests
+    assert spans(windows) == [('2024-03-03', '2024-03-05', 2), ('2024-03-06', '2024-03-07', 1)]
+
+
+def test_merge_windows_caps_the_span_of_a_merged_window():
+    days = [datetime.date(2024, 3, 1) + datetime.timedelta(days=i) for i in range(20)]
+    windows = merge_windows(days, max_days=7)
+    assert all((end - start).days <= 7 for start, end, _ in windows)
+    assert sorted(day for _, _, dates in windows for day in dates) == days
+
+
+def test_one_request_per_window_and_each_date_gets_its_own_articles(service, server):
+    dates = [datetime.date(2024, 3, 4), datetime.date(2024, 3, 4), datetime.date(2024, 3, 5)]
+    news = service.get_news_for_dates('ACME', dates)
+
+    assert len(server.requests) == 1
+    assert [title for title, _ in news[datetime.date(2024, 3, 4)]] == ['ACME 2024-03-03', 'ACME 2024-03-04']
+    assert [title for title, _ in news[datetime.date(2024, 3, 5)]] == ['ACME 2024-03-04', 'ACME 2024-03-05']
+
+
+def test_responses_are_cached(service, server):
+    dates = [datetime.date(2024, 3, 4)]
+    first = service.get_news_for_dates('ACME', dates)
+    second = service.get_news_for_dates('ACME', dates)
+
+    assert first == second
+    assert len(server.requests) == 1
+
+
+def test_timeout_returns_partial_results(service, server):
+    fast, slow = datetime.date(2024, 3, 1), datetime.date(2024, 3, 10)
+    started = time.perf_counter()
+    news = service.get_news_for_dates('ACME', [fast, slow], timeout=0.5)
+
+    assert time.perf_counter() - started < 1.5
+    assert news[fast]
+    assert news[slow] == []
+
+
+def test_invalid_json_is_empty_and_not_cached(service, server):
+    dates = [datetime.date(2024, 3, 4)]
+    assert service.get_news_for_dates('BROKEN', dates) == {dates[0]: []}
+    service.get_news_for_dates('BROKEN', dates)
+    assert len(server.requests) == 2
+
+
+def test_failed_cache_write_still_returns_articles(service, server, tmp_path):
+    # The cache folder turns into a file, so every write fails
+    (tmp_path / 'news').rmdir()
+    (tmp_path / 'news').write_text('')
+    news = service.get_news_for_dates('ACME', [datetime.date(2024, 3, 4)])
+    assert len(news[datetime.date(2024, 3, 4)]) == 2
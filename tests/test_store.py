@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import resample
+import store
+from store import CSVSource, OHLCVStore
+
+
+def make_bars(index, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, len(index)))
+    return pd.DataFrame({'Open': close, 'High': close + 0.05, 'Low': close - 0.05, 'Close': close,
+                         'Volume': rng.integers(100, 1_000, len(index)).astype(float)},
+                        index=pd.Index(index, name='Datetime'))
+
+
+def intraday_index(days, tz='America/New_York'):
+    sessions = [pd.date_range(f'{day} 09:30', f'{day} 15:59', freq='1min', tz=tz) for day in days]
+    return sessions[0].append(sessions[1:])
+
+
+@pytest.fixture
+def intraday_store(tmp_path, monkeypatch):
+    # Friday and Monday around the 2024 DST change, so the CSV mixes UTC offsets like Yahoo's exports
+    make_bars(intraday_index(['2024-03-08', '2024-03-11'])).to_csv(tmp_path / 'XYZ@1m.csv')
+    ohlcv_store = OHLCVStore(str(tmp_path / 'store'), CSVSource(str(tmp_path)))
+    monkeypatch.setattr(store, '_default_store', ohlcv_store)
+    return ohlcv_store
+
+
+def test_load_tz_aware_intraday_bars(intraday_store):
+    bars = intraday_store.load('XYZ', '2024-03-08', '2024-03-12', interval='1m')
+    assert len(bars) == 2 * 390
+    assert bars.index.tz is not None
+
+    monday = intraday_store.load('XYZ', '2024-03-11', '2024-03-12', interval='1m')
+    assert len(monday) == 390
+
+
+def test_resample_tz_aware_intraday_bars(intraday_store):
+    bars = resample.load_bars('XYZ', pd.Timestamp('2024-03-08'), pd.Timestamp('2024-03-12'), '5m')
+    assert len(bars) == 2 * 78
+    assert bars.index.tz is not None
+
+
+class CountingSource(CSVSource):
+    """CSVSource that records every range it is asked for."""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.calls = []
+
+    def fetch(self, ticker, start, end, interval='1d'):
+        self.calls.append((pd.Timestamp(start), pd.Timestamp(end)))
+        return super().fetch(ticker, start, end, interval)
+
+
+class EmptySource:
+    def __init__(self):
+        self.calls = 0
+
+    def fetch(self, ticker, start, end, interval='1d'):
+        self.calls += 1
+        return pd.DataFrame()
+
+
+@pytest.fixture
+def daily_source(tmp_path):
+    make_bars(pd.bdate_range('2020-01-01', '2020-12-31')).rename_axis('Date').to_csv(tmp_path / 'ABC.csv')
+    return CountingSource(str(tmp_path))
+
+
+def test_csv_source_serves_half_open_range(daily_source):
+    bars = daily_source.fetch('ABC', pd.Timestamp('2020-03-02'), pd.Timestamp('2020-03-09'))
+    assert list(bars.index.strftime('%m-%d')) == ['03-02', '03-03', '03-04', '03-05', '03-06']
+    assert daily_source.fetch('MISSING', pd.Timestamp('2020-03-02'), pd.Timestamp('2020-03-09')).empty
+
+
+def test_partial_coverage_fetches_only_the_gaps(daily_source, tmp_path):
+    ohlcv_store = OHLCVStore(str(tmp_path / 'store'), daily_source)
+    ohlcv_store.load('ABC', '2020-03-01', '2020-04-01')
+    daily_source.calls.clear()
+
+    bars = ohlcv_store.load('ABC', '2020-02-01', '2020-05-01')
+
+    assert daily_source.calls == [(pd.Timestamp('2020-02-01'), pd.Timestamp('2020-03-01')),
+                                  (pd.Timestamp('2020-04-01'), pd.Timestamp('2020-05-01'))]
+    assert bars.index.min() == pd.Timestamp('2020-02-03')
+    assert bars.index.max() == pd.Timestamp('2020-04-30')
+    assert bars.index.is_unique
+
+
+def test_repeated_load_does_not_fetch(daily_source, tmp_path):
+    ohlcv_store = OHLCVStore(str(tmp_path / 'store'), daily_source)
+    first = ohlcv_store.load('ABC', '2020-01-01', '2020-07-01')
+    daily_source.calls.clear()
+
+    # A fresh store reads the coverage from disk as well
+    for reloaded in (ohlcv_store, OHLCVStore(str(tmp_path / 'store'), daily_source)):
+        pd.testing.assert_frame_equal(reloaded.load('ABC', '2020-01-01', '2020-07-01'), first, check_freq=False)
+        pd.testing.assert_frame_equal(reloaded.load('ABC', '2020-02-01', '2020-03-01'),
+                                      first.loc['2020-02-01':'2020-02-29'], check_freq=False)
+    assert daily_source.calls == []
+
+
+def test_empty_fetches_are_retried_after_their_ttl(tmp_path, monkeypatch):
+    source = EmptySource()
+    ohlcv_store = OHLCVStore(str(tmp_path / 'store'), source)
+    assert ohlcv_store.load('ABC', '2020-01-01', '2020-02-01').empty
+    assert ohlcv_store.load('ABC', '2020-01-01', '2020-02-01').empty
+    assert source.calls == 1
+    assert ohlcv_store._read_coverage('ABC')['covered'] == []
+
+    # Once the retry time has passed, the range is asked for again
+    monkeypatch.setattr(store.time, 'time', lambda: 2**40)
+    ohlcv_store.load('ABC', '2020-01-01', '2020-02-01')
+    assert source.calls == 2
+
+
+def test_failed_fetches_are_not_recorded(daily_source, tmp_path):
+    class FailingOnce(CountingSource):
+        def fetch(self, ticker, start, end, interval='1d'):
+            if not self.calls:
+                self.calls.append(None)
+                raise store.FetchError('rate limited')
+            return super().fetch(ticker, start, end, interval)
+
+    source = FailingOnce(daily_source.directory)
+    ohlcv_store = OHLCVStore(str(tmp_path / 'store'), source)
+    with pytest.raises(store.FetchError):
+        ohlcv_store.load('ABC', '2020-01-01', '2020-02-01')
+    assert len(ohlcv_store.load('ABC', '2020-01-01', '2020-02-01')) == 23